@@ -4,9 +4,20 @@ import configparser
 import json
 import time
 import threading
+import asyncio
 import os
 from PIL import Image, ImageTk, UnidentifiedImageError
-import uuid
+import operator
+import heapq
+import bisect
+import collections
+import itertools
+import re
+import struct
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
 
 # We assume the pyk8055 module we built is installed system-wide
 try:
@@ -22,11 +33,26 @@ CONFIG_FILE = 'k8055_config.ini'
 RULES_FILENAME_TPL = "rules_board_{}.json"
 DIRECT_CONFIG_FILENAME_TPL = "direct_control_board_{}.ini"
 ICONS_DIR = 'icons'
+ICON_SIZE_BUCKETS = (16, 24, 32, 48, 64, 96, 128, 192, 256)
+ICON_CACHE_SIZE = 32
+RESIZE_DEBOUNCE_MS = 150
 APP_GEOMETRY_AUTOMATION = "800x700"
 APP_GEOMETRY_DIRECT = "700x650"
 UI_UPDATE_INTERVAL_MS = 200
-ENGINE_LOOP_DELAY_S = 0.05
+ANALOG_SLIDER_MAX_RATE_HZ = 20
+LOG_FLUSH_INTERVAL_MS = 100
+LOG_MAX_LINES = 2000
+LOG_TRIM_LINES = 200
+ENGINE_SCAN_PERIOD_S = 0.05
+MIN_SCAN_PERIOD_MS, MAX_SCAN_PERIOD_MS = 5, 10000
+ENGINE_STATS_LOG_INTERVAL_S = 60.0
 HARDWARE_POLL_INTERVAL_MS = 3000
+HOTPLUG_POLL_INTERVAL_MS = 100
+HOTPLUG_OPEN_RETRY_S = 3.0
+ENGINE_PROCESS_STOP_TIMEOUT_S = 3.0
+ENGINE_EVENT_QUEUE_SIZE = 1000
+ENGINE_IMAGE_RULE_BITS = 65536
+ENGINE_IMAGE_READ_RETRIES = 100
 
 # --- MULTI-LANGUAGE SUPPORT ---
 LANGUAGES = {
@@ -51,7 +77,12 @@ LANGUAGES = {
         'add_condition_title': "Add Condition", 'add_action_title': "Add Action", 'add_delayed_action_title': "Add Delayed Action",
         'type': "Type", 'digital_in': "Digital Input", 'analog_in': "Analog Input", 'digital_out': "Digital Output", 'analog_out': "Analog Output",
         'on': "ON", 'off': "OFF", 'action_type': "Action Type", 'set_state': "Set State", 'blink': "Blink", 'latch_on': "Latch ON",
-        'interval_sec': "Interval (s):", 'duration_sec': "Duration (s):"
+        'interval_sec': "Interval (s):", 'duration_sec': "Duration (s):",
+        'scan_period_ms': "Scan period (ms):", 'scan_cycle': "Scan Cycle",
+        'error_scan_period': "The scan period must be a whole number of milliseconds between {} and {}.",
+        'board': "Board", 'this_board': "(this board)", 'engine_process': "Run engine in its own process",
+        'filter': "Filter", 'window': "Window", 'deadband': "Deadband", 'hysteresis': "Hysteresis",
+        'counter': "Counter", 'measure': "Measure", 'window_sec': "Window (s):"
     },
     'pt': {
         'app_title': "Estúdio de Automação K8055", 'menu_config': "Configurar", 'language': "Idioma",
@@ -74,7 +105,12 @@ LANGUAGES = {
         'add_condition_title': "Adicionar Condição", 'add_action_title': "Adicionar Ação", 'add_delayed_action_title': "Adicionar Ação Atrasada",
         'type': "Tipo", 'digital_in': "Entrada Digital", 'analog_in': "Entrada Analógica", 'digital_out': "Saída Digital", 'analog_out': "Saída Analógica",
         'on': "LIGADO", 'off': "DESLIGADO", 'action_type': "Tipo de Ação", 'set_state': "Definir Estado", 'blink': "Piscar", 'latch_on': "Ligar Permanente",
-        'interval_sec': "Intervalo (s):", 'duration_sec': "Duração (s):"
+        'interval_sec': "Intervalo (s):", 'duration_sec': "Duração (s):",
+        'scan_period_ms': "Período de ciclo (ms):", 'scan_cycle': "Ciclo de Varrimento",
+        'error_scan_period': "O período de ciclo deve ser um número inteiro de milissegundos entre {} e {}.",
+        'board': "Placa", 'this_board': "(esta placa)", 'engine_process': "Executar o motor num processo próprio",
+        'filter': "Filtro", 'window': "Janela", 'deadband': "Banda morta", 'hysteresis': "Histerese",
+        'counter': "Contador", 'measure': "Medida", 'window_sec': "Janela (s):"
     },
 }
 
@@ -87,124 +123,1096 @@ class LanguageManager:
 # ... (The rest of the script remains the same as the last "final" version) ...
 # =============================================================================
 
+class OutputImage:
+    # Desired output state of one board. Changes are collected here and written by flush() as a single
+    # SetAllValues packet, and only when something actually changed since the last successful write.
+    def __init__(self): self.digital, self.analog1, self.analog2 = 0, 0, 0; self._sent = None; self.lock = threading.Lock()
+    def state(self): return self.digital, self.analog1, self.analog2
+    def flush(self, board, force=False):
+        with self.lock:
+            state = self.state()
+            if state == self._sent and not force: return False
+            board.SetAllValues(*state); self._sent = state; return True
+
+# The latest inputs of a board. version counts the reads of that board; inputs is None if the read failed.
+InputSnapshot = collections.namedtuple('InputSnapshot', 'version time inputs')
+
+class AcquisitionService(threading.Thread):
+    # Keeps one board's InputSnapshot fresh for readers that must not touch USB (the GUI). Every read of the board, the
+    # engine's included, publishes a snapshot, so this thread reads only when nobody else did for period_s: while an
+    # engine scans the board it makes no transfer of its own.
+    def __init__(self, controller, board_id, period_s):
+        super().__init__(daemon=True, name=f'k8055-acquisition{board_id}'); self.controller, self.board_id, self.period_s = controller, board_id, period_s
+        self._stop_event = threading.Event()
+    def stop(self): self._stop_event.set()
+    def run(self):
+        while True:
+            snapshot = self.controller.snapshot(self.board_id)
+            due = (snapshot.time if snapshot else 0.0) + self.period_s
+            if self._stop_event.wait(max(0.0, due - time.monotonic())): return
+            if self.controller.snapshot(self.board_id) is snapshot: self.controller.read_all_inputs(self.board_id)
+
 class K8055Controller:
-    def __init__(self, log_callback): self.log, self.boards = log_callback, {}
-    def scan_for_boards(self):
+    def __init__(self, log_callback):
+        self.log, self.boards, self.output_images = log_callback, {}, {}; self.hotplug = None; self._hotplug_retry = {}; self.lent = {}
+        self.snapshots, self._snapshot_versions = {}, {}; self.acquisition = {}; self.acquisition_period_s = None
+        # Held while a snapshot is published and while a disconnected board is dropped, so a read still in flight
+        # when its board goes cannot publish a snapshot for it afterwards
+        self._snapshot_lock = threading.Lock()
+        # Per board: how many times each counter was reset by the app, and a lock held across a read or a reset, so
+        # each reading carries the number of resets made before it
+        self.counter_resets, self._counter_locks = {}, {}
+    def start_acquisition(self, period_s):
+        # From now on every connected board has an AcquisitionService keeping its snapshot at most period_s old
+        self.acquisition_period_s = period_s
+        for board_id in self.boards: self._start_acquisition(board_id)
+    def _start_acquisition(self, board_id):
+        if self.acquisition_period_s is None or board_id in self.acquisition: return
+        service = self.acquisition[board_id] = AcquisitionService(self, board_id, self.acquisition_period_s); service.start()
+    def stop_acquisition(self):
+        self.acquisition_period_s = None
+        for service in self.acquisition.values(): service.stop()
+        for service in self.acquisition.values(): service.join()
+        self.acquisition.clear()
+    def snapshot(self, board_id): return self.snapshots.get(board_id)
+    def start_hotplug(self):
+        # Returns False where libusb has no hotplug support; callers then fall back to polling SearchDevices()
+        try:
+            if pyk8055.HotplugSupported(): self.hotplug = pyk8055.HotplugMonitor(); return True
+        except IOError as e: self.log(f"WARNING: USB hotplug unavailable ({e}). Falling back to polling.")
+        return False
+    def stop_hotplug(self):
+        if self.hotplug: self.hotplug.Close(); self.hotplug = None
+    def process_hotplug_events(self):
+        # Drains the queued arrival/removal events; True if the set of connected boards changed.
+        # A board that just arrived may not be accessible yet (udev), so its open is retried for a while.
+        events = self.hotplug.Poll() if self.hotplug else []
+        now = time.monotonic()
+        for address, arrived in events:
+            if address is not None and arrived: self._hotplug_retry[address] = now + HOTPLUG_OPEN_RETRY_S
+        self._hotplug_retry = {a: t for a, t in self._hotplug_retry.items() if t > now and a not in self.boards}
+        if not events and not self._hotplug_retry: return False
+        before = set(self.boards); self.scan_for_boards(quiet=not events)
+        return set(self.boards) != before
+    def scan_for_boards(self, quiet=False, addresses=range(4)):
         if not pyk8055: self.log("ERROR: pyk8055 module not found."); return
-        self.log("Scanning for K8055 boards..."); found_mask = pyk8055.SearchDevices()
-        for i in range(4):
+        if not quiet: self.log("Scanning for K8055 boards...")
+        found_mask = pyk8055.SearchDevices()
+        for i in addresses:
             if (found_mask >> i) & 1 and i not in self.boards:
                 try:
-                    board = pyk8055.k8055(i); board.ClearAllDigital(); board.ClearAllAnalog()
-                    self.boards[i] = board; self.log(f"SUCCESS: Connected to board {i}. Outputs reset.")
-                except IOError as e: self.log(f"ERROR: Found board at address {i}, but could not open: {e}")
+                    board = pyk8055.k8055(i); image = OutputImage(); image.flush(board, force=True)
+                    # A board that comes back may have been power cycled: to the counter totals that is a reset of both counters
+                    self.counter_resets[i] = [n + 1 for n in self.counter_resets[i]] if i in self.counter_resets else [0, 0]
+                    self._counter_locks.setdefault(i, threading.Lock())
+                    self.boards[i], self.output_images[i] = board, image; self.log(f"SUCCESS: Connected to board {i}. Outputs reset.")
+                    self._start_acquisition(i)
+                except IOError as e:
+                    if not quiet: self.log(f"ERROR: Found board at address {i}, but could not open: {e}")
         for board_id in list(self.boards.keys()):
+            if board_id in self.lent: continue   # The engine process that has it notices a disconnect itself
             if not ((found_mask >> board_id) & 1):
-                self.log(f"WARNING: Board {board_id} disconnected."); del self.boards[board_id]
-    def get_board(self, board_id): return self.boards.get(board_id)
+                self.log(f"WARNING: Board {board_id} disconnected.")
+                with self._snapshot_lock: board = self.boards.pop(board_id); self.output_images.pop(board_id, None); self.snapshots.pop(board_id, None)
+                service = self.acquisition.pop(board_id, None)
+                if service: service.stop()
+                # Release the stale handle, otherwise a reconnected board would be handed the dead one
+                try: board.CloseDevice()
+                except IOError: pass
+    def lend_boards(self, board_ids, engine_image):
+        # Hands the USB devices of board_ids over to an engine process: their handles are closed here and, until
+        # reclaim_boards(), their inputs and outputs are read from the engine's shared image instead of the board
+        for board_id in board_ids:
+            board = self.boards.get(board_id)
+            if board is None: continue
+            try: board.CloseDevice()
+            except IOError: pass
+            self.lent[board_id] = engine_image
+    def reclaim_boards(self, board_ids):
+        for board_id in board_ids:
+            if self.lent.pop(board_id, None) is None: continue
+            with self._snapshot_lock: self.boards.pop(board_id, None); self.output_images.pop(board_id, None); self.snapshots.pop(board_id, None)
+        self.scan_for_boards(quiet=True)
+    def get_board(self, board_id): return None if board_id in self.lent else self.boards.get(board_id)
+    def get_outputs(self, board_id):
+        if board_id in self.lent:
+            state = self.lent[board_id].read_board(board_id)
+            return (state['digital_out'], state['analog_out1'], state['analog_out2']) if state else (0, 0, 0)
+        image = self.output_images.get(board_id)
+        return image.state() if image else (0, 0, 0)
+    def set_outputs(self, board_id, digital, analog1, analog2):
+        image = self.output_images.get(board_id)
+        if not image: return
+        with image.lock: image.digital, image.analog1, image.analog2 = digital & 0xFF, analog1, analog2
+    def set_digital_channel(self, board_id, channel, state):
+        image = self.output_images.get(board_id)
+        if not image: return
+        with image.lock: image.digital = (image.digital | (1 << (channel - 1))) if state else (image.digital & ~(1 << (channel - 1)))
+    def set_analog_channel(self, board_id, channel, value):
+        image = self.output_images.get(board_id)
+        if not image: return
+        with image.lock:
+            if channel == 1: image.analog1 = value
+            else: image.analog2 = value
+    def flush_outputs(self, board_id, force=False):
+        # Raises IOError if the write fails; the image stays dirty so the next flush retries it
+        board, image = self.get_board(board_id), self.output_images.get(board_id)
+        if not board or not image: return False
+        return image.flush(board, force)
     def get_connected_board_ids(self): return sorted(self.boards.keys())
-    def read_all_inputs(self, board_id):
+    def read_all_inputs(self, board_id, max_age_ms=0):
+        # Whoever reads, the result is published as the board's latest InputSnapshot; a board that is not (or no
+        # longer) connected gets none
+        inputs = self._read_inputs(board_id, max_age_ms)
+        with self._snapshot_lock:
+            if board_id not in self.boards: return inputs
+            versions = self._snapshot_versions.get(board_id) or self._snapshot_versions.setdefault(board_id, itertools.count(1))
+            self.snapshots[board_id] = InputSnapshot(next(versions), time.monotonic(), inputs)
+        return inputs
+    def _read_inputs(self, board_id, max_age_ms):
+        if board_id in self.lent:
+            state = self.lent[board_id].read_board(board_id)
+            return {key: state[key] for key in ("digital", "analog1", "analog2", "counter1", "counter2")} if state else None
         board = self.get_board(board_id);
         if not board: return None
         try:
-            values = board.ReadAllValues()
-            return {"digital": values[1], "analog1": values[2], "analog2": values[3], "counter1": values[4], "counter2": values[5]}
+            with self._counter_locks[board_id]: snap = board.ReadSnapshot(max_age_ms); resets1, resets2 = self.counter_resets[board_id]
+            return {"digital": snap.digital, "analog1": snap.analog1, "analog2": snap.analog2, "counter1": snap.counter1, "counter2": snap.counter2,
+                    "timestamp": snap.timestamp, "resets1": resets1, "resets2": resets2}
         except Exception: return None
+    def reset_counter(self, board_id, counter):
+        # Resets counter 1 or 2 of board_id, counted so the engines' counter totals carry on across it; raises IOError if it fails
+        board = self.get_board(board_id)
+        if not board: return False
+        with self._counter_locks[board_id]: board.ResetCounter(counter); self.counter_resets[board_id][counter - 1] += 1
+        return True
+
+class AsyncK8055Controller:
+    # asyncio face of a K8055Controller. The USB transfers of each board run on a single-worker executor of that board,
+    # so the transfers of one board stay in order, those of different boards overlap and the event loop never blocks
+    # on USB. The calls that do no transfer (output images, board lookups) go straight to the controller.
+    def __init__(self, controller): self.controller, self.log = controller, controller.log; self._executors = {}
+    def _executor(self, board_id):
+        executor = self._executors.get(board_id)
+        if executor is None: executor = self._executors[board_id] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'k8055-usb{board_id}')
+        return executor
+    async def read_all_inputs(self, board_id, max_age_ms=0):
+        return await asyncio.get_running_loop().run_in_executor(self._executor(board_id), self.controller.read_all_inputs, board_id, max_age_ms)
+    async def reset_counter(self, board_id, counter):
+        return await asyncio.get_running_loop().run_in_executor(self._executor(board_id), self.controller.reset_counter, board_id, counter)
+    async def flush_outputs(self, board_id, force=False):
+        # Raises IOError like K8055Controller.flush_outputs()
+        return await asyncio.get_running_loop().run_in_executor(self._executor(board_id), self.controller.flush_outputs, board_id, force)
+    async def scan_for_boards(self, quiet=False, addresses=range(4)):
+        # Opening a board can take a while, so this too runs off the loop (on its default executor)
+        await asyncio.get_running_loop().run_in_executor(None, self.controller.scan_for_boards, quiet, addresses)
+    def get_board(self, board_id): return self.controller.get_board(board_id)
+    def get_connected_board_ids(self): return self.controller.get_connected_board_ids()
+    def get_outputs(self, board_id): return self.controller.get_outputs(board_id)
+    def set_outputs(self, board_id, digital, analog1, analog2): self.controller.set_outputs(board_id, digital, analog1, analog2)
+    def set_digital_channel(self, board_id, channel, state): self.controller.set_digital_channel(board_id, channel, state)
+    def set_analog_channel(self, board_id, channel, value): self.controller.set_analog_channel(board_id, channel, value)
+    def close(self):
+        for executor in self._executors.values(): executor.shutdown(wait=False)
+        self._executors.clear()
+
+# --- INPUT CONDITIONING ---
+# Between read_all_inputs() and the rules, an analog input can be filtered and given a deadband, and an analog
+# condition can have hysteresis, all set per condition in the rules JSON:
+#   {"type": "analog_in", "port": 1, "operator": ">", "value": 128,
+#    "filter": {"type": "moving_average" or "median", "window": 8} or {"type": "ema", "alpha": 0.2} (or "window": 8),
+#    "deadband": 2, "hysteresis": 5}
+# Every filter, deadband and hysteresis comparator is a derived signal, worked out once per scan in O(1) per sample
+# and appended to the analog values the rules read. Derived signals go through the same change tracking as the
+# inputs, so a noisy input whose conditioned value holds still re-evaluates no rule, writes nothing and logs nothing.
+# The board counters are conditioned the same way, for "counter" conditions:
+#   {"type": "counter", "port": 1, "measure": "count", "rate" (pulses/min) or "frequency" (Hz), "window": 1.0,
+#    "scale": 1, "operator": ">", "value": 100}
+# "count" is the counter extended to 64 bits across its 16-bit wraparound and the resets the app makes
+# (K8055Controller.reset_counter(), or the board reconnecting); it carries over a rule swap. Rate and frequency are
+# taken over the last window seconds of input packet timestamps. scale multiplies the measure (e.g. litres per pulse).
+FILTER_MAX_WINDOW = 64
+COUNTER_RATE_WINDOW_S = 1.0
+
+class MovingAverage:
+    def __init__(self, window): self.ring = [0] * window; self.pos = self.count = self.total = 0
+    def __call__(self, x):
+        if self.count == len(self.ring): self.total -= self.ring[self.pos]
+        else: self.count += 1
+        self.ring[self.pos] = x; self.total += x; self.pos = (self.pos + 1) % len(self.ring)
+        return self.total / self.count
+
+class ExponentialAverage:
+    def __init__(self, alpha): self.alpha = alpha; self.value = None
+    def __call__(self, x):
+        self.value = x if self.value is None else self.value + self.alpha * (x - self.value); return self.value
+
+class MovingMedian:
+    # The ring buffer's samples are also kept sorted; bisect finds the one to drop and the slot of the new one,
+    # and the list shifts are bounded by FILTER_MAX_WINDOW
+    def __init__(self, window): self.ring = [None] * window; self.sorted = []; self.pos = 0
+    def __call__(self, x):
+        old = self.ring[self.pos]
+        if old is not None: del self.sorted[bisect.bisect_left(self.sorted, old)]
+        bisect.insort(self.sorted, x); self.ring[self.pos] = x; self.pos = (self.pos + 1) % len(self.ring)
+        n = len(self.sorted); return self.sorted[n // 2] if n % 2 else (self.sorted[n // 2 - 1] + self.sorted[n // 2]) / 2
+
+class Deadband:
+    # Holds its output until the input moves more than band away from it
+    def __init__(self, band): self.band = band; self.value = None
+    def __call__(self, x):
+        if self.value is None or abs(x - self.value) > self.band: self.value = x
+        return self.value
+
+class CounterExtender:
+    # 64-bit total of a 16-bit board counter, fed the raw counter and the number of resets made before it was read.
+    # A raw value below the last one is a wrap past 0xFFFF; after a reset the counter counted up from 0 to raw.
+    def __init__(self): self.last = self.resets = None; self.total = 0
+    def __call__(self, raw, resets):
+        if self.last is None: self.total = raw
+        else: self.total = (self.total + (raw if resets != self.resets else (raw - self.last) & 0xFFFF)) & 0xFFFFFFFFFFFFFFFF
+        self.last, self.resets = raw, resets; return self.total
+
+class CounterRate:
+    # Pulses per second over the last window seconds: the samples are (timestamp, total) pairs and the oldest one
+    # kept is the last at or before the window start, so each sample is appended and dropped once
+    def __init__(self, window, scale): self.window, self.scale = window, scale; self.samples = collections.deque()
+    def __call__(self, total, t):
+        samples = self.samples; samples.append((t, total)); start = t - self.window
+        while len(samples) > 2 and samples[1][0] <= start: samples.popleft()
+        t0, total0 = samples[0]
+        return (total - total0) / (t - t0) * self.scale if t > t0 else 0.0
+
+class HysteresisComparator:
+    # Analog condition with a Schmitt trigger: once true, '>' stays true down to value - band, '<' up to
+    # value + band and '==' within value +/- band. Outputs 1 or 0.
+    def __init__(self, op, value, band): self.op, self.value, self.band = op, value, band; self.state = 0
+    def __call__(self, x):
+        band = self.band if self.state else 0
+        if self.op == ">": self.state = int(x > self.value - band)
+        elif self.op == "<": self.state = int(x < self.value + band)
+        else: self.state = int(abs(x - self.value) <= band)
+        return self.state
+
+def make_filter(spec):
+    # (key, factory) of the filter a condition's "filter" entry describes; identical keys share one filter
+    if not isinstance(spec, dict): raise ValueError(f"filter must be an object, got {spec!r}")
+    kind = spec.get("type")
+    def window():
+        window = spec.get("window")
+        if isinstance(window, bool) or not isinstance(window, int) or not 1 <= window <= FILTER_MAX_WINDOW: raise ValueError(f"{kind} window {window!r} must be 1-{FILTER_MAX_WINDOW}")
+        return window
+    if kind in ("moving_average", "median"):
+        size = window()
+        return (kind, size), (lambda: MovingAverage(size)) if kind == "moving_average" else (lambda: MovingMedian(size))
+    if kind == "ema":
+        # An alpha, or a window taken as the span of an equivalent moving average
+        if "alpha" in spec: alpha = spec["alpha"]
+        elif "window" in spec: alpha = 2 / (window() + 1)
+        else: raise ValueError("ema needs an alpha or a window")
+        if isinstance(alpha, bool) or not isinstance(alpha, (int, float)) or not 0 < alpha <= 1: raise ValueError(f"ema alpha {alpha!r} must be in (0, 1]")
+        return (kind, alpha), lambda: ExponentialAverage(alpha)
+    raise ValueError(f"unknown filter type {kind!r}")
+
+class InputConditioning:
+    # The derived signals of one engine's rules. The values of a scan of n boards are the 2n analog inputs, the 2n
+    # counters, the n input timestamps and the 2n counter reset counts (board slot order), followed by one value per
+    # stage. A stage is fed by an earlier value (and a second one: the reset count for counters, a timestamp for
+    # rates), so update() is a single pass in stage order. counters, the counter_stages() of the conditioning this one
+    # replaces, hands their totals over.
+    def __init__(self, boards, counters=None):
+        self.boards = boards; self.raw_count = 7 * boards; self._stages = []; self._keys = {}; self._carried = counters or {}
+    def __len__(self): return self.raw_count + len(self._stages)
+    def _stage(self, key, source, factory, extra=None):
+        index = self._keys.get(key)
+        if index is None: index = self._keys[key] = len(self); self._stages.append((source, extra, factory()))
+        return index
+    def counter_stages(self): return {key: self._stages[index - self.raw_count][2] for key, index in self._keys.items() if key[0] == 'counter'}
+    def counter(self, slot, channel, measure, window, scale):
+        # Index of a counter measure of board slot's counter channel (0 or 1)
+        if measure not in ("count", "rate", "frequency"): raise ValueError(f"unknown counter measure {measure!r}")
+        if isinstance(scale, bool) or not isinstance(scale, (int, float)): raise ValueError(f"counter scale {scale!r} must be a number")
+        key = ('counter', slot, channel)
+        index = self._stage(key, 2 * self.boards + 2 * slot + channel, lambda: self._carried.get(key) or CounterExtender(), 5 * self.boards + 2 * slot + channel)
+        if measure == "count":
+            if scale == 1: return index
+            return self._stage(('scale', index, scale), index, lambda: (lambda total: total * scale))
+        if not window > 0: raise ValueError(f"counter window {window!r} must be positive")
+        scale = scale * 60 if measure == "rate" else scale
+        return self._stage(('rate', index, window, scale), index, lambda: CounterRate(window, scale), 4 * self.boards + slot)
+    def signal(self, source, cond):
+        # Index of the value an analog condition on input index source compares: the input, or its conditioned signal
+        if cond.get("filter"):
+            key, factory = make_filter(cond["filter"]); source = self._stage(('filter', source) + key, source, factory)
+        band = cond.get("deadband", 0)
+        if band:
+            if not band > 0: raise ValueError(f"deadband {band!r} must be positive")
+            source = self._stage(('deadband', source, band), source, lambda: Deadband(band))
+        return source
+    def comparator(self, source, op, value, band):
+        if not band > 0: raise ValueError(f"hysteresis {band!r} must be positive")
+        return self._stage(('hysteresis', source, op, value, band), source, lambda: HysteresisComparator(op, value, band))
+    def update(self, states, now):
+        # The values of the scan that read the per-board input states; now stands in for a missing packet timestamp
+        values = [value for inputs in states for value in (inputs['analog1'], inputs['analog2'])]
+        values += [value for inputs in states for value in (inputs['counter1'], inputs['counter2'])]
+        values += [inputs.get('timestamp') or now for inputs in states]
+        values += [value for inputs in states for value in (inputs.get('resets1', 0), inputs.get('resets2', 0))]
+        for source, extra, stage in self._stages: values.append(stage(values[source]) if extra is None else stage(values[source], values[extra]))
+        return tuple(values)
+
+# --- RULE COMPILER ---
+# Rules are compiled once, when the engine is created, into closures that only do the logic:
+# no dict lookups on the rule definition, no string compares and no key building during a scan.
+# All digital conditions of a rule are folded into bit masks over one scan word holding, for every
+# board the engine scans, its 5 digital inputs and 8 digital outputs in a BOARD_WORD_BITS wide slot
+# (board slot k: inputs at bits 13k-13k+4, outputs at 13k+5-13k+12), so an AND rule's digital part
+# is one `word & mask == want` test and an OR rule's one `&` test, however many conditions.
+DIGITAL_OUT_SHIFT = 5
+BOARD_WORD_BITS = DIGITAL_OUT_SHIFT + 8
+CANDIDATE_CACHE_SIZE = 64
+RULE_ORDER = operator.attrgetter('pos')
+# A condition or action may address another board with a 'board' key, or with a 'ref' such as "board:1/digital_in:3"
+IO_REF_PATTERN = re.compile(r'^board:([0-3])/(digital_in|analog_in|digital_out|analog_out|counter):(\d+)$')
+
+def io_address(item, default_board, port_key):
+    # (board, type, port) of a condition (port_key 'port') or action (port_key 'output')
+    ref = item.get('ref')
+    if ref is None: return item.get('board', default_board), item.get('type', ''), item.get(port_key)
+    match = IO_REF_PATTERN.match(ref)
+    if not match: raise ValueError(f"invalid I/O reference {ref!r}")
+    return int(match.group(1)), match.group(2), int(match.group(3))
 
-class AutomationEngine(threading.Thread):
-    def __init__(self, controller, board_id, rules, log_callback):
-        super().__init__(daemon=True); self.controller, self.board_id, self.log = controller, board_id, log_callback
+class CompiledRule:
+    __slots__ = ('id', 'pos', 'name', 'check', 'digital_only', 'mask', 'want', 'flip', 'any_mask', 'reads_bits', 'reads_analog', 'apply', 'blinks', 'delayed', 'boards')
+    def __init__(self, rule_id, name, conditions, apply, blinks, delayed, boards=frozenset()):
+        self.id, self.name, self.apply, self.blinks, self.delayed, self.boards = rule_id, name, apply, blinks, delayed, boards   # boards: the ids it reads or writes
+        self.check, self.digital_only, self.mask, self.want, self.flip, self.any_mask, self.reads_bits, self.reads_analog = conditions; self.pos = None
+
+def compile_analog_condition(cond, slot, port, conditioning):
+    if port not in (1, 2): raise ValueError(f"analog_in port {port} out of range")
+    return compile_comparison(cond, slot * 2 + port - 1, conditioning)
+
+def compile_counter_condition(cond, slot, port, conditioning):
+    if port not in (1, 2): raise ValueError(f"counter port {port} out of range")
+    return compile_comparison(cond, conditioning.counter(slot, port - 1, cond.get("measure", "count"), cond.get("window", COUNTER_RATE_WINDOW_S), cond.get("scale", 1)), conditioning)
+
+def compile_comparison(cond, index, conditioning):
+    # (predicate over the scan's values, index of the value it reads) for cond's operator and value applied to value
+    # index, or None for a condition the engine ignores (unknown operator). Filter, deadband and hysteresis become
+    # signals of conditioning.
+    op, value = cond["operator"], cond["value"]
+    if op not in (">", "<", "=="): return None
+    index = conditioning.signal(index, cond)
+    if cond.get("hysteresis", 0):
+        index = conditioning.comparator(index, op, value, cond["hysteresis"]); return (lambda values: values[index] == 1), index
+    if op == ">": return (lambda values: values[index] > value), index
+    if op == "<": return (lambda values: values[index] < value), index
+    return (lambda values: values[index] == value), index
+
+def compile_conditions(conditions, logic, resolve, conditioning):
+    # Returns (check(word, values), digital_only, mask, want, flip, any_mask, reads_bits, reads_analog).
+    # A word for which the rule can be true satisfies word & mask == want and, if any_mask is set,
+    # (word ^ flip) & any_mask != 0; for digital_only rules that test is the whole rule. reads_bits
+    # and reads_analog (indexes into the values of conditioning: analog inputs, counters and derived signals)
+    # are what the rule depends on.
+    # resolve(item, port_key) gives the (board slot, type, port) a condition addresses.
+    must_1 = must_0 = 0; impossible = False; analog = []; ports = set()
+    for cond in conditions:
+        slot, cond_type, port = resolve(cond, "port")
+        if cond_type in ("digital_in", "digital_out"):
+            shift = slot * BOARD_WORD_BITS + (0 if cond_type == "digital_in" else DIGITAL_OUT_SHIFT)
+            if not 1 <= port <= (5 if cond_type == "digital_in" else 8): raise ValueError(f"{cond_type} port {port} out of range")
+            if cond["state"] == 1: must_1 |= 1 << (port - 1 + shift)
+            elif cond["state"] == 0: must_0 |= 1 << (port - 1 + shift)
+            else: impossible = True   # Such a condition is never true
+        elif cond_type in ("analog_in", "counter"):
+            compiled = (compile_analog_condition if cond_type == "analog_in" else compile_counter_condition)(cond, slot, port, conditioning)
+            if compiled is not None: analog.append(compiled[0]); ports.add(compiled[1])
+    return compile_condition_logic(logic, must_1, must_0, impossible, analog) + (must_1 | must_0, tuple(sorted(ports)))
+
+def compile_condition_logic(logic, must_1, must_0, impossible, analog):
+    never = (lambda word, state: False), True, 0, 1, 0, 0
+    if logic.upper() == "OR":
+        digital_mask = must_1 | must_0
+        if must_1 & must_0: return (lambda word, state: True), True, 0, 0, 0, 0   # Some bit is always either 1 or 0
+        if not analog:
+            if not digital_mask: return never
+            return (lambda word, state: (word ^ must_0) & digital_mask != 0), True, 0, 0, must_0, digital_mask
+        def any_true(word, state):
+            if (word ^ must_0) & digital_mask: return True
+            for check in analog:
+                if check(state): return True
+            return False
+        return any_true, False, 0, 0, 0, 0
+    if impossible or must_1 & must_0 or not (must_1 or must_0 or analog): return never
+    mask = must_1 | must_0
+    if not analog: return (lambda word, state: word & mask == must_1), True, mask, must_1, 0, 0
+    def all_true(word, state):
+        if word & mask != must_1: return False
+        for check in analog:
+            if not check(state): return False
+        return True
+    return all_true, False, mask, must_1, 0, 0
+
+class DeadlineScheduler:
+    # Min-heap of (deadline, id, payload) on the time.monotonic() clock. Only due entries are touched, so n pending
+    # entries cost O(log n) per schedule/pop instead of a walk per scan. Cancelled entries are dropped when they surface.
+    def __init__(self): self._heap = []; self._ids = itertools.count(1); self._cancelled = set()
+    def __len__(self): return len(self._heap) - len(self._cancelled)
+    def schedule(self, deadline, payload):
+        entry_id = next(self._ids); heapq.heappush(self._heap, (deadline, entry_id, payload)); return entry_id
+    def cancel(self, entry_id): self._cancelled.add(entry_id)
+    def pop_due(self, now):
+        # Yields the due (deadline, id, payload) entries, earliest first; entries may be cancelled while iterating
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if entry[1] in self._cancelled: self._cancelled.discard(entry[1])
+            else: yield entry
+    def next_deadline(self):
+        while self._heap and self._heap[0][1] in self._cancelled: self._cancelled.discard(heapq.heappop(self._heap)[1])
+        return self._heap[0][0] if self._heap else None
+
+class LoopScheduler:
+    # DeadlineScheduler for an asyncio engine: each entry is a loop callback that, at its deadline, moves the entry to
+    # the due heap and calls on_due() (which wakes the engine), so nothing polls for timers. Deadlines are time.monotonic()
+    # values like DeadlineScheduler's. Must be used from the thread running the event loop.
+    def __init__(self, on_due): self.on_due = on_due; self._handles = {}; self._due = []; self._ids = itertools.count(1)
+    def __len__(self): return len(self._handles) + len(self._due)
+    def schedule(self, deadline, payload):
+        entry_id = next(self._ids); entry = (deadline, entry_id, payload)
+        self._handles[entry_id] = asyncio.get_running_loop().call_later(max(0.0, deadline - time.monotonic()), self._fire, entry); return entry_id
+    def _fire(self, entry): del self._handles[entry[1]]; heapq.heappush(self._due, entry); self.on_due()
+    def cancel(self, entry_id):
+        handle = self._handles.pop(entry_id, None)
+        if handle is not None: handle.cancel()
+        elif any(entry[1] == entry_id for entry in self._due): self._due = [e for e in self._due if e[1] != entry_id]; heapq.heapify(self._due)
+    def clear(self):
+        for handle in self._handles.values(): handle.cancel()
+        self._handles.clear(); self._due.clear()
+    def pop_due(self, now):
+        while self._due and self._due[0][0] <= now: yield heapq.heappop(self._due)
+    def next_deadline(self):
+        # Only entries whose callback has run count; the pending ones wake the engine when they are due
+        return self._due[0][0] if self._due else None
+
+class ScanStatistics:
+    # Cycle-time figures of a fixed-rate engine; written by the engine thread, read by the GUI
+    def __init__(self, period_s): self.period_s = period_s; self.lock = threading.Lock(); self.reset()
+    def reset(self):
+        with self.lock:
+            self.cycles = self.overruns = self.skipped = 0
+            self.last_scan_s = self.max_scan_s = self.total_scan_s = 0.0; self.min_scan_s = None
+            self.last_jitter_s = self.max_jitter_s = self.total_jitter_s = 0.0
+    def record(self, scan_s, jitter_s, overrun, skipped):
+        # jitter_s is how late the cycle started after its deadline
+        with self.lock:
+            self.cycles += 1; self.overruns += overrun; self.skipped += skipped
+            self.last_scan_s = scan_s; self.total_scan_s += scan_s; self.max_scan_s = max(self.max_scan_s, scan_s)
+            self.min_scan_s = scan_s if self.min_scan_s is None else min(self.min_scan_s, scan_s)
+            self.last_jitter_s = jitter_s; self.total_jitter_s += jitter_s; self.max_jitter_s = max(self.max_jitter_s, jitter_s)
+    def snapshot(self):
+        with self.lock:
+            n = self.cycles or 1
+            return {'period_ms': self.period_s * 1000, 'cycles': self.cycles, 'overruns': self.overruns, 'skipped': self.skipped,
+                    'last_scan_ms': self.last_scan_s * 1000, 'min_scan_ms': (self.min_scan_s or 0.0) * 1000, 'avg_scan_ms': self.total_scan_s / n * 1000, 'max_scan_ms': self.max_scan_s * 1000,
+                    'last_jitter_ms': self.last_jitter_s * 1000, 'avg_jitter_ms': self.total_jitter_s / n * 1000, 'max_jitter_ms': self.max_jitter_s * 1000}
+    def summary(self): return self.format_summary(self.snapshot())
+    @staticmethod
+    def format_summary(s):
+        return (f"period {s['period_ms']:g} ms | scan last {s['last_scan_ms']:.2f} / avg {s['avg_scan_ms']:.2f} / max {s['max_scan_ms']:.2f} ms | "
+                f"jitter avg {s['avg_jitter_ms']:.2f} / max {s['max_jitter_ms']:.2f} ms | cycles {s['cycles']} | overruns {s['overruns']} | skipped {s['skipped']}")
+
+class EngineImage:
+    # Input, output, timer, rule-state and cycle-time image of an engine process in a multiprocessing.shared_memory
+    # block, guarded by a seqlock: the engine, the only writer, makes the sequence number odd while it writes and even
+    # again when done; a reader retries until it copied the block between two equal, even sequence numbers. The
+    # writer never waits for a reader.
+    SEQ = struct.Struct('=Q')
+    HEADER = struct.Struct('=Qiiiii')   # scans, state, boards, pending timers, blinking outputs, rules
+    STATS = struct.Struct('=QQQ8d')     # the ScanStatistics.snapshot() values
+    BOARD = struct.Struct('=iiiiqqiii') # board id, digital in, analog in 1/2, counter 1/2, digital out, analog out 1/2
+    MAX_BOARDS = 4
+    STATE_STARTING, STATE_RUNNING, STATE_STOPPED = 0, 1, 2
+    STATS_KEYS = ('cycles', 'overruns', 'skipped', 'period_ms', 'last_scan_ms', 'min_scan_ms', 'avg_scan_ms', 'max_scan_ms', 'last_jitter_ms', 'avg_jitter_ms', 'max_jitter_ms')
+    BOARD_KEYS = ('digital', 'analog1', 'analog2', 'counter1', 'counter2', 'digital_out', 'analog_out1', 'analog_out2')
+    HEADER_AT = SEQ.size; STATS_AT = HEADER_AT + HEADER.size; BOARDS_AT = STATS_AT + STATS.size
+    RULES_AT = BOARDS_AT + MAX_BOARDS * BOARD.size; SIZE = RULES_AT + ENGINE_IMAGE_RULE_BITS // 8
+    def __init__(self, name=None, board_ids=()):
+        # Without a name a new block is created (and the board ids written into it), with a name an existing one is attached
+        if name is None: self._shm = shared_memory.SharedMemory(create=True, size=self.SIZE)
+        else: self._shm = shared_memory.SharedMemory(name=name)
+        self.name = self._shm.name; self._buf = self._shm.buf; self._seq = self.SEQ.unpack_from(self._buf, 0)[0]; self._rules_version = None; self._scans = 0
+        if name is None:
+            for slot, board_id in enumerate(board_ids): self.BOARD.pack_into(self._buf, self.BOARDS_AT + slot * self.BOARD.size, board_id, 0, 0, 0, 0, 0, 0, 0, 0)
+            self.HEADER.pack_into(self._buf, self.HEADER_AT, 0, self.STATE_STARTING, len(board_ids), 0, 0, 0)
+    def close(self): self._buf = None; self._shm.close()
+    def unlink(self): self._shm.unlink()
+    def _begin(self): self._seq += 1; self.SEQ.pack_into(self._buf, 0, self._seq)
+    def _end(self): self._seq += 1; self.SEQ.pack_into(self._buf, 0, self._seq)
+    def publish(self, engine):
+        # Called by the engine after each scan
+        buf = self._buf; self._scans += 1; self._begin()
+        self.HEADER.pack_into(buf, self.HEADER_AT, self._scans, self.STATE_RUNNING, len(engine.board_ids), len(engine.scheduler), len(engine.blinking_outputs), len(engine.compiled_rules))
+        stats = engine.stats.snapshot(); self.STATS.pack_into(buf, self.STATS_AT, *[stats[key] for key in self.STATS_KEYS])
+        digital, analog = engine._forced(engine._last_outputs)
+        for slot, (board_id, inputs) in enumerate(zip(engine.board_ids, engine._last_states)):
+            self.BOARD.pack_into(buf, self.BOARDS_AT + slot * self.BOARD.size, board_id, inputs['digital'], inputs['analog1'], inputs['analog2'],
+                                 inputs['counter1'], inputs['counter2'], digital >> 8 * slot & 0xFF, analog[2 * slot], analog[2 * slot + 1])
+        if engine._truth_version != self._rules_version:
+            # Bit n set: the rule with id n was true in the last scan (ids beyond ENGINE_IMAGE_RULE_BITS are not published)
+            bits = 0
+            for rule in engine._true_rules:
+                if rule.id < ENGINE_IMAGE_RULE_BITS: bits |= 1 << rule.id
+            buf[self.RULES_AT:self.SIZE] = bits.to_bytes(ENGINE_IMAGE_RULE_BITS // 8, 'little'); self._rules_version = engine._truth_version
+        self._end()
+    def mark_stopped(self):
+        self._begin(); header = list(self.HEADER.unpack_from(self._buf, self.HEADER_AT)); header[1] = self.STATE_STOPPED
+        self.HEADER.pack_into(self._buf, self.HEADER_AT, *header); self._end()
+    def read(self, with_rules=False):
+        # A consistent copy of the image as a dict, or None if every retry overlapped a write
+        buf = self._buf; end = self.SIZE if with_rules else self.RULES_AT
+        for _ in range(ENGINE_IMAGE_READ_RETRIES):
+            seq = self.SEQ.unpack_from(buf, 0)[0]
+            if seq & 1: time.sleep(0); continue
+            data = bytes(buf[:end])
+            if self.SEQ.unpack_from(buf, 0)[0] == seq: break
+        else: return None
+        scans, state, boards, timers, blinking, rules = self.HEADER.unpack_from(data, self.HEADER_AT)
+        image = {'scans': scans, 'state': state, 'pending_timers': timers, 'blinking_outputs': blinking, 'rules': rules,
+                 'stats': dict(zip(self.STATS_KEYS, self.STATS.unpack_from(data, self.STATS_AT))), 'boards': {}}
+        for slot in range(min(boards, self.MAX_BOARDS)):
+            values = self.BOARD.unpack_from(data, self.BOARDS_AT + slot * self.BOARD.size); image['boards'][values[0]] = dict(zip(self.BOARD_KEYS, values[1:]))
+        if with_rules:
+            bits = int.from_bytes(data[self.RULES_AT:], 'little'); image['true_rules'] = set()
+            while bits: low = bits & -bits; image['true_rules'].add(low.bit_length() - 1); bits ^= low
+        return image
+    def read_board(self, board_id):
+        image = self.read()
+        return image['boards'].get(board_id) if image else None
+
+# The inputs of a board that is offline and was never read; one read before keeps its last inputs while offline
+OFFLINE_INPUTS = {'digital': 0, 'analog1': 0, 'analog2': 0, 'counter1': 0, 'counter2': 0}
+
+class EngineCore:
+    # An automation engine without its loop and its USB I/O: compiled rules, timers, outputs, overrides, commands and
+    # cycle statistics. AutomationEngine runs it in a thread, AsyncAutomationEngine as a coroutine on an event loop.
+    # Scans one board or several boards in the same cycle. Rules and their conditions and actions address the
+    # first board of board_ids unless they name another one (rule, condition or action 'board' key, or 'ref').
+    def __init__(self, controller, board_ids, rules, log_callback, scan_period_s=ENGINE_SCAN_PERIOD_S, scheduler=None):
+        self.controller, self.log = controller, log_callback
+        self.board_ids = [board_ids] if isinstance(board_ids, int) else list(dict.fromkeys(board_ids))
+        if not self.board_ids: raise ValueError("The engine needs at least one board")
+        self.board_id = self.board_ids[0]; self._slots = {board_id: slot for slot, board_id in enumerate(self.board_ids)}
+        self.label = f"Board {self.board_id}" if len(self.board_ids) == 1 else f"Boards {', '.join(map(str, self.board_ids))}"
+        if not scan_period_s > 0: raise ValueError(f"Scan period must be positive, got {scan_period_s!r}")
+        self.scan_period_s = scan_period_s; self.stats = ScanStatistics(scan_period_s)
+        self.scheduler = DeadlineScheduler() if scheduler is None else scheduler; self.blinking_outputs = {}; self._blink_mask = 0
+        self.latched_outputs = 0   # Same layout as the digital outputs: 8 bits per board slot
+        # Manual overrides: forced digital outputs (mask and values, same layout) and forced analog outputs by index
+        self._force_mask = self._force_value = 0; self._forced_analog = {}
+        # Commands are handled by the engine between scans; in an engine process they also arrive over command_pipe.
+        # after_scan(engine), if set, is called after every successful scan.
+        self._commands = queue.SimpleQueue(); self.command_pipe = None; self.after_scan = None
+        self._truth_version = 0; self._last_states = None
+        # Boards the controller lost, and boards offline (lost or failed their read) with the ids of the rules suspended for them
+        self._lost = set(); self._offline = set(); self.suspended_rules = set()
+        # The outputs the rules set in the last scan, before the overrides: (digital outputs, 8 bits per slot; analog outputs, 2 per slot)
+        self._last_outputs = (0, (0,) * (2 * len(self.board_ids)))
+        self.load_rules(rules)
+    def load_rules(self, rules, silent_edges=False):
+        # Compiles the rules and starts their states afresh. With silent_edges (a rule swap while running) the rules
+        # found true in the first scan are taken as they are instead of firing their rising-edge actions.
         self.rules = [dict(r, **{'id': i}) for i, r in enumerate(rules)]
-        self._is_running = threading.Event(); self.active_timers = {}; self.blinking_outputs = {}
-        self.triggered_rules = set(); self.latched_outputs = 0
-        self.last_output_state = {"digital_out": 0, "analog_out1": 0, "analog_out2": 0}
-    def stop(self): self._is_running.clear()
+        # Filters and hysteresis start afresh too, from the first scan's samples; counter totals carry on
+        old = getattr(self, 'conditioning', None)
+        self.conditioning = InputConditioning(len(self.board_ids), old.counter_stages() if old else None)
+        self._all_rules = self._compile_rules(self.rules)
+        for pos, rule in enumerate(self._all_rules): rule.pos = pos
+        self._true_set = set(); self._true_rules = []; self._truth_version += 1; self._silent_edges = silent_edges; self._resumed = set()
+        self._activate_rules()
+    def _activate_rules(self):
+        # The rules the scans run are those using no offline board; the others are suspended, their ids in suspended_rules
+        self.compiled_rules = [r for r in self._all_rules if not r.boards & self._offline]
+        self.suspended_rules = {r.id for r in self._all_rules if r.boards & self._offline}; self._candidate_cache = {}
+        self._prefilter = [(r.mask, r.want, r.flip, r.any_mask, (r, None if r.digital_only else r.check)) for r in self.compiled_rules]
+        # Dependency index: scan-word bit / analog input -> the rules that read it
+        self._bit_index = [[r for r in self.compiled_rules if r.reads_bits >> bit & 1] for bit in range(BOARD_WORD_BITS * len(self.board_ids))]
+        self._analog_index = [[r for r in self.compiled_rules if index in r.reads_analog] for index in range(len(self.conditioning))]
+        # The next scan checks every active rule against the truth kept so far
+        self._last_word = self._last_analog = None; self._last_apply = (None, None)
+    def swap_rules(self, rules): self.send_command('rules', rules)
+    def force_output(self, board_id, kind, channel, value):
+        # Forces digital (value 0/1) or analog (0-255) output channel of board_id over what the rules set; value None releases it
+        self.send_command('force', board_id, kind, channel, value)
+    def scan_summary(self): return self.stats.summary()
+    @property
+    def triggered_rules(self): return {rule.id for rule in self._true_rules}   # Ids of the rules true in the last scan
+    def _start_cycles(self):
+        # Cycles start on a fixed grid of absolute deadlines, so the period does not stretch with the scan time
+        self.log(f"INFO [{self.label}]: Automation Engine STARTED (scan period {self.scan_period_s * 1000:g} ms).")
+        self._next_cycle = time.monotonic(); self._next_report = self._next_cycle + ENGINE_STATS_LOG_INTERVAL_S; self._overrun_logged = False
+    def _end_cycle(self, start, jitter):
+        # Books the cycle that started at start, jitter after its deadline, and moves on to the next deadline
+        period = self.scan_period_s; end = time.monotonic(); self._next_cycle += period; overrun = end > self._next_cycle
+        # After an overrun the next cycle starts at once, from the last deadline that has passed; the ones before it are skipped
+        skipped = int((end - self._next_cycle) // period) if overrun else 0; self._next_cycle += skipped * period
+        self.stats.record(end - start, jitter, overrun, skipped)
+        if overrun and not self._overrun_logged:
+            self._overrun_logged = True
+            self.log(f"WARNING [{self.label}]: Scan overrun, cycle took {(end - start + jitter) * 1000:.1f} ms of a {period * 1000:g} ms period ({skipped} cycles skipped).")
+        if end >= self._next_report:
+            self.log(f"STATS [{self.label}]: {self.stats.summary()}"); self._next_report = end + ENGINE_STATS_LOG_INTERVAL_S; self._overrun_logged = False
+    def _end_run(self): self.log(f"STATS [{self.label}]: {self.stats.summary()}"); self.log(f"INFO [{self.label}]: Automation Engine STOPPED.")
+    def _poll_commands(self):
+        while not self._commands.empty(): self._handle_command(self._commands.get())
+        try:
+            while self.command_pipe is not None and self.command_pipe.poll(): self._handle_command(self.command_pipe.recv())
+        except (EOFError, OSError): self.log("CRITICAL: Lost the connection to the GUI. Shutting down engine."); self.command_pipe = None; self.stop()
+    def _handle_command(self, command):
+        kind = command[0]
+        if kind == 'stop': self.stop()
+        elif kind == 'rules': self.load_rules(command[1], silent_edges=True); self.log(f"INFO [{self.label}]: Rules swapped, {len(self.compiled_rules)} rules active.")
+        elif kind == 'force': self._force(*command[1:])
+        else: self.log(f"ERROR: Unknown engine command {kind!r}.")
+    def _force(self, board_id, kind, channel, value):
+        slot = self._slots.get(board_id)
+        if slot is None or kind not in ('digital', 'analog') or not 1 <= channel <= (8 if kind == 'digital' else 2):
+            self.log(f"ERROR: Cannot force {kind} output {channel} of board {board_id}."); return
+        if kind == 'digital':
+            bit = 1 << (slot * 8 + channel - 1)
+            if value is None: self._force_mask &= ~bit
+            else: self._force_mask |= bit
+            self._force_value = (self._force_value | bit) if value else (self._force_value & ~bit)
+        elif value is None: self._forced_analog.pop(slot * 2 + channel - 1, None)
+        else: self._forced_analog[slot * 2 + channel - 1] = value
+        self.log(f"OVERRIDE [Board {board_id}]: {kind.capitalize()} output {channel} {'released' if value is None else f'forced to {value}'}.")
+    # A scan is: _boards_connected(), read the inputs of every board, _evaluate(), _write_outputs(), flush every
+    # board, _finish_scan(). The reads and flushes are the engine's own, the rest is shared.
+    # A board that is lost or fails its read (the engine reads a lost board as None) is offline: see _set_offline().
+    def _boards_connected(self):
+        # Notes the boards the controller lost; False if the engine must stop as they all are
+        lost = {board_id for board_id in self.board_ids if not self.controller.get_board(board_id)}
+        if len(lost) == len(self.board_ids):
+            for board_id in sorted(lost - self._lost): self.log(f"CRITICAL: Connection to board {board_id} lost. Shutting down engine.")
+            return False
+        self._lost = lost; return True
+    def _set_offline(self, offline):
+        # Losing a board does not stop an engine that has others: the rules that read or write it are suspended, its
+        # outputs are left as they are and the other boards scan on with their rules, filters, hysteresis and counters
+        # as they were. Once it reads again the board and its rules are back (rules true by then do not fire their
+        # rising edge). False if every board is offline, and the engine must stop.
+        def cause(board_id): return f"Connection to board {board_id} lost" if board_id in self._lost else f"Read failed for board {board_id}"
+        if len(offline) == len(self.board_ids):
+            for board_id in sorted(offline - self._offline): self.log(f"CRITICAL: {cause(board_id)}. Shutting down engine.")
+            return False
+        gone, back = sorted(offline - self._offline), sorted(self._offline - offline)
+        active = set(self.compiled_rules); self._offline = offline; self._activate_rules()
+        self._true_set = {rule for rule in self._true_set if not rule.boards & offline}
+        self._true_rules = [rule for rule in self._true_rules if rule in self._true_set]; self._truth_version += 1
+        self._resumed |= set(self.compiled_rules) - active
+        for board_id in gone:
+            self.log(f"WARNING [{self.label}]: {cause(board_id)}. Board {board_id} is offline; the other boards scan on without the rules that use it ({len(self.suspended_rules)} rules suspended).")
+        for board_id in back: self.log(f"INFO [{self.label}]: Board {board_id} is back online ({len(self.suspended_rules)} rules suspended).")
+        return True
+    def _evaluate(self, states):
+        # Runs the timers and rules on the inputs just read; the outputs they set as (digital, analog), before the
+        # overrides, or None if the engine must stop
+        now = time.monotonic()
+        offline = {board_id for board_id, inputs in zip(self.board_ids, states) if inputs is None}
+        if offline != self._offline and not self._set_offline(offline): return None
+        states = self._hold_offline(states)
+        due_timers = self._run_scheduler(now)
+        last_digital, last_analog = self._last_outputs
+        # Digital output conditions read the outputs as the boards have them, overrides included
+        last_digital = last_digital & ~self._force_mask | self._force_value
+        digital = self.latched_outputs | self._blink_mask; analog = list(last_analog)
+        for apply in due_timers:
+            self.log(f"TIMER FINISHED: Executing delayed actions."); digital = apply(digital, analog)
+        word = 0
+        for slot, inputs in enumerate(states): word |= (inputs['digital'] | (last_digital >> 8 * slot & 0xFF) << DIGITAL_OUT_SHIFT) << slot * BOARD_WORD_BITS
+        self._update_rule_states(word, states, now)
+        # Same true rules applied to the same starting outputs give the same result, so an idle scan skips the actions
+        apply_key = (self._truth_version, digital, tuple(analog), self.latched_outputs)
+        if self._last_apply[0] == apply_key: digital, analog, self.latched_outputs = self._last_apply[1]
+        else:
+            for rule in self._true_rules: digital = rule.apply(digital, analog)
+            analog = tuple(analog); self._last_apply = (apply_key, (digital, analog, self.latched_outputs))
+        return digital, analog
+    def _forced(self, outputs):
+        # outputs with the overrides applied, as they are written to the boards; a released override is simply not applied
+        digital, analog = outputs
+        if self._force_mask: digital = digital & ~self._force_mask | self._force_value
+        if self._forced_analog:
+            analog = list(analog)
+            for index, value in self._forced_analog.items(): analog[index] = value
+            analog = tuple(analog)
+        return digital, analog
+    def _hold_offline(self, states):
+        # The states with an offline board's inputs held at their last reading (stamped now), so that its filters
+        # and counters carry on from there when it is back
+        held = self._last_states or [OFFLINE_INPUTS] * len(self.board_ids)
+        return [inputs if inputs is not None else dict(last, timestamp=None) for inputs, last in zip(states, held)]
+    def _write_outputs(self, outputs):
+        digital, analog = self._forced(outputs)
+        for slot, board_id in enumerate(self.board_ids):
+            if board_id not in self._offline: self.controller.set_outputs(board_id, digital >> 8 * slot & 0xFF, analog[2 * slot], analog[2 * slot + 1])
+    def _finish_scan(self, outputs, states, errors):
+        # errors holds the IOError (or None) of each board's flush; False if the engine must stop, as no board took its
+        # outputs. A board whose write failed while others succeeded has it retried in the next scan.
+        failed = [(board_id, e) for board_id, e in zip(self.board_ids, errors) if e is not None]
+        stop = failed and len(failed) + len(self._offline) == len(self.board_ids)
+        for board_id, e in failed:
+            self.log(f"CRITICAL: Write failed for board {board_id} ({e}). Shutting down engine." if stop else f"ERROR [{self.label}]: Write failed for board {board_id} ({e}), retrying in the next scan.")
+        if stop: return False
+        self._last_outputs, self._last_states = outputs, self._hold_offline(states)
+        if self.after_scan: self.after_scan(self)
+        return True
+    def _run_scheduler(self, now):
+        # Pops the due blink toggles and blink ends (updating the blink mask) and returns the due delayed actions, earliest first
+        due_timers = []
+        for deadline, entry_id, (kind, item) in self.scheduler.pop_due(now):
+            if kind == 'timer': due_timers.append(item); continue
+            blinker = self.blinking_outputs.get(item); bit = 1 << item
+            if blinker is None or entry_id not in (blinker['toggle_id'], blinker['end_id']): continue
+            if kind == 'blink_end' or now >= blinker['end_time']:
+                self.scheduler.cancel(blinker['end_id'] if kind == 'blink' else blinker['toggle_id'])
+                del self.blinking_outputs[item]; self._blink_mask &= ~bit; continue
+            self._blink_mask ^= bit
+            # Toggle on the deadline grid, unless the engine fell more than a period behind
+            next_toggle = deadline + blinker['interval']
+            blinker['toggle_id'] = self.scheduler.schedule(next_toggle if next_toggle > now else now + blinker['interval'], ('blink', item))
+        return due_timers
+    def _resolver(self, default_board, touched):
+        # resolve(item, port_key) -> (board slot, type, port) for the conditions and actions of a rule on default_board;
+        # the boards resolved are added to the set touched
+        def resolve(item, port_key):
+            board, io_type, port = io_address(item, default_board, port_key)
+            if board not in self._slots: raise ValueError(f"board {board} is not scanned by this engine")
+            touched.add(board); return self._slots[board], io_type, port
+        return resolve
+    def _compile_rules(self, rules):
+        # Disabled rules are left out; a malformed rule is logged and skipped instead of failing every scan
+        compiled = []
+        for rule in rules:
+            if not rule.get("enabled", True): continue
+            try:
+                touched = set(); resolve = self._resolver(rule.get("board", self.board_id), touched)
+                conditions = compile_conditions(rule.get("conditions", []), rule.get("conditions_logic", "AND"), resolve, self.conditioning)
+                blinks = []
+                for a in rule.get("actions", []):
+                    if a.get("action_type") != "blink": continue
+                    slot, _, output = resolve(a, "output")
+                    if not 1 <= output <= 8: raise ValueError(f"digital_out output {output} out of range")
+                    blinks.append((slot * 8 + output - 1, output, self.board_ids[slot], a['duration'], a['interval']))
+                delayed = [(d['delay'], self._compile_actions(d['actions'], resolve)) for d in rule.get("delayed_actions", [])]
+                compiled.append(CompiledRule(rule['id'], rule.get('name', 'Unnamed'), conditions, self._compile_actions(rule.get("actions", []), resolve), blinks, delayed, frozenset(touched)))
+            except (KeyError, TypeError, ValueError) as e: self.log(f"ERROR: Rule '{rule.get('name', 'Unnamed')}' is invalid and was skipped ({e!r}).")
+        return compiled
+    def _update_rule_states(self, word, states, now):
+        # Re-evaluates only the rules reading a bit or analog value (input or conditioned signal) that changed since the last scan (timers and
+        # blinkers act through the outputs, i.e. through the word), then handles rising edges in rule order.
+        analog = self.conditioning.update(states, now)
+        if self._last_word is None: dirty_lists = None
+        else:
+            dirty_lists, changed = [], word ^ self._last_word
+            while changed:
+                low = changed & -changed; dirty_lists.append(self._bit_index[low.bit_length() - 1]); changed ^= low
+            if analog != self._last_analog:
+                for i, value in enumerate(analog):
+                    if value != self._last_analog[i]: dirty_lists.append(self._analog_index[i])
+        self._last_word, self._last_analog = word, analog
+        old = self._true_set; silent, self._silent_edges = self._silent_edges, False; resumed, self._resumed = self._resumed, set()
+        if dirty_lists is None or sum(map(len, dirty_lists)) * 4 > len(self.compiled_rules):
+            # Many rules affected: one pass over the rules this word allows
+            true_rules = [rule for rule, check in self._candidates(word) if check is None or check(word, analog)]
+            if true_rules == self._true_rules: return
+            rising = [rule for rule in true_rules if rule not in old]; true_set = set(true_rules)
+        else:
+            true_set, rising = set(old), []
+            for rule in {rule for dirty in dirty_lists for rule in dirty}:
+                if rule.check(word, analog):
+                    if rule not in true_set: true_set.add(rule); rising.append(rule)
+                elif rule in true_set: true_set.discard(rule)
+            if true_set == old: return
+            rising.sort(key=RULE_ORDER); true_rules = sorted(true_set, key=RULE_ORDER)
+        self._true_set, self._true_rules = true_set, true_rules; self._truth_version += 1
+        if silent: return
+        if resumed: rising = [rule for rule in rising if rule not in resumed]   # Back from a suspension: taken as they are
+        for rule in rising: self.log(f"RULE TRIGGERED (Rising Edge): '{rule.name}'"); self._fire_one_shot_actions(rule, now)
+    def _candidates(self, word):
+        # The rules, in order, that can be true for this digital word, each with the check still needed
+        # (None when the word alone decides). Plants cycle through few distinct words, so this is cached.
+        candidates = self._candidate_cache.get(word)
+        if candidates is None:
+            candidates = tuple(entry for mask, want, flip, any_mask, entry in self._prefilter
+                               if word & mask == want and (not any_mask or (word ^ flip) & any_mask))
+            if len(self._candidate_cache) >= CANDIDATE_CACHE_SIZE: self._candidate_cache.clear()
+            self._candidate_cache[word] = candidates
+        return candidates
+    def _compile_action(self, action, resolve):
+        # d_out -> d_out over the digital outputs of all boards (8 bits per board slot), setting analog outputs in the
+        # list a_out (2 per slot) in place; None for actions without a per-scan effect (blink)
+        slot, action_type, output = resolve(action, "output"); mode = action.get("action_type", "set_state")
+        if action_type == "digital_out":
+            if not 1 <= output <= 8: raise ValueError(f"digital_out output {output} out of range")
+            bit = 1 << (slot * 8 + output - 1)
+            if mode == "set_state":
+                if action["state"] == 1: return lambda d, a_out: d | bit
+                def clear(d, a_out): self.latched_outputs &= ~bit; return d & ~bit
+                return clear
+            if mode == "latch_on":
+                def latch(d, a_out): self.latched_outputs |= bit; return d
+                return latch
+        elif action_type == "analog_out":
+            value, index = action["value"], slot * 2 + (0 if output == 1 else 1)
+            def set_analog(d, a_out): a_out[index] = value; return d
+            return set_analog
+        return None
+    def _compile_actions(self, actions, resolve):
+        steps = [a for a in (self._compile_action(action, resolve) for action in actions) if a is not None]
+        if not steps: return lambda d, a_out: d
+        if len(steps) == 1: return steps[0]
+        def apply_all(d, a_out):
+            for step in steps: d = step(d, a_out)
+            return d
+        return apply_all
+    def _fire_one_shot_actions(self, rule, now):
+        for key, output, board_id, duration, interval in rule.blinks:
+            self.log(f"BLINK STARTED: Output {output}{'' if board_id == self.board_id else f' of board {board_id}'} for {duration}s.")
+            old = self.blinking_outputs.get(key)
+            if old: self.scheduler.cancel(old['toggle_id']); self.scheduler.cancel(old['end_id'])
+            self._blink_mask &= ~(1 << key)
+            # The first toggle (on) is due right away, as it starts in the next scan
+            self.blinking_outputs[key] = { "end_time": now + duration, "interval": interval,
+                "toggle_id": self.scheduler.schedule(now, ('blink', key)), "end_id": self.scheduler.schedule(now + duration, ('blink_end', key)) }
+        for delay, apply in rule.delayed:
+            self.scheduler.schedule(now + delay, ('timer', apply))
+            self.log(f"TIMER STARTED: Delay of {delay}s.")
+
+class AutomationEngine(EngineCore, threading.Thread):
+    # The engine in a thread of its own; with several boards, their reads and flushes run in parallel on an I/O pool
+    def __init__(self, controller, board_ids, rules, log_callback, scan_period_s=ENGINE_SCAN_PERIOD_S):
+        threading.Thread.__init__(self, daemon=True); self._is_running = threading.Event(); self._wake = threading.Event()
+        EngineCore.__init__(self, controller, board_ids, rules, log_callback, scan_period_s)
+        # The boards are read (and written) in parallel, each USB transfer on its own worker
+        self._io_pool = ThreadPoolExecutor(max_workers=len(self.board_ids), thread_name_prefix='k8055-io') if len(self.board_ids) > 1 else None
+    def stop(self): self._is_running.clear(); self._wake.set()
+    def send_command(self, *command): self._commands.put(command); self._wake.set()
     def run(self):
-        self.log(f"INFO [Board {self.board_id}]: Automation Engine STARTED."); self._is_running.set();
+        self._start_cycles(); self._is_running.set()
         while self._is_running.is_set():
-            board = self.controller.get_board(self.board_id)
-            if not board: self.log("CRITICAL: Connection to board lost. Shutting down engine."); self.stop(); continue
-            physical_inputs = self.controller.read_all_inputs(self.board_id); now = time.time()
-            if physical_inputs is None: self.log(f"CRITICAL: Read failed for board {self.board_id}. Shutting down engine."); self.stop(); continue
-            full_state = {**physical_inputs, **self.last_output_state}
-            desired_digital_outputs = self.latched_outputs; desired_analog1 = self.last_output_state['analog_out1']; desired_analog2 = self.last_output_state['analog_out2']
-            desired_digital_outputs = self._manage_blinkers(now, desired_digital_outputs)
-            desired_digital_outputs, desired_analog1, desired_analog2 = self._manage_timers(now, desired_digital_outputs, desired_analog1, desired_analog2)
-            currently_true_rules = set()
-            for rule in self.rules:
-                if not rule.get("enabled", True): continue
-                if self._evaluate_conditions(rule, full_state):
-                    currently_true_rules.add(rule['id'])
-                    desired_digital_outputs, desired_analog1, desired_analog2 = self._apply_actions(rule, desired_digital_outputs, desired_analog1, desired_analog2)
-                    if rule['id'] not in self.triggered_rules:
-                        self.log(f"RULE TRIGGERED (Rising Edge): '{rule['name']}'"); self._fire_one_shot_actions(rule, now)
-            self.triggered_rules = currently_true_rules
-            board.WriteAllDigital(desired_digital_outputs)
-            if desired_analog1 != self.last_output_state['analog_out1'] or desired_analog2 != self.last_output_state['analog_out2']:
-                board.OutputAllAnalog(desired_analog1, desired_analog2)
-            self.last_output_state = {"digital_out": desired_digital_outputs, "analog_out1": desired_analog1, "analog_out2": desired_analog2}
-            time.sleep(ENGINE_LOOP_DELAY_S)
-        board = self.controller.get_board(self.board_id)
-        if board: board.ClearAllDigital(); board.ClearAllAnalog()
-        self.log(f"INFO [Board {self.board_id}]: Automation Engine STOPPED.")
-    def _manage_blinkers(self, now, current_output_state):
-        for output, blinker in list(self.blinking_outputs.items()):
-            if now >= blinker['end_time']: del self.blinking_outputs[output]; continue
-            if now >= blinker['next_toggle']:
-                blinker['current_state'] = 1 - blinker['current_state']; blinker['next_toggle'] = now + blinker['interval']
-            if blinker['current_state'] == 1: current_output_state |= (1 << (output - 1))
-        return current_output_state
-    def _manage_timers(self, now, d_out, a1_out, a2_out):
-        for timer_id, (end_time, actions) in list(self.active_timers.items()):
-            if now >= end_time:
-                self.log(f"TIMER FINISHED: Executing delayed actions."); d_out, a1_out, a2_out = self._apply_actions({"actions": actions}, d_out, a1_out, a2_out)
-                del self.active_timers[timer_id]
-        return d_out, a1_out, a2_out
-    def _evaluate_conditions(self, rule, state):
-        results = []
-        for cond in rule.get("conditions", []):
-            cond_type = cond.get("type", "")
-            if cond_type == "digital_in": results.append(((state["digital"] >> (cond["port"] - 1)) & 1) == cond["state"])
-            elif cond_type == "analog_in":
-                val, op = state[f"analog{cond['port']}"], cond["operator"]
-                if op == ">": results.append(val > cond["value"])
-                elif op == "<": results.append(val < cond["value"])
-                elif op == "==": results.append(val == cond["value"])
-            elif cond_type == "digital_out": results.append(((state["digital_out"] >> (cond["port"] - 1)) & 1) == cond["state"])
-        if not results: return False
-        return any(results) if rule.get("conditions_logic", "AND").upper() == "OR" else all(results)
-    def _fire_one_shot_actions(self, rule, now):
-        for action in rule.get("actions", []):
-            if action.get("action_type") == "blink":
-                self.log(f"BLINK STARTED: Output {action['output']} for {action['duration']}s.")
-                self.blinking_outputs[action['output']] = { "end_time": time.time() + action['duration'], "interval": action['interval'], "next_toggle": time.time(), "current_state": 0 }
-        for d_action in rule.get("delayed_actions", []):
-            timer_id = str(uuid.uuid4()); self.active_timers[timer_id] = (now + d_action['delay'], d_action['actions'])
-            self.log(f"TIMER STARTED: Delay of {d_action['delay']}s.")
-    def _apply_actions(self, rule_part, d_out, a1_out, a2_out):
-        for action in rule_part.get("actions", []):
-            action_type = action.get("type", ""); mode = action.get("action_type", "set_state")
-            if action_type == "digital_out":
-                bit = 1 << (action["output"] - 1)
-                if mode == "set_state":
-                    if action["state"] == 1: d_out |= bit
-                    else: d_out &= ~bit; self.latched_outputs &= ~bit
-                elif mode == "latch_on": self.latched_outputs |= bit
-            elif action_type == "analog_out":
-                if action["output"] == 1: a1_out = action["value"]
-                else: a2_out = action["value"]
-        return d_out, a1_out, a2_out
+            self._poll_commands()
+            if not self._is_running.is_set(): break
+            now = time.monotonic()
+            if now < self._next_cycle:
+                # Between cycles a due timer or blink toggle gets its own scan, which leaves the cycle grid alone
+                deadline = self.scheduler.next_deadline()
+                if deadline is None or deadline > now: self._wait((self._next_cycle if deadline is None else min(self._next_cycle, deadline)) - now)
+                elif not self.scan_once(): self.stop()
+                continue
+            jitter = now - self._next_cycle
+            if not self.scan_once(): self.stop(); continue
+            self._end_cycle(now, jitter)
+        for board_id in self.board_ids:
+            if not self.controller.get_board(board_id): continue
+            self.controller.set_outputs(board_id, 0, 0, 0)
+            try: self.controller.flush_outputs(board_id, force=True)
+            except IOError as e: self.log(f"ERROR: Could not reset outputs of board {board_id}: {e}")
+        if self._io_pool: self._io_pool.shutdown(wait=False)
+        self._end_run()
+    def _wait(self, timeout):
+        # Sleeps for timeout, or less if a command or stop() comes in
+        if self.command_pipe is None: self._wake.wait(timeout); self._wake.clear()
+        elif timeout > 0.002: self.command_pipe.poll(timeout - 0.001)   # poll() rounds up to whole ms; the loop sleeps off the rest
+        else: time.sleep(timeout)
+    def scan_once(self):
+        # One PLC scan over all boards: read inputs, evaluate the rules, write outputs. False if the engine must stop.
+        if not self._boards_connected(): return False
+        if self._io_pool: states = list(self._io_pool.map(self._read_board, self.board_ids))
+        else: states = [self._read_board(self.board_id)]
+        outputs = self._evaluate(states)
+        if outputs is None: return False
+        self._write_outputs(outputs)
+        if self._io_pool: errors = list(self._io_pool.map(self._flush_board, self.board_ids))
+        else: errors = [self._flush_board(self.board_id)]
+        return self._finish_scan(outputs, states, errors)
+    def _read_board(self, board_id): return None if board_id in self._lost else self.controller.read_all_inputs(board_id)
+    def _flush_board(self, board_id):
+        if board_id in self._offline: return None
+        try: self.controller.flush_outputs(board_id); return None
+        except IOError as e: return e
+
+def run_engine_process(command_pipe, events, image_name, board_ids, rules, scan_period_s):
+    # Entry point of an engine process. It opens board_ids itself, runs the engine in its main thread, publishes the
+    # engine image after every scan and takes its commands from command_pipe. Log messages go to the events queue and
+    # are dropped, never waited for, when the GUI falls behind.
+    dropped = 0
+    def log(message):
+        nonlocal dropped
+        try:
+            if dropped: events.put_nowait(('log', f"WARNING: {dropped} engine log messages were dropped.")); dropped = 0
+            events.put_nowait(('log', message))
+        except queue.Full: dropped += 1
+    image = EngineImage(image_name); controller = K8055Controller(log)
+    try:
+        controller.scan_for_boards(quiet=True, addresses=board_ids)
+        engine = AutomationEngine(controller, board_ids, rules, log, scan_period_s)
+        engine.command_pipe, engine.after_scan = command_pipe, image.publish
+        engine.run()
+    finally:
+        image.mark_stopped(); image.close()
+        for board in controller.boards.values():
+            try: board.CloseDevice()
+            except IOError: pass
+
+class ProcessAutomationEngine:
+    # AutomationEngine in a process of its own, so Tk redraws and rule editing here cannot add jitter to its scans.
+    # The boards are lent to that process while it runs; this side only reads the shared EngineImage and sends
+    # commands over a pipe, and neither can hold up the engine. Offers the AutomationEngine interface the GUI uses.
+    def __init__(self, controller, board_ids, rules, log_callback, scan_period_s=ENGINE_SCAN_PERIOD_S):
+        self.controller, self.log = controller, log_callback
+        self.board_ids = [board_ids] if isinstance(board_ids, int) else list(dict.fromkeys(board_ids))
+        if not 1 <= len(self.board_ids) <= EngineImage.MAX_BOARDS: raise ValueError(f"The engine needs 1 to {EngineImage.MAX_BOARDS} boards")
+        if not scan_period_s > 0: raise ValueError(f"Scan period must be positive, got {scan_period_s!r}")
+        self.board_id, self.rules, self.scan_period_s = self.board_ids[0], rules, scan_period_s
+        self.image = self._process = self._pipe = self._events = None; self._finished = False
+    def start(self):
+        # spawn, not fork: the child must not inherit Tk or the open USB handles
+        context = multiprocessing.get_context('spawn')
+        self.image = EngineImage(board_ids=self.board_ids); self._pipe, child_pipe = context.Pipe(); self._events = context.Queue(ENGINE_EVENT_QUEUE_SIZE)
+        self.controller.lend_boards(self.board_ids, self.image)
+        self._process = context.Process(target=run_engine_process, name='k8055-engine', daemon=True,
+                                         args=(child_pipe, self._events, self.image.name, self.board_ids, self.rules, self.scan_period_s))
+        self._process.start(); child_pipe.close()
+    def is_alive(self): return self._process is not None and self._process.is_alive()
+    def _send(self, *command):
+        try: self._pipe.send(command)
+        except (OSError, ValueError): pass   # The engine process has exited already
+    def stop(self): self._send('stop')
+    def swap_rules(self, rules): self._send('rules', rules)
+    def force_output(self, board_id, kind, channel, value): self._send('force', board_id, kind, channel, value)
+    def scan_summary(self):
+        image = self.image.read() if self.image and not self._finished else None
+        return ScanStatistics.format_summary(image['stats']) if image else "---"
+    @property
+    def triggered_rules(self):
+        image = self.image.read(with_rules=True) if self.image and not self._finished else None
+        return image['true_rules'] if image else set()
+    def poll(self):
+        # Forwards the engine's log messages and, once the process has exited, takes the boards back. Called by the GUI loop.
+        self._drain_events()
+        if self._process is not None and not self._process.is_alive(): self._finish()
+    def join(self, timeout=ENGINE_PROCESS_STOP_TIMEOUT_S):
+        if self._process is None: return
+        deadline = time.monotonic() + timeout
+        while self._process.is_alive() and time.monotonic() < deadline: self._drain_events(); self._process.join(0.05)
+        if self._process.is_alive():
+            self.log("WARNING: Engine process did not stop in time and was terminated."); self._process.terminate(); self._process.join()
+        self._finish()
+    def _drain_events(self):
+        while not self._finished:
+            try: kind, message = self._events.get_nowait()
+            except queue.Empty: return
+            if kind == 'log': self.log(message)
+    def _finish(self):
+        if self._finished: return
+        self._drain_events(); self._finished = True
+        self._pipe.close(); self._events.close(); self.image.close(); self.image.unlink()
+        self.controller.reclaim_boards(self.board_ids)
+
+class AsyncAutomationEngine(EngineCore):
+    # The engine as a coroutine: `await engine.run()` scans on the running event loop with the same fixed-rate cycle,
+    # statistics and commands as AutomationEngine. Its USB transfers go through an AsyncK8055Controller and its timers
+    # and blink toggles are loop callbacks (LoopScheduler), so one loop can run an engine per board next to other
+    # coroutines without a thread per engine. stop(), swap_rules() and force_output() may be called from any thread.
+    def __init__(self, controller, board_ids, rules, log_callback, scan_period_s=ENGINE_SCAN_PERIOD_S):
+        # Engines sharing a loop should share one AsyncK8055Controller; a plain K8055Controller gets one of its own
+        self._own_controller = not isinstance(controller, AsyncK8055Controller)
+        if self._own_controller: controller = AsyncK8055Controller(controller)
+        self._loop = self._wake = None; self._running = False
+        EngineCore.__init__(self, controller, board_ids, rules, log_callback, scan_period_s, LoopScheduler(self._timer_due))
+    def is_alive(self): return self._running
+    def stop(self): self._running = False; self._notify()
+    def send_command(self, *command): self._commands.put(command); self._notify()
+    def _notify(self):
+        loop = self._loop
+        if loop is not None and not loop.is_closed(): loop.call_soon_threadsafe(self._wake.set)
+    def _timer_due(self): self._wake.set()
+    async def run(self):
+        self._loop = asyncio.get_running_loop(); self._wake = asyncio.Event(); self._running = True; self._start_cycles()
+        try:
+            while self._running:
+                self._poll_commands()
+                if not self._running: break
+                now = time.monotonic()
+                if now < self._next_cycle:
+                    # Between cycles a due timer or blink toggle gets its own scan, which leaves the cycle grid alone
+                    deadline = self.scheduler.next_deadline()
+                    if deadline is None or deadline > now: await self._wait((self._next_cycle if deadline is None else min(self._next_cycle, deadline)) - now)
+                    elif not await self.scan_once(): self.stop()
+                    continue
+                jitter = now - self._next_cycle
+                if not await self.scan_once(): self.stop(); continue
+                self._end_cycle(now, jitter)
+        finally:
+            self._running = False; self.scheduler.clear()
+            for board_id in self.board_ids:
+                if not self.controller.get_board(board_id): continue
+                self.controller.set_outputs(board_id, 0, 0, 0)
+                try: await self.controller.flush_outputs(board_id, force=True)
+                except IOError as e: self.log(f"ERROR: Could not reset outputs of board {board_id}: {e}")
+            if self._own_controller: self.controller.close()
+            self._end_run()
+    async def _wait(self, timeout):
+        # Sleeps for timeout, or less if a command, a due timer or stop() comes in
+        try: await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError: pass
+        self._wake.clear()
+    async def scan_once(self):
+        # One PLC scan over all boards, their reads and flushes awaited together. False if the engine must stop.
+        if not self._boards_connected(): return False
+        states = await asyncio.gather(*(self._read_board(board_id) for board_id in self.board_ids))
+        outputs = self._evaluate(states)
+        if outputs is None: return False
+        self._write_outputs(outputs)
+        errors = await asyncio.gather(*(self._flush_board(board_id) for board_id in self.board_ids))
+        return self._finish_scan(outputs, states, errors)
+    async def _read_board(self, board_id): return None if board_id in self._lost else await self.controller.read_all_inputs(board_id)
+    async def _flush_board(self, board_id):
+        if board_id in self._offline: return None
+        try: await self.controller.flush_outputs(board_id); return None
+        except IOError as e: return e
 
 # =============================================================================
 # GUI APPLICATION
 # =============================================================================
+class ViewState:
+    # What was last rendered into each Tk variable and widget option, so a refresh touches only what changed.
+    # Targets are keyed by their Tcl name, which stays the same for the life of the variable or widget.
+    def __init__(self): self._shown = {}
+    def set(self, var, value):
+        key = str(var)
+        if key not in self._shown or self._shown[key] != value: self._shown[key] = value; var.set(value)
+    def configure(self, widget, **options):
+        shown = self._shown.setdefault(str(widget), {}); changed = {k: v for k, v in options.items() if k not in shown or shown[k] is not v and shown[k] != v}
+        if changed: shown.update(changed); widget.config(**changed)
+
 class MainApplication(tk.Tk):
     def __init__(self):
-        super().__init__(); self.protocol("WM_DELETE_WINDOW", self._on_closing); self.icon_cache = {}
+        super().__init__(); self.protocol("WM_DELETE_WINDOW", self._on_closing)
+        self.icon_sources = {}; self.icon_cache = collections.OrderedDict()   # Decoded icon files by name; rendered icons by (name, side), LRU order
         self.app_config = configparser.ConfigParser(); self.app_config.read(CONFIG_FILE)
         self.lang = LanguageManager(self.app_config.get('General', 'language', fallback='en'))
         
-        self.automation_engine = None; self._log_queue = []
+        self.automation_engine = None; self._output_flush_pending = False
+        # Slider values not yet written, by (board, channel), and those written but not yet logged; one timer sends them
+        self._slider_pending = {}; self._slider_unlogged = {}; self._slider_timer = None
+        self.view = ViewState(); self._grid_size = None; self._layout_pending = None
+        # Log lines from any thread; the Tk thread drains them. Lines beyond LOG_MAX_LINES would be trimmed from the
+        # terminal anyway, so a burst bigger than that drops its oldest lines here already.
+        self._log_queue = collections.deque(maxlen=LOG_MAX_LINES)
+        self._slider_interval_ms = self._load_slider_interval()
         self.controller = K8055Controller(self.log)
         
         # --- THIS IS THE FIX ---
@@ -222,32 +1230,31 @@ class MainApplication(tk.Tk):
         
         self._create_menu(); self._create_widgets()
         self.controller.scan_for_boards(); self._populate_board_selector()
+        if self.app_mode == "Automation": self.controller.start_acquisition(UI_UPDATE_INTERVAL_MS / 1000.0)
+        self.use_hotplug = self.controller.start_hotplug()
         
-        self.update_live_status(); self.after(HARDWARE_POLL_INTERVAL_MS, self.hardware_poll)
+        self.update_live_status(); self.after(HOTPLUG_POLL_INTERVAL_MS if self.use_hotplug else HARDWARE_POLL_INTERVAL_MS, self.hardware_poll)
 
     def on_board_change(self, *args):
-        self.current_digital_outputs = 0
-        if self.automation_engine and self.automation_engine.is_alive():
-            self._stop_engine(); messagebox.showinfo("Engine Stopped", "Automation engine was stopped due to board change.")
-        
+        board_id = self.active_board_id.get()
+        self.current_digital_outputs = self.controller.get_outputs(int(board_id))[0] if board_id.isdigit() else 0
+        # The engine scans every connected board, so switching boards only changes what is shown and edited
         if self.app_mode == "Direct":
             self.direct_control_config = self._load_direct_control_config()
             self._update_direct_control_view()
         elif self.app_mode == "Automation":
             self.rules = self._load_rules_for_board()
             if hasattr(self, 'rules_label'):
-                self._update_rules_display()
+                self._update_rules_display(); self.scan_period_var.set(str(self._load_scan_period()))
 
     def hardware_poll(self):
-        known_ids = set()
-        if hasattr(self, 'board_selector') and self.board_selector.winfo_exists():
-            try:
-                for i in range(self.board_selector["menu"].index("end") + 1):
-                    label = self.board_selector["menu"].entrycget(i, "label")
-                    if label.isdigit(): known_ids.add(int(label))
-            except (AttributeError, tk.TclError): pass
-        current_ids = set(self.controller.get_connected_board_ids())
-        if current_ids != known_ids:
+        if self.use_hotplug:
+            # Only drains the hotplug event queue; the bus is enumerated only when a board came or went
+            if self.controller.process_hotplug_events(): self._populate_board_selector()
+            self.after(HOTPLUG_POLL_INTERVAL_MS, self.hardware_poll); return
+        found_mask = pyk8055.SearchDevices()
+        present_ids = {i for i in range(4) if (found_mask >> i) & 1}
+        if present_ids != set(self.controller.get_connected_board_ids()):
             self.log("Hardware change detected. Rescanning..."); self.controller.scan_for_boards(); self._populate_board_selector()
         self.after(HARDWARE_POLL_INTERVAL_MS, self.hardware_poll)
 
@@ -269,12 +1276,24 @@ class MainApplication(tk.Tk):
         return {str(i): {"label": f"Output {i}", "icon": "bulb"} for i in range(1, 9)}
 
     def _get_icon(self, name, size):
-        if (name, size) in self.icon_cache: return self.icon_cache[(name, size)]
-        try:
-            path = os.path.join(ICONS_DIR, name)
-            with Image.open(path) as img:
-                photo = ImageTk.PhotoImage(img.resize(size, Image.Resampling.LANCZOS)); self.icon_cache[(name, size)] = photo; return photo
-        except Exception: self.log(f"ERROR: Could not find icon: {name}"); return None
+        # The side is rounded down to one of ICON_SIZE_BUCKETS, so resizing the window renders a few sizes, not one per pixel
+        side = max([bucket for bucket in ICON_SIZE_BUCKETS if bucket <= min(size)] or ICON_SIZE_BUCKETS[:1]); key = (name, side)
+        photo = self.icon_cache.get(key)
+        if photo is not None: self.icon_cache.move_to_end(key); return photo
+        source = self._get_icon_source(name)
+        if source is None: return None
+        photo = self.icon_cache[key] = ImageTk.PhotoImage(source.resize((side, side), Image.Resampling.LANCZOS))
+        # The least recently used icons go first; those on screen were used by the last redraw
+        while len(self.icon_cache) > ICON_CACHE_SIZE: self.icon_cache.popitem(last=False)
+        return photo
+
+    def _get_icon_source(self, name):
+        # Every icon file is read and decoded once; one that cannot be read is remembered as None and logged once
+        if name not in self.icon_sources:
+            try:
+                with Image.open(os.path.join(ICONS_DIR, name)) as img: self.icon_sources[name] = img.convert('RGBA')
+            except (OSError, UnidentifiedImageError): self.log(f"ERROR: Could not find icon: {name}"); self.icon_sources[name] = None
+        return self.icon_sources[name]
 
     def _create_menu(self):
         self.menu_bar = tk.Menu(self); self.config(menu=self.menu_bar); config_menu = tk.Menu(self.menu_bar, tearoff=0)
@@ -326,17 +1345,29 @@ class MainApplication(tk.Tk):
             ttk.Label(analog_frame, text=f"A{i+1}:").pack(side=tk.LEFT, padx=(10, 5))
             scale = ttk.Scale(analog_frame, from_=0, to=255, orient=tk.HORIZONTAL, variable=self.analog_output_vars[i], command=lambda val, ch=i+1: self._on_analog_slide(ch, int(float(val))))
             scale.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-        self.grid_frame.bind('<Configure>', self._update_direct_control_view)
+        self.grid_frame.bind('<Configure>', self._on_grid_configure)
 
-    def _update_direct_control_view(self, event=None):
+    def _on_grid_configure(self, event):
+        # Dragging the window edge sends a storm of <Configure> events. Each only records the size and restarts the
+        # timer, so the icons are re-rendered once, RESIZE_DEBOUNCE_MS after the drag stops.
+        if (event.width, event.height) == self._grid_size: return
+        self._grid_size = (event.width, event.height)
+        if self._layout_pending: self.after_cancel(self._layout_pending)
+        self._layout_pending = self.after(RESIZE_DEBOUNCE_MS, self._relayout_direct_control)
+
+    def _relayout_direct_control(self): self._layout_pending = None; self._update_direct_control_view()
+
+    def _update_direct_control_view(self):
+        # Buttons are reconfigured only where the label or icon differs from what they show
         if self.app_mode != "Direct" or not hasattr(self, 'grid_frame') or not self.grid_frame.winfo_exists(): return
-        cell_width = self.grid_frame.winfo_width() / 4; icon_side = int(min(cell_width, self.grid_frame.winfo_height() / 2) * 0.5)
+        width, height = self._grid_size or (self.grid_frame.winfo_width(), self.grid_frame.winfo_height())
+        icon_side = int(min(width / 4, height / 2) * 0.5)
         if icon_side < 16: icon_side = 16
         new_size = (icon_side, icon_side)
         for output_id, btn in self.digital_buttons.items():
             cfg = self.direct_control_config.get(str(output_id), {"label": f"Output {output_id}", "icon": "bulb"})
             is_on = (self.current_digital_outputs >> (output_id - 1)) & 1
-            icon_name = f"{cfg['icon']}_{'on' if is_on else 'off'}.png"; btn.config(text=cfg['label'], image=self._get_icon(icon_name, new_size))
+            icon_name = f"{cfg['icon']}_{'on' if is_on else 'off'}.png"; self.view.configure(btn, text=cfg['label'], image=self._get_icon(icon_name, new_size))
 
     def _create_automation_ui(self):
         paned = ttk.PanedWindow(self, orient=tk.VERTICAL); paned.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -368,6 +1399,9 @@ class MainApplication(tk.Tk):
         ttk.Label(parent, text=self.lang.get_string('counters')).grid(row=2, column=0, sticky="w", padx=5)
         ttk.Label(parent, text="C1:").grid(row=2, column=1, padx=(10,2)); ttk.Label(parent, textvariable=self.counter_vars[0], width=4).grid(row=2, column=2)
         ttk.Label(parent, text="C2:").grid(row=2, column=3, padx=(10,2)); ttk.Label(parent, textvariable=self.counter_vars[1], width=4).grid(row=2, column=4)
+        self.scan_stats_var = tk.StringVar(value="---")
+        ttk.Label(parent, text=self.lang.get_string('scan_cycle')).grid(row=3, column=0, sticky="w", padx=5, pady=5)
+        ttk.Label(parent, textvariable=self.scan_stats_var).grid(row=3, column=1, columnspan=10, sticky="w", padx=(10,2))
 
     def _create_automation_controls(self, parent):
         btn_frame = ttk.Frame(parent); btn_frame.pack(pady=10)
@@ -375,6 +1409,11 @@ class MainApplication(tk.Tk):
         self.edit_rules_button = ttk.Button(btn_frame, text=self.lang.get_string('edit_rules'), command=self._open_rule_editor); self.edit_rules_button.pack(side=tk.LEFT, padx=5)
         self.start_button = ttk.Button(btn_frame, text=self.lang.get_string('start_engine'), command=self._start_engine); self.start_button.pack(side=tk.LEFT, padx=20)
         self.stop_button = ttk.Button(btn_frame, text=self.lang.get_string('stop_engine'), command=self._stop_engine, state=tk.DISABLED); self.stop_button.pack(side=tk.LEFT, padx=5)
+        ttk.Label(btn_frame, text=self.lang.get_string('scan_period_ms')).pack(side=tk.LEFT, padx=(20,2)); self.scan_period_var = tk.StringVar(value=str(self._load_scan_period()))
+        self.scan_period_spinbox = ttk.Spinbox(btn_frame, from_=MIN_SCAN_PERIOD_MS, to=MAX_SCAN_PERIOD_MS, increment=5, width=6, textvariable=self.scan_period_var); self.scan_period_spinbox.pack(side=tk.LEFT)
+        # In its own process the engine's scan timing does not depend on how busy the GUI is
+        self.engine_process_var = tk.BooleanVar(value=self.app_config.getboolean('Engine', 'separate_process', fallback=False))
+        self.engine_process_check = ttk.Checkbutton(parent, text=self.lang.get_string('engine_process'), variable=self.engine_process_var, command=self._save_engine_process_option); self.engine_process_check.pack()
         self.rules_label = ttk.Label(parent, text=self.lang.get_string('no_rules_loaded'), justify=tk.LEFT); self.rules_label.pack(pady=10, padx=10, fill="x")
 
     def _update_rules_display(self):
@@ -388,60 +1427,97 @@ class MainApplication(tk.Tk):
         if not board_id.isdigit(): return
         path = RULES_FILENAME_TPL.format(board_id)
         self._save_rules_to_file(path)
+        # A running engine takes the new rules between two scans, without stopping
+        if self.automation_engine and self.automation_engine.is_alive(): self.automation_engine.swap_rules(self._collect_rules(int(board_id)))
 
     def _create_log_terminal(self, parent):
         self.log_text = tk.Text(parent, height=10, state=tk.DISABLED, wrap=tk.WORD, font=("Courier", 9))
         scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.log_text.yview); self.log_text.config(yscrollcommand=scrollbar.set)
         self.log_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True); scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        for msg in self._log_queue: self.log(msg, False); self._log_queue.clear()
+        self._flush_log()
 
-    def log(self, message, process_queue=True):
-        if hasattr(self, 'log_text') and self.log_text.winfo_exists():
-            if process_queue and self._log_queue:
-                for msg in self._log_queue: self.log(msg, False)
-                self._log_queue.clear()
-            self.log_text.config(state=tk.NORMAL); self.log_text.insert(tk.END, f"{time.strftime('%H:%M:%S')} - {message}\n"); self.log_text.see(tk.END); self.log_text.config(state=tk.DISABLED)
-        else: self._log_queue.append(message); print(f"LOG (queued): {message}")
+    def log(self, message):
+        # Safe from any thread: only appends to the queue (deque appends are atomic), Tk is touched by _flush_log() alone
+        if not hasattr(self, 'log_text'): print(f"LOG (queued): {message}")
+        self._log_queue.append(f"{time.strftime('%H:%M:%S')} - {message}\n")
+
+    def _flush_log(self):
+        # Once per LOG_FLUSH_INTERVAL_MS, all queued lines go in with one insert; past LOG_MAX_LINES the oldest lines
+        # are deleted in one go, LOG_TRIM_LINES at least, so the terminal stays bounded over days of running
+        pending = self._log_queue; lines = [pending.popleft() for _ in range(len(pending))]
+        if lines and self.log_text.winfo_exists():
+            self.log_text.config(state=tk.NORMAL); self.log_text.insert(tk.END, "".join(lines))
+            excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - LOG_MAX_LINES
+            if excess > 0: self.log_text.delete('1.0', f'{max(excess, LOG_TRIM_LINES) + 1}.0')
+            self.log_text.see(tk.END); self.log_text.config(state=tk.DISABLED)
+        self.after(LOG_FLUSH_INTERVAL_MS, self._flush_log)
 
     def update_live_status(self):
         board_id_str = self.active_board_id.get()
         if self.app_mode == "Automation" and board_id_str.isdigit():
-            inputs = self.controller.read_all_inputs(int(board_id_str))
+            # Shows the board's latest snapshot, taken by the engine or by the board's acquisition service; no USB here
+            snapshot = self.controller.snapshot(int(board_id_str)); inputs = snapshot.inputs if snapshot else None
+            # Only the values that differ from what is on screen are set
             if inputs:
-                for i in range(5): self.digital_input_vars[i].set(str((inputs["digital"] >> i) & 1))
-                self.analog_vars[0].set(str(inputs["analog1"])); self.analog_vars[1].set(str(inputs["analog2"]))
-                self.counter_vars[0].set(str(inputs["counter1"])); self.counter_vars[1].set(str(inputs["counter2"]))
+                for i in range(5): self.view.set(self.digital_input_vars[i], str((inputs["digital"] >> i) & 1))
+                self.view.set(self.analog_vars[0], str(inputs["analog1"])); self.view.set(self.analog_vars[1], str(inputs["analog2"]))
+                self.view.set(self.counter_vars[0], str(inputs["counter1"])); self.view.set(self.counter_vars[1], str(inputs["counter2"]))
             else:
-                if self.automation_engine and self.automation_engine.is_alive(): self._stop_engine()
-                for i in range(5): self.digital_input_vars[i].set("-")
-                for i in range(2): self.analog_vars[i].set("---"); self.counter_vars[i].set("---")
-        elif self.app_mode == "Direct":
-            self._update_direct_control_view()
+                for i in range(5): self.view.set(self.digital_input_vars[i], "-")
+                for i in range(2): self.view.set(self.analog_vars[i], "---"); self.view.set(self.counter_vars[i], "---")
+        # Direct mode buttons change only on a toggle, a board change or a layout change, each of which redraws them
+        if self.app_mode == "Automation": self._poll_engine()
         self.after(UI_UPDATE_INTERVAL_MS, self.update_live_status)
 
+    def _poll_engine(self):
+        engine = self.automation_engine
+        if isinstance(engine, ProcessAutomationEngine): engine.poll()
+        if engine and engine.is_alive(): self.view.set(self.scan_stats_var, engine.scan_summary())
+        elif engine and str(self.stop_button['state']) == tk.NORMAL: self._stop_engine()   # The engine stopped by itself
+
     def _on_digital_toggle(self, channel):
         board_id_str = self.active_board_id.get()
         if not board_id_str or not board_id_str.isdigit(): return
-        board = self.controller.get_board(int(board_id_str))
-        if not board: return
-        is_on = (self.current_digital_outputs >> (channel - 1)) & 1
-        if is_on:
-            board.ClearDigitalChannel(channel); self.current_digital_outputs &= ~(1 << (channel - 1))
-            self.log(f"MANUAL [Board {board_id_str}]: Set Output {channel} OFF.")
-        else:
-            board.SetDigitalChannel(channel); self.current_digital_outputs |= (1 << (channel - 1))
-            self.log(f"MANUAL [Board {board_id_str}]: Set Output {channel} ON.")
-        self._update_direct_control_view()
+        board_id = int(board_id_str)
+        if not self.controller.get_board(board_id): return
+        is_on = (self.controller.get_outputs(board_id)[0] >> (channel - 1)) & 1
+        self.controller.set_digital_channel(board_id, channel, not is_on); self.current_digital_outputs = self.controller.get_outputs(board_id)[0]
+        self.log(f"MANUAL [Board {board_id_str}]: Set Output {channel} {'OFF' if is_on else 'ON'}.")
+        self._schedule_output_flush(); self._update_direct_control_view()
 
     def _on_analog_slide(self, channel, value):
         board_id_str = self.active_board_id.get()
         if not board_id_str or not board_id_str.isdigit(): return
-        board = self.controller.get_board(int(board_id_str))
-        if not board: return
-        board.OutputAnalogChannel(channel, value); self.log(f"MANUAL [Board {board_id_str}]: Set Analog Output {channel} to {value}.")
+        if not self.controller.get_board(int(board_id_str)): return
+        # A drag sends a motion event per pixel: only the latest value of each channel is kept, and the timer sends it
+        self._slider_pending[(int(board_id_str), channel)] = value
+        if self._slider_timer is None: self._flush_analog_sliders()
 
-    def _load_rules_for_board(self):
-        board_id = self.active_board_id.get()
+    def _flush_analog_sliders(self):
+        # At most one combined write per board every _slider_interval_ms (analog_slider_rate_hz under [General]). An
+        # interval without slider motion ends the drag, and only then are the final values logged.
+        if not self._slider_pending:
+            for (board_id, channel), value in sorted(self._slider_unlogged.items()): self.log(f"MANUAL [Board {board_id}]: Set Analog Output {channel} to {value}.")
+            self._slider_unlogged.clear(); self._slider_timer = None; return
+        pending, self._slider_pending = self._slider_pending, {}
+        for (board_id, channel), value in pending.items(): self.controller.set_analog_channel(board_id, channel, value)
+        for board_id in {board_id for board_id, _ in pending}:
+            try: self.controller.flush_outputs(board_id)
+            except IOError as e: self.log(f"ERROR [Board {board_id}]: {e}")
+        self._slider_unlogged.update(pending); self._slider_timer = self.after(self._slider_interval_ms, self._flush_analog_sliders)
+
+    def _schedule_output_flush(self):
+        # Manual changes made before Tk goes idle are sent together as one packet
+        if not self._output_flush_pending: self._output_flush_pending = True; self.after_idle(self._flush_manual_outputs)
+
+    def _flush_manual_outputs(self):
+        self._output_flush_pending = False; board_id_str = self.active_board_id.get()
+        if not board_id_str.isdigit(): return
+        try: self.controller.flush_outputs(int(board_id_str))
+        except IOError as e: self.log(f"ERROR [Board {board_id_str}]: {e}")
+
+    def _load_rules_for_board(self, board_id=None):
+        board_id = self.active_board_id.get() if board_id is None else str(board_id)
         if not board_id.isdigit(): return []
         path = RULES_FILENAME_TPL.format(board_id)
         try:
@@ -450,6 +1526,28 @@ class MainApplication(tk.Tk):
             self.log(f"Loaded {len(rules)} rules for board {board_id}."); return rules
         except (FileNotFoundError, json.JSONDecodeError): return []
 
+    def _load_scan_period(self):
+        # Per-board scan period from the [Board N] section of the config file, else the [Engine] default
+        board_id = self.active_board_id.get(); default = self.app_config.getint('Engine', 'scan_period_ms', fallback=round(ENGINE_SCAN_PERIOD_S * 1000))
+        return self.app_config.getint(f'Board {board_id}', 'scan_period_ms', fallback=default) if board_id.isdigit() else default
+
+    def _load_slider_interval(self):
+        # Milliseconds between slider writes, from analog_slider_rate_hz under [General]; a rate that is not a positive number is replaced by the default
+        try: rate = self.app_config.getfloat('General', 'analog_slider_rate_hz', fallback=ANALOG_SLIDER_MAX_RATE_HZ)
+        except ValueError: rate = None
+        if rate is None or not rate > 0:
+            self.log(f"WARNING: analog_slider_rate_hz {self.app_config.get('General', 'analog_slider_rate_hz')!r} under [General] is not a positive rate, using {ANALOG_SLIDER_MAX_RATE_HZ} Hz.")
+            rate = ANALOG_SLIDER_MAX_RATE_HZ
+        return max(1, round(1000 / rate))
+
+    def _save_scan_period(self, board_id, period_ms):
+        config = configparser.ConfigParser(); config.read(CONFIG_FILE); section = f'Board {board_id}'
+        if not config.has_section(section): config.add_section(section)
+        config.set(section, 'scan_period_ms', str(period_ms))
+        with open(CONFIG_FILE, 'w') as f: config.write(f)
+        if not self.app_config.has_section(section): self.app_config.add_section(section)
+        self.app_config.set(section, 'scan_period_ms', str(period_ms))
+
     def _load_rules(self):
         board_id = self.active_board_id.get()
         if not board_id.isdigit(): messagebox.showerror("Error", self.lang.get_string('error_no_board')); return
@@ -468,24 +1566,46 @@ class MainApplication(tk.Tk):
             self.log(f"Saved {len(self.rules)} rules to {fp}")
         except Exception as e: messagebox.showerror("Error", f"Failed to save rules.\n{e}"); self.log(f"ERROR: {e}")
 
+    def _collect_rules(self, active_board_id):
+        # The active board's rules as edited plus the saved rules of the other connected boards, each tagged with its board
+        rules = []
+        for board_id in self.controller.get_connected_board_ids():
+            board_rules = self.rules if board_id == active_board_id else self._load_rules_for_board(board_id)
+            rules.extend(dict(rule, board=rule.get('board', board_id)) for rule in board_rules)
+        return rules
+
     def _start_engine(self):
-        if not self.rules: messagebox.showwarning("Warning", self.lang.get_string('error_no_rules')); return
         try: board_id = int(self.active_board_id.get())
         except (tk.TclError, ValueError): messagebox.showerror("Error", self.lang.get_string('error_no_board')); return
-        if self.automation_engine and self.automation_engine.is_alive(): self._stop_engine()
-        self.automation_engine=AutomationEngine(self.controller, board_id, self.rules, self.log); self.automation_engine.start()
-        self.start_button.config(state=tk.DISABLED); self.stop_button.config(state=tk.NORMAL)
-        self.board_selector.config(state=tk.DISABLED); self.edit_rules_button.config(state=tk.DISABLED); self.load_rules_button.config(state=tk.DISABLED)
+        rules = self._collect_rules(board_id)
+        if not rules: messagebox.showwarning("Warning", self.lang.get_string('error_no_rules')); return
+        try: period_ms = int(self.scan_period_var.get())
+        except ValueError: period_ms = 0
+        if not MIN_SCAN_PERIOD_MS <= period_ms <= MAX_SCAN_PERIOD_MS: messagebox.showerror("Error", self.lang.get_string('error_scan_period').format(MIN_SCAN_PERIOD_MS, MAX_SCAN_PERIOD_MS)); return
+        if period_ms != self._load_scan_period(): self._save_scan_period(board_id, period_ms)
+        if self.automation_engine: self.automation_engine.stop(); self.automation_engine.join()   # The boards must be free for the new engine
+        engine_class = ProcessAutomationEngine if self.engine_process_var.get() else AutomationEngine
+        self.automation_engine=engine_class(self.controller, self.controller.get_connected_board_ids(), rules, self.log, period_ms / 1000.0); self.automation_engine.start()
+        self.start_button.config(state=tk.DISABLED); self.stop_button.config(state=tk.NORMAL); self.scan_period_spinbox.config(state=tk.DISABLED)
+        self.load_rules_button.config(state=tk.DISABLED); self.engine_process_check.config(state=tk.DISABLED)
+
+    def _save_engine_process_option(self):
+        config = configparser.ConfigParser(); config.read(CONFIG_FILE)
+        if not config.has_section('Engine'): config.add_section('Engine')
+        config.set('Engine', 'separate_process', 'yes' if self.engine_process_var.get() else 'no')
+        with open(CONFIG_FILE, 'w') as f: config.write(f)
 
     def _stop_engine(self):
         if self.automation_engine and self.automation_engine.is_alive(): self.automation_engine.stop()
-        self.start_button.config(state=tk.NORMAL); self.stop_button.config(state=tk.DISABLED)
-        self.board_selector.config(state=tk.NORMAL); self.edit_rules_button.config(state=tk.NORMAL); self.load_rules_button.config(state=tk.NORMAL)
+        self.start_button.config(state=tk.NORMAL); self.stop_button.config(state=tk.DISABLED); self.scan_period_spinbox.config(state=tk.NORMAL)
+        self.load_rules_button.config(state=tk.NORMAL); self.engine_process_check.config(state=tk.NORMAL)
 
     def _on_closing(self):
-        if self.automation_engine and self.automation_engine.is_alive():
-            self.automation_engine.stop(); self.automation_engine.join()
-        for _, board in self.controller.boards.items(): board.CloseDevice()
+        if self.automation_engine: self.automation_engine.stop(); self.automation_engine.join()
+        self.controller.stop_acquisition(); self.controller.stop_hotplug()
+        for _, board in self.controller.boards.items():
+            try: board.CloseDevice()
+            except IOError: pass
         self.destroy()
 
 # --- All other GUI classes (RuleEditor, ItemEditDialog, ConfigWindow) are unchanged ---
@@ -554,16 +1674,23 @@ class RuleEditDialog(Toplevel):
     def remove_item(self, listbox):
         sel = listbox.curselection();
         if sel: listbox.items.pop(sel[0]); listbox.delete(sel[0])
+    def io_label(self, item, port_key):
+        # I/O of the rule's own board by its translated name, I/O of another board as board:N/type:port
+        if 'ref' in item: return item['ref']
+        if 'board' in item: return f"board:{item['board']}/{item.get('type', '')}:{item[port_key]}"
+        return f"{self.lang.get_string(item.get('type', ''))} {item[port_key]}"
     def item_to_string(self, key, item):
-        item_type_key = item.get("type", "")
         if key == 'conditions':
-            port_type = self.lang.get_string(item_type_key); port_num = item['port']; op = item['operator']
+            op = item.get('operator', '==')
             val = self.lang.get_string('on') if item.get('state') == 1 else self.lang.get_string('off') if 'state' in item else item.get('value', '')
-            return f"IF {port_type} {port_num} {op} {val}"
+            conditioning = [f"{item['filter'].get('type')} {item['filter'].get('window', item['filter'].get('alpha', ''))}"] if isinstance(item.get('filter'), dict) else []
+            conditioning += [f"{self.lang.get_string(key).lower()} {item[key]}" for key in ('deadband', 'hysteresis') if item.get(key)]
+            measure = f" {item.get('measure', 'count')}" if item.get('type') == 'counter' else ""
+            return f"IF {self.io_label(item, 'port')}{measure} {op} {val}" + (f" ({', '.join(conditioning)})" if conditioning else "")
         if key == 'actions':
-            if item.get('action_type') == 'blink': return f"THEN {self.lang.get_string(item_type_key)} {item['output']} BLINK ({item['interval']}s, {item['duration']}s)"
-            if item.get('action_type') == 'latch_on': return f"THEN {self.lang.get_string(item_type_key)} {item['output']} LATCH ON"
-            return f"THEN {self.lang.get_string(item_type_key)} {item['output']} = {self.lang.get_string('on') if item.get('state') == 1 else self.lang.get_string('off')}"
+            if item.get('action_type') == 'blink': return f"THEN {self.io_label(item, 'output')} BLINK ({item['interval']}s, {item['duration']}s)"
+            if item.get('action_type') == 'latch_on': return f"THEN {self.io_label(item, 'output')} LATCH ON"
+            return f"THEN {self.io_label(item, 'output')} = {self.lang.get_string('on') if item.get('state') == 1 else self.lang.get_string('off')}"
         if key == 'delayed_actions': return f"AFTER {item.get('delay', 0)}s -> {len(item.get('actions',[]))} actions"
         return ""
     def save(self):
@@ -579,7 +1706,7 @@ class ItemEditDialog(Toplevel):
     def setup_condition_ui(self):
         self.title(self.lang.get_string('add_condition_title')); f = ttk.Frame(self, padding=10); f.pack()
         ttk.Label(f, text=f"{self.lang.get_string('type')}:").grid(row=0, column=0, sticky='w'); self.type_var = tk.StringVar(value='digital_in'); self.type_var.trace_add('write', self.on_cond_type_change)
-        ttk.Combobox(f, textvariable=self.type_var, values=['digital_in', 'analog_in', 'digital_out', 'analog_out'], state='readonly').grid(row=0, column=1)
+        ttk.Combobox(f, textvariable=self.type_var, values=['digital_in', 'analog_in', 'digital_out', 'analog_out', 'counter'], state='readonly').grid(row=0, column=1); self.create_board_selector(f)
         self.port_frame = ttk.Frame(f); self.port_frame.grid(row=1, column=0, columnspan=2, pady=5)
         self.state_frame = ttk.Frame(f); self.state_frame.grid(row=2, column=0, columnspan=2, pady=5)
         Button(f, text=self.lang.get_string('add'), command=self.save_condition).grid(row=3, column=1, pady=10); self.on_cond_type_change()
@@ -596,14 +1723,34 @@ class ItemEditDialog(Toplevel):
             ttk.Label(self.port_frame, text=f"{self.lang.get_string('input' if 'in' in cond_type else 'output')}:").grid(row=0, column=0); self.port_var = tk.IntVar(value=1); ttk.Combobox(self.port_frame, textvariable=self.port_var, values=ports, state='readonly', width=5).grid(row=0, column=1)
             ttk.Label(self.state_frame, text=f"{self.lang.get_string('operator')}:").grid(row=0, column=0); self.op_var = tk.StringVar(value='>'); ttk.Combobox(self.state_frame, textvariable=self.op_var, values=['>', '<', '=='], state='readonly', width=5).grid(row=0, column=1)
             ttk.Label(self.state_frame, text=f"{self.lang.get_string('value')}:").grid(row=0, column=2); self.val_var = tk.IntVar(value=128); ttk.Entry(self.state_frame, textvariable=self.val_var, width=5).grid(row=0, column=3)
+            if cond_type == 'analog_in':
+                # Input conditioning; an EMA takes its alpha from the window (2 / (window + 1))
+                ttk.Label(self.state_frame, text=f"{self.lang.get_string('filter')}:").grid(row=1, column=0); self.filter_var = tk.StringVar(value='none'); ttk.Combobox(self.state_frame, textvariable=self.filter_var, values=['none', 'moving_average', 'ema', 'median'], state='readonly', width=14).grid(row=1, column=1)
+                ttk.Label(self.state_frame, text=f"{self.lang.get_string('window')}:").grid(row=1, column=2); self.window_var = tk.IntVar(value=5); ttk.Entry(self.state_frame, textvariable=self.window_var, width=5).grid(row=1, column=3)
+                ttk.Label(self.state_frame, text=f"{self.lang.get_string('deadband')}:").grid(row=2, column=0); self.deadband_var = tk.IntVar(value=0); ttk.Entry(self.state_frame, textvariable=self.deadband_var, width=5).grid(row=2, column=1, sticky='w')
+                ttk.Label(self.state_frame, text=f"{self.lang.get_string('hysteresis')}:").grid(row=2, column=2); self.hysteresis_var = tk.IntVar(value=0); ttk.Entry(self.state_frame, textvariable=self.hysteresis_var, width=5).grid(row=2, column=3)
+        elif cond_type == 'counter':
+            # Count (64-bit total), rate (pulses/min) or frequency (Hz) over a window of the last seconds
+            ttk.Label(self.port_frame, text=f"{self.lang.get_string('counter')}:").grid(row=0, column=0); self.port_var = tk.IntVar(value=1); ttk.Combobox(self.port_frame, textvariable=self.port_var, values=[1, 2], state='readonly', width=5).grid(row=0, column=1)
+            ttk.Label(self.port_frame, text=f"{self.lang.get_string('measure')}:").grid(row=0, column=2); self.measure_var = tk.StringVar(value='count'); ttk.Combobox(self.port_frame, textvariable=self.measure_var, values=['count', 'rate', 'frequency'], state='readonly', width=10).grid(row=0, column=3)
+            ttk.Label(self.state_frame, text=f"{self.lang.get_string('operator')}:").grid(row=0, column=0); self.op_var = tk.StringVar(value='>'); ttk.Combobox(self.state_frame, textvariable=self.op_var, values=['>', '<', '=='], state='readonly', width=5).grid(row=0, column=1)
+            ttk.Label(self.state_frame, text=f"{self.lang.get_string('value')}:").grid(row=0, column=2); self.val_var = tk.DoubleVar(value=100); ttk.Entry(self.state_frame, textvariable=self.val_var, width=8).grid(row=0, column=3)
+            ttk.Label(self.state_frame, text=self.lang.get_string('window_sec')).grid(row=1, column=0); self.window_var = tk.DoubleVar(value=COUNTER_RATE_WINDOW_S); ttk.Entry(self.state_frame, textvariable=self.window_var, width=5).grid(row=1, column=1, sticky='w')
     def save_condition(self):
         cond_type = self.type_var.get()
         if 'digital' in cond_type: self.result_item = {'type': cond_type, 'port': self.port_var.get(), 'state': 1 if self.state_var.get() == self.lang.get_string('on') else 0, 'operator': '=='}
         else: self.result_item = {'type': cond_type, 'port': self.port_var.get(), 'operator': self.op_var.get(), 'value': self.val_var.get()}
-        self.destroy()
+        if cond_type == 'counter':
+            self.result_item['measure'] = self.measure_var.get()
+            if self.measure_var.get() != 'count': self.result_item['window'] = self.window_var.get()
+        if cond_type == 'analog_in':
+            if self.filter_var.get() != 'none': self.result_item['filter'] = {'type': self.filter_var.get(), 'window': max(1, min(FILTER_MAX_WINDOW, self.window_var.get()))}
+            if self.deadband_var.get() > 0: self.result_item['deadband'] = self.deadband_var.get()
+            if self.hysteresis_var.get() > 0: self.result_item['hysteresis'] = self.hysteresis_var.get()
+        self.apply_board(self.result_item); self.destroy()
     def setup_action_ui(self):
         self.title(self.lang.get_string('add_action_title')); f = ttk.Frame(self, padding=10); f.pack()
-        ttk.Label(f, text=f"{self.lang.get_string('type')}:").grid(row=0, column=0, sticky='w'); self.type_var = tk.StringVar(value='digital_out'); self.type_var.trace_add('write', self.on_action_port_type_change); ttk.Combobox(f, textvariable=self.type_var, values=['digital_out', 'analog_out'], state='readonly').grid(row=0, column=1)
+        ttk.Label(f, text=f"{self.lang.get_string('type')}:").grid(row=0, column=0, sticky='w'); self.type_var = tk.StringVar(value='digital_out'); self.type_var.trace_add('write', self.on_action_port_type_change); ttk.Combobox(f, textvariable=self.type_var, values=['digital_out', 'analog_out'], state='readonly').grid(row=0, column=1); self.create_board_selector(f)
         self.digital_action_frame = ttk.Frame(f); self.digital_action_frame.grid(row=1, column=0, columnspan=4, pady=5)
         self.analog_action_frame = ttk.Frame(f); self.analog_action_frame.grid(row=1, column=0, columnspan=4, pady=5)
         Button(f, text=self.lang.get_string('add'), command=self.save_action).grid(row=4, column=1, columnspan=2, pady=10); self.on_action_port_type_change()
@@ -642,7 +1789,13 @@ class ItemEditDialog(Toplevel):
             if action_mode == 'set_state': self.result_item['state'] = 1 if self.state_var.get() == self.lang.get_string('on') else 0
             elif action_mode == 'blink': self.result_item.update({'interval': self.interval_var.get(), 'duration': self.duration_var.get()})
         else: self.result_item.update({'output': self.output_var.get(), 'value': self.val_var.get()})
-        self.destroy()
+        self.apply_board(self.result_item); self.destroy()
+    def create_board_selector(self, parent):
+        # Conditions and actions address the rule's own board unless another board is picked here
+        ttk.Label(parent, text=f"{self.lang.get_string('board')}:").grid(row=0, column=2, sticky='w', padx=(10,2)); self.board_var = tk.StringVar(value=self.lang.get_string('this_board'))
+        ttk.Combobox(parent, textvariable=self.board_var, values=[self.lang.get_string('this_board'), '0', '1', '2', '3'], state='readonly', width=12).grid(row=0, column=3)
+    def apply_board(self, item):
+        if self.board_var.get().isdigit(): item['board'] = int(self.board_var.get())
     def setup_delayed_action_ui(self):
         self.title(self.lang.get_string('add_delayed_action_title')); f = ttk.Frame(self, padding=10); f.pack()
         ttk.Label(f, text=f"{self.lang.get_string('delay_sec')}:").grid(row=0, column=0); self.delay_var = tk.DoubleVar(value=1.0); ttk.Entry(f, textvariable=self.delay_var, width=5).grid(row=0, column=1)
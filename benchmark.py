@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for pyk8055 and the automation engine.
+
+Measures
+  * the latency of each pyk8055 API call (percentiles over many calls),
+    with the USB transfers per call and the transfer time reported by
+    the library's transfer statistics,
+  * the scan time of AutomationEngine for rule sets of 10 to 10,000 rules,
+
+and writes everything as JSON so results can be compared between releases.
+
+Runs on the simulated board by default, so no hardware is needed. The
+simulator replaces libk8055 and the USB transfers with Python, so its
+call latencies say nothing about the binding; use --backend usb for those.
+
+    python3 benchmark.py                          # simulator, default sizes
+    python3 benchmark.py --backend usb --address 0 -o results.json
+    python3 benchmark.py --sim-latency-ms 1 --sim-jitter-ms 0.2 --rules 10,1000
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+
+def percentiles(samples_ns):
+    """Summary of a list of durations (ns) in microseconds."""
+    ordered = sorted(samples_ns)
+    def pct(p): return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))] / 1000.0
+    return {'count': len(ordered), 'mean_us': sum(ordered) / len(ordered) / 1000.0, 'min_us': ordered[0] / 1000.0,
+            'p50_us': pct(50), 'p90_us': pct(90), 'p99_us': pct(99), 'p999_us': pct(99.9), 'max_us': ordered[-1] / 1000.0}
+
+
+def histogram_percentile(histogram, limits, p):
+    # Upper bound of the latency_histogram bucket holding the p-th percentile
+    total = sum(histogram)
+    if not total: return None
+    rank, seen = p / 100.0 * total, 0
+    for count, limit in zip(histogram, limits):
+        seen += count
+        if seen >= rank: return None if limit == float('inf') else float(limit)
+    return None
+
+
+def time_calls(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns(); fn(); samples.append(time.perf_counter_ns() - start)
+    return samples
+
+
+def bench_calls(pyk8055, board, iterations):
+    """Per-call latency of the pyk8055 API, with the USB share taken from GetStats()."""
+    calls = {
+        'ReadSnapshot': lambda: board.ReadSnapshot(),
+        'ReadAllValues': board.ReadAllValues,
+        'ReadAllDigital': board.ReadAllDigital,
+        'ReadDigitalChannel': lambda: board.ReadDigitalChannel(1),
+        'ReadAnalogChannel': lambda: board.ReadAnalogChannel(1),
+        'ReadCounter': lambda: board.ReadCounter(1),
+        'SetAllValues': lambda: board.SetAllValues(0x55, 128, 64),
+        'WriteAllDigital': lambda: board.WriteAllDigital(0xAA),
+        'SetDigitalChannel': lambda: board.SetDigitalChannel(1),
+        'OutputAnalogChannel': lambda: board.OutputAnalogChannel(1, 200),
+        # Answered from the cached snapshot: no transfer, only the cost of the call itself
+        'ReadSnapshot (cached)': lambda: board.ReadSnapshot(max_age_ms=3600 * 1000),
+    }
+    results = {}
+    board.ReadSnapshot()
+    for name, fn in calls.items():
+        fn(); board.ResetStats()
+        samples = time_calls(fn, iterations)
+        stats = board.GetStats()
+        transfers = stats['reads'] + stats['writes'] + stats['read_retries'] + stats['write_retries'] + stats['read_failures'] + stats['write_failures']
+        result = percentiles(samples)
+        result['transfers_per_call'] = transfers / iterations
+        result['usb_transfer_us'] = {f'p{p}_upper_bound': histogram_percentile(stats['latency_histogram'], pyk8055.LATENCY_BUCKET_LIMITS_US, p) for p in (50, 90, 99)}
+        results[name] = result
+    board.SetAllValues(0, 0, 0)
+    return results
+
+
+def make_rules(count, rng):
+    """A synthetic rule set mixing every condition and action type of the rule editor."""
+    rules = []
+    for i in range(count):
+        conditions = []
+        for _ in range(rng.randint(1, 3)):
+            kind = rng.choice(('digital_in', 'analog_in', 'digital_out'))
+            if kind == 'analog_in': conditions.append({'type': kind, 'port': rng.randint(1, 2), 'operator': rng.choice(('>', '<', '==')), 'value': rng.randint(0, 255)})
+            else: conditions.append({'type': kind, 'port': rng.randint(1, 5 if kind == 'digital_in' else 8), 'state': rng.randint(0, 1)})
+        if rng.random() < 0.7: action = {'type': 'digital_out', 'action_type': rng.choice(('set_state', 'set_state', 'latch_on')), 'output': rng.randint(1, 8), 'state': rng.randint(0, 1)}
+        else: action = {'type': 'analog_out', 'output': rng.randint(1, 2), 'value': rng.randint(0, 255)}
+        rules.append({'name': f'bench rule {i}', 'enabled': rng.random() > 0.05, 'conditions_logic': rng.choice(('AND', 'OR')),
+                      'conditions': conditions, 'actions': [action], 'delayed_actions': []})
+    return rules
+
+
+def bench_engine(automation_app, board_id, rule_counts, scans, sim_board, rng, change_prob=1.0):
+    """Scan-time distribution of AutomationEngine.scan_once() per rule-set size."""
+    controller = automation_app.K8055Controller(lambda message: None)
+    controller.scan_for_boards(quiet=True)
+    if board_id not in controller.boards: raise SystemExit(f"Board {board_id} could not be opened for the engine benchmark.")
+    results = {}
+    for count in rule_counts:
+        engine = automation_app.AutomationEngine(controller, board_id, make_rules(count, rng), lambda message: None)
+        samples = []
+        for _ in range(scans):
+            # Changing inputs (with probability change_prob per scan) so rules keep toggling
+            if sim_board is not None and rng.random() < change_prob: sim_board.set_inputs(digital=rng.randint(0, 31), analog1=rng.randint(0, 255), analog2=rng.randint(0, 255))
+            start = time.perf_counter_ns()
+            if not engine.scan_once(): raise SystemExit(f"Engine scan failed on board {board_id}.")
+            samples.append(time.perf_counter_ns() - start)
+        results[str(count)] = percentiles(samples)
+        results[str(count)]['per_rule_p50_us'] = results[str(count)]['p50_us'] / count
+    controller.set_outputs(board_id, 0, 0, 0); controller.flush_outputs(board_id, force=True)
+    for board in controller.boards.values(): board.CloseDevice()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pyk8055 calls and AutomationEngine scans.")
+    parser.add_argument('--backend', choices=('sim', 'usb'), default='sim', help="board backend (default: sim)")
+    parser.add_argument('--address', type=int, default=0, help="board address 0-3 (default: 0)")
+    parser.add_argument('--iterations', type=int, default=1000, help="calls per pyk8055 function (default: 1000)")
+    parser.add_argument('--rules', default='10,100,1000,10000', help="comma-separated rule-set sizes (default: 10,100,1000,10000)")
+    parser.add_argument('--scans', type=int, default=200, help="engine scans per rule-set size (default: 200)")
+    parser.add_argument('--sim-latency-ms', type=float, default=None, help="simulated transfer latency")
+    parser.add_argument('--sim-jitter-ms', type=float, default=None, help="simulated transfer jitter")
+    parser.add_argument('--input-change-prob', type=float, default=1.0, help="chance per engine scan that the simulated inputs change (default: 1.0)")
+    parser.add_argument('--seed', type=int, default=8055, help="seed for the synthetic rules and inputs")
+    parser.add_argument('--skip-calls', action='store_true', help="skip the pyk8055 call benchmark")
+    parser.add_argument('--skip-engine', action='store_true', help="skip the engine scan benchmark")
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help="JSON results file ('-' for stdout)")
+    args = parser.parse_args()
+
+    # The backend is chosen through the environment so that K8055Controller picks it up unchanged
+    os.environ['K8055_BACKEND'] = args.backend
+    if args.backend == 'sim':
+        os.environ['K8055_SIM_BOARDS'] = str(args.address)
+        if args.sim_latency_ms is not None: os.environ['K8055_SIM_LATENCY_MS'] = str(args.sim_latency_ms)
+        if args.sim_jitter_ms is not None: os.environ['K8055_SIM_JITTER_MS'] = str(args.sim_jitter_ms)
+    import pyk8055
+    rng = random.Random(args.seed)
+    sim_board = None
+    if args.backend == 'sim':
+        import k8055sim
+        sim_board = k8055sim.default_backend().board(args.address)
+
+    results = {'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'pyk8055_version': pyk8055.Version(),
+                        'python': sys.version.split()[0], 'platform': platform.platform(), 'backend': args.backend,
+                        'address': args.address, 'iterations': args.iterations, 'scans': args.scans, 'seed': args.seed, 'input_change_prob': args.input_change_prob,
+                        'sim_latency_ms': os.environ.get('K8055_SIM_LATENCY_MS'), 'sim_jitter_ms': os.environ.get('K8055_SIM_JITTER_MS')}}
+    if args.backend == 'sim':
+        results['meta']['note'] = "simulated board: call latencies are those of k8055sim (Python), not of the pyk8055 binding or USB"
+    if not args.skip_calls:
+        print(f"Benchmarking pyk8055 calls on board {args.address} ({args.backend})...", file=sys.stderr)
+        if args.backend == 'sim': print("  (simulated board: not representative of the binding or USB)", file=sys.stderr)
+        board = pyk8055.k8055(args.address)
+        try: results['calls'] = bench_calls(pyk8055, board, args.iterations)
+        finally: board.CloseDevice()
+        for name, r in results['calls'].items():
+            print(f"  {name:24s} p50 {r['p50_us']:9.1f} us  p99 {r['p99_us']:9.1f} us  transfers/call {r['transfers_per_call']:.2f}", file=sys.stderr)
+    if not args.skip_engine:
+        import automation_app
+        rule_counts = [int(n) for n in args.rules.split(',') if n.strip()]
+        print(f"Benchmarking engine scans for {rule_counts} rules...", file=sys.stderr)
+        results['engine'] = bench_engine(automation_app, args.address, rule_counts, args.scans, sim_board, rng, args.input_change_prob)
+        for count, r in results['engine'].items():
+            print(f"  {count:>6s} rules  p50 {r['p50_us']:10.1f} us  p99 {r['p99_us']:10.1f} us  max {r['max_us']:10.1f} us", file=sys.stderr)
+
+    if args.output == '-': json.dump(results, sys.stdout, indent=2); print()
+    else:
+        with open(args.output, 'w') as f: json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -25,6 +25,7 @@
 #include <jni.h>
 #ifdef USE_VELLEMAN_DLL
     // assumes that Velleman DLL Version 2 has been installed
+    #include <windows.h>
     #define bool int
     #include <K8055D_C.h> 
 #else
@@ -32,6 +33,7 @@
     #include <k8055.h> 
 #endif 
 #include <stdio.h>
+#include <stdint.h>
 #include "jk8055.h"
 
 #define K8055_ERROR -1
@@ -396,3 +398,215 @@ JNICALL Java_net_sf_libk8055_jk8055_JK8055_CVersion
 	    return (*env)->NewStringUTF( env, Version() );
 	#endif 
 }
+
+/*
+ * Handle based API used by class JK8055Board.
+ *
+ * Every call is bound to one board and moves all inputs or all outputs
+ * with a single JNI crossing and a single USB transfer. Nothing is
+ * allocated on the Java heap except for the error text.
+ *
+ * The Velleman DLL has no device handles; there the handle is the card
+ * address + 1 and each call first selects the card. As the DLL only knows
+ * one current card, every JK8055Board call on that path (select the card,
+ * then one DLL call and transfer per value) holds dll_lock, so calls from
+ * several threads are serialised instead of reaching the wrong card.
+ */
+
+/* Layout of the snapshot buffer, see JK8055Board.OFFSET_* */
+struct jk8055_snapshot {
+	jint digital;
+	jint analog1;
+	jint analog2;
+	jint counter1;
+	jint counter2;
+	jint reserved;
+	jdouble timestamp;
+};
+
+#ifdef USE_VELLEMAN_DLL
+static CRITICAL_SECTION dll_lock;
+
+JNIEXPORT jint JNICALL JNI_OnLoad( JavaVM* vm, void* reserved )
+{
+	InitializeCriticalSection( &dll_lock );
+	return JNI_VERSION_1_4;
+}
+
+/* Caller holds dll_lock */
+static int read_current_card( jlong handle, struct jk8055_snapshot* snap )
+{
+	long analog1, analog2;
+	if( SetCurrentDevice( (long) handle - 1 ) == K8055_ERROR ) return K8055_ERROR;
+	snap->digital = ReadAllDigital();
+	if( snap->digital == K8055_ERROR ) return K8055_ERROR;
+	if( ReadAllAnalog( &analog1, &analog2 ) == K8055_ERROR ) return K8055_ERROR;
+	snap->counter1 = ReadCounter( 1 );
+	if( snap->counter1 == K8055_ERROR ) return K8055_ERROR;
+	snap->counter2 = ReadCounter( 2 );
+	if( snap->counter2 == K8055_ERROR ) return K8055_ERROR;
+	snap->analog1 = (jint) analog1;
+	snap->analog2 = (jint) analog2;
+	snap->reserved = 0;
+	snap->timestamp = 0.0;
+	return 0;
+}
+
+static int read_snapshot( jlong handle, struct jk8055_snapshot* snap )
+{
+	int retval;
+	EnterCriticalSection( &dll_lock );
+	retval = read_current_card( handle, snap );
+	LeaveCriticalSection( &dll_lock );
+	return retval;
+}
+#else
+static int read_snapshot( jlong handle, jint max_age_ms, struct jk8055_snapshot* snap )
+{
+	struct k8055_snapshot s;
+	if( k8055_read_snapshot( (struct k8055_dev*) (intptr_t) handle, &s, max_age_ms ) == K8055_ERROR ) {
+		return K8055_ERROR;
+	}
+	snap->digital = (jint) s.digital;
+	snap->analog1 = (jint) s.analog1;
+	snap->analog2 = (jint) s.analog2;
+	snap->counter1 = (jint) s.counter1;
+	snap->counter2 = (jint) s.counter2;
+	snap->reserved = 0;
+	snap->timestamp = s.timestamp;
+	return 0;
+}
+#endif
+
+/*
+ * Class:     net_sf_libk8055_jk8055_JK8055Board
+ * Method:    COpen
+ * Signature: (I)J
+ */
+JNIEXPORT jlong
+JNICALL Java_net_sf_libk8055_jk8055_JK8055Board_COpen
+(JNIEnv* env, jclass cls, jint cardAddress)
+{
+    #ifdef USE_VELLEMAN_DLL
+        int retval;
+        EnterCriticalSection( &dll_lock );
+        retval = OpenDevice( cardAddress );
+        LeaveCriticalSection( &dll_lock );
+        if( retval == K8055_ERROR ) return 0;
+        return (jlong) cardAddress + 1;
+    #else
+        return (jlong) (intptr_t) k8055_open( cardAddress );
+    #endif
+}
+
+/*
+ * Class:     net_sf_libk8055_jk8055_JK8055Board
+ * Method:    CClose
+ * Signature: (J)I
+ */
+JNIEXPORT jint
+JNICALL Java_net_sf_libk8055_jk8055_JK8055Board_CClose
+(JNIEnv* env, jclass cls, jlong handle)
+{
+    #ifdef USE_VELLEMAN_DLL
+        int retval = K8055_ERROR;
+        EnterCriticalSection( &dll_lock );
+        if( SetCurrentDevice( (long) handle - 1 ) != K8055_ERROR ) {
+            CloseDevice();
+            retval = 0;
+        }
+        LeaveCriticalSection( &dll_lock );
+        return retval;
+    #else
+        return k8055_close( (struct k8055_dev*) (intptr_t) handle ) < 0 ? K8055_ERROR : 0;
+    #endif
+}
+
+/*
+ * Class:     net_sf_libk8055_jk8055_JK8055Board
+ * Method:    CReadSnapshot
+ * Signature: (JLjava/nio/ByteBuffer;I)I
+ */
+JNIEXPORT jint
+JNICALL Java_net_sf_libk8055_jk8055_JK8055Board_CReadSnapshot
+(JNIEnv* env, jclass cls, jlong handle, jobject buffer, jint maxAgeMs)
+{
+	struct jk8055_snapshot* snap;
+
+	snap = (struct jk8055_snapshot*) (*env)->GetDirectBufferAddress( env, buffer );
+	if( snap == NULL ) return K8055_ERROR;
+	if( (*env)->GetDirectBufferCapacity( env, buffer ) < (jlong) sizeof( *snap ) ) return K8055_ERROR;
+    #ifdef USE_VELLEMAN_DLL
+        return read_snapshot( handle, snap );
+    #else
+        return read_snapshot( handle, maxAgeMs, snap );
+    #endif
+}
+
+/*
+ * Class:     net_sf_libk8055_jk8055_JK8055Board
+ * Method:    CReadSnapshotValues
+ * Signature: (J[II)I
+ */
+JNIEXPORT jint
+JNICALL Java_net_sf_libk8055_jk8055_JK8055Board_CReadSnapshotValues
+(JNIEnv* env, jclass cls, jlong handle, jintArray values, jint maxAgeMs)
+{
+	struct jk8055_snapshot snap;
+	jint v[5];
+	int retval;
+
+    #ifdef USE_VELLEMAN_DLL
+        retval = read_snapshot( handle, &snap );
+    #else
+        retval = read_snapshot( handle, maxAgeMs, &snap );
+    #endif
+	if( retval == K8055_ERROR ) return retval;
+	v[0] = snap.digital;
+	v[1] = snap.analog1;
+	v[2] = snap.analog2;
+	v[3] = snap.counter1;
+	v[4] = snap.counter2;
+	(*env)->SetIntArrayRegion( env, values, 0, 5, v );
+	return (*env)->ExceptionCheck( env ) ? K8055_ERROR : 0;
+}
+
+/*
+ * Class:     net_sf_libk8055_jk8055_JK8055Board
+ * Method:    CWriteAll
+ * Signature: (JIII)I
+ */
+JNIEXPORT jint
+JNICALL Java_net_sf_libk8055_jk8055_JK8055Board_CWriteAll
+(JNIEnv* env, jclass cls, jlong handle, jint digitaldata, jint analogdata1, jint analogdata2)
+{
+    #ifdef USE_VELLEMAN_DLL
+        int retval = K8055_ERROR;
+        EnterCriticalSection( &dll_lock );
+        if( SetCurrentDevice( (long) handle - 1 ) != K8055_ERROR &&
+            WriteAllDigital( digitaldata ) != K8055_ERROR ) {
+            retval = OutputAllAnalog( analogdata1, analogdata2 );
+        }
+        LeaveCriticalSection( &dll_lock );
+        return retval;
+    #else
+        return k8055_write_all( (struct k8055_dev*) (intptr_t) handle,
+                                digitaldata, analogdata1, analogdata2 ) < 0 ? K8055_ERROR : 0;
+    #endif
+}
+
+/*
+ * Class:     net_sf_libk8055_jk8055_JK8055Board
+ * Method:    CLastError
+ * Signature: (J)Ljava/lang/String;
+ */
+JNIEXPORT jstring
+JNICALL Java_net_sf_libk8055_jk8055_JK8055Board_CLastError
+(JNIEnv* env, jclass cls, jlong handle)
+{
+    #ifdef USE_VELLEMAN_DLL
+        return (*env)->NewStringUTF( env, "" );
+    #else
+        return (*env)->NewStringUTF( env, k8055_last_error( (struct k8055_dev*) (intptr_t) handle ) );
+    #endif
+}
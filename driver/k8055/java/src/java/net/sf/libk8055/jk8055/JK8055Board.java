@@ -0,0 +1,298 @@
+/*
+ * This file (JK8055Board.java) is part of libk8055/jk8055.
+ * jk8055 - a java wrapper for libk8055
+ *
+ * libk8055/jk8055 is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA.
+ *
+ */
+
+package net.sf.libk8055.jk8055;
+
+import java.nio.ByteBuffer;
+import java.nio.ByteOrder;
+
+/**
+ * One K8055 board, bound to its own libk8055 device handle.
+ * <p>
+ * Unlike the {@link JK8055} singleton, which addresses whichever board
+ * was selected last, each JK8055Board talks to exactly one board, so
+ * several boards can be polled from several threads at once without
+ * SetCurrentDevice() and without a global lock.
+ * <p>
+ * All inputs are read with one JNI call and one USB transfer into a
+ * caller-owned buffer, and all outputs are written with one call, so a
+ * polling loop allocates nothing:
+ * <pre>
+ * JK8055Board board = new JK8055Board( 0 );
+ * ByteBuffer snap = JK8055Board.allocateSnapshotBuffer();
+ * while( running ) {
+ *     board.ReadSnapshot( snap, 0 );
+ *     int inputs = snap.getInt( JK8055Board.OFFSET_DIGITAL );
+ *     board.SetAllValues( inputs, 0, 0 );
+ * }
+ * board.CloseDevice();
+ * </pre>
+ * <p>
+ * Built against Velleman's Windows DLL (USE_VELLEMAN_DLL) instead of
+ * libk8055, there are no device handles: the DLL only has a current card.
+ * There every call selects its card and then reads or writes one value
+ * per DLL call, so a snapshot takes several USB transfers, and the calls
+ * of all boards are serialised by one lock in the native code.
+ *
+ * @see <a href="http://libk8055.sourceforge.net/">http://libk8055.sourceforge.net/</a>
+ */
+public class JK8055Board {
+
+	public static final int K8055_ERROR = -1;
+
+	/** Byte offset of the digital inputs (int, bit 0 = input 1) in a snapshot buffer. */
+	public static final int OFFSET_DIGITAL = 0;
+	/** Byte offset of analog input 1 (int, 0..255) in a snapshot buffer. */
+	public static final int OFFSET_ANALOG1 = 4;
+	/** Byte offset of analog input 2 (int, 0..255) in a snapshot buffer. */
+	public static final int OFFSET_ANALOG2 = 8;
+	/** Byte offset of counter 1 (int) in a snapshot buffer. */
+	public static final int OFFSET_COUNTER1 = 12;
+	/** Byte offset of counter 2 (int) in a snapshot buffer. */
+	public static final int OFFSET_COUNTER2 = 16;
+	/**
+	 * Byte offset of the arrival time of the input packet (double, seconds
+	 * of the monotonic clock; 0 with the Velleman DLL) in a snapshot buffer.
+	 */
+	public static final int OFFSET_TIMESTAMP = 24;
+	/** Size in bytes of a snapshot buffer. */
+	public static final int SNAPSHOT_SIZE = 32;
+
+	/** Index of each input in the int[] form of ReadSnapshot. */
+	public static final int DIGITAL = 0, ANALOG1 = 1, ANALOG2 = 2,
+	                        COUNTER1 = 3, COUNTER2 = 4;
+	/** Length of the int[] form of ReadSnapshot. */
+	public static final int VALUES = 5;
+
+	static {
+		System.loadLibrary("jk8055");
+	}
+
+	private final int address;
+	private volatile long handle;
+
+	/**
+	 * Allocate a direct buffer in the layout ReadSnapshot(ByteBuffer,int)
+	 * fills. Allocate it once and reuse it for every read.
+	 * @return a direct buffer of SNAPSHOT_SIZE bytes in native byte order
+	 */
+	public static ByteBuffer allocateSnapshotBuffer() {
+		return ByteBuffer.allocateDirect( SNAPSHOT_SIZE ).order( ByteOrder.nativeOrder() );
+	}
+
+	/**
+	 * @param cardAddress 0..3
+	 * @return device handle or 0
+	 */
+	private static native long COpen( int cardAddress );
+
+	/**
+	 * @param handle
+	 * @return 0 or K8055_ERROR
+	 */
+	private static native int CClose( long handle );
+
+	/**
+	 * @param handle
+	 * @param buffer direct buffer of at least SNAPSHOT_SIZE bytes
+	 * @param maxAgeMs
+	 * @return 0 or K8055_ERROR
+	 */
+	private static native int CReadSnapshot( long handle, ByteBuffer buffer, int maxAgeMs );
+
+	/**
+	 * @param handle
+	 * @param values array of at least VALUES ints
+	 * @param maxAgeMs
+	 * @return 0 or K8055_ERROR
+	 */
+	private static native int CReadSnapshotValues( long handle, int[] values, int maxAgeMs );
+
+	/**
+	 * @param handle
+	 * @param digitaldata 0..255
+	 * @param analogdata1 0..255
+	 * @param analogdata2 0..255
+	 * @return 0 or K8055_ERROR
+	 */
+	private static native int CWriteAll( long handle, int digitaldata,
+	                                     int analogdata1, int analogdata2 );
+
+	/**
+	 * @param handle
+	 * @return reason of the last failure, may be empty
+	 */
+	private static native String CLastError( long handle );
+
+	/**
+	 * Open the board at the given address.
+	 *
+	 * @param cardAddress Value between 0 and 3 which corresponds to the
+	 *                    jumper (SK5, SK6) setting on the K8055 board.
+	 * @throws JK8055Exception indicates that the board was not found or
+	 *                         could not be accessed.
+	 * @throws IllegalArgumentException indicates an invalid address.
+	 */
+	public JK8055Board( int cardAddress )
+	throws JK8055Exception
+	{
+		if( cardAddress<0 || 3<cardAddress ) {
+			throw new IllegalArgumentException( "cardAddress: "+cardAddress );
+		}
+		this.address = cardAddress;
+		this.handle = COpen( cardAddress );
+		if( this.handle == 0 ) {
+			throw new JK8055Exception( "OpenDevice("+cardAddress+") failed" );
+		}
+	}
+
+	private long handle()
+	throws JK8055Exception
+	{
+		long h = handle;
+		if( h == 0 ) {
+			throw new JK8055Exception( "Board "+address+" is not open" );
+		}
+		return h;
+	}
+
+	private JK8055Exception failure( long h, String what ) {
+		String reason = CLastError( h );
+		return new JK8055Exception( "Board "+address+": "+what+" failed"
+		                            +( reason.length()>0 ? " ("+reason+")" : "" ) );
+	}
+
+	/**
+	 * @return the address (0..3) of this board
+	 */
+	public int getAddress() {
+		return address;
+	}
+
+	/**
+	 * @return true until CloseDevice() is called
+	 */
+	public boolean isOpen() {
+		return handle != 0;
+	}
+
+	/**
+	 * Close the board. Further calls throw JK8055Exception.
+	 *
+	 * @throws JK8055Exception indicates an error.
+	 */
+	public synchronized void CloseDevice()
+	throws JK8055Exception
+	{
+		long h = handle;
+		if( h == 0 ) {
+			return;
+		}
+		handle = 0;
+		if( CClose( h ) == K8055_ERROR ) {
+			throw failure( h, "CloseDevice" );
+		}
+	}
+
+	/**
+	 * Read all inputs with a single USB transfer into a direct buffer.
+	 * The values are stored at the OFFSET_* positions in native byte
+	 * order, see allocateSnapshotBuffer(). The buffer's position and
+	 * limit are not changed.
+	 *
+	 * @param buffer   direct buffer of at least SNAPSHOT_SIZE bytes.
+	 * @param maxAgeMs if the last snapshot of this board is at most this
+	 *                 old it is returned without a USB transfer; 0 always
+	 *                 reads the board.
+	 * @throws JK8055Exception indicates an error.
+	 * @throws IllegalArgumentException indicates an unusable buffer.
+	 */
+	public void ReadSnapshot( ByteBuffer buffer, int maxAgeMs )
+	throws JK8055Exception
+	{
+		if( !buffer.isDirect() || buffer.capacity()<SNAPSHOT_SIZE ) {
+			throw new IllegalArgumentException( "buffer must be direct and hold "+SNAPSHOT_SIZE+" bytes" );
+		}
+		long h = handle();
+		if( CReadSnapshot( h, buffer, Math.max( 0, maxAgeMs ) ) == K8055_ERROR ) {
+			throw failure( h, "ReadSnapshot" );
+		}
+	}
+
+	/**
+	 * Read all inputs with a single USB transfer into an int array,
+	 * indexed by DIGITAL, ANALOG1, ANALOG2, COUNTER1 and COUNTER2.
+	 *
+	 * @param values   array of at least VALUES ints.
+	 * @param maxAgeMs see ReadSnapshot(ByteBuffer,int).
+	 * @throws JK8055Exception indicates an error.
+	 * @throws IllegalArgumentException indicates a too short array.
+	 */
+	public void ReadSnapshot( int[] values, int maxAgeMs )
+	throws JK8055Exception
+	{
+		if( values.length<VALUES ) {
+			throw new IllegalArgumentException( "values must hold "+VALUES+" ints" );
+		}
+		long h = handle();
+		if( CReadSnapshotValues( h, values, Math.max( 0, maxAgeMs ) ) == K8055_ERROR ) {
+			throw failure( h, "ReadSnapshot" );
+		}
+	}
+
+	/**
+	 * Set all outputs at once, with a single USB transfer.
+	 *
+	 * @param digitaldata 0..255, bit 0 = digital output 1
+	 * @param analogdata1 0..255
+	 * @param analogdata2 0..255
+	 * @throws JK8055Exception indicates an error.
+	 * @throws IllegalArgumentException indicates an invalid parameter.
+	 */
+	public void SetAllValues( int digitaldata, int analogdata1, int analogdata2 )
+	throws JK8055Exception
+	{
+		if( digitaldata<0 || 255<digitaldata ) {
+			throw new IllegalArgumentException( "digitaldata: "+digitaldata );
+		}
+		if( analogdata1<0 || 255<analogdata1 ) {
+			throw new IllegalArgumentException( "analogdata1: "+analogdata1 );
+		}
+		if( analogdata2<0 || 255<analogdata2 ) {
+			throw new IllegalArgumentException( "analogdata2: "+analogdata2 );
+		}
+		long h = handle();
+		if( CWriteAll( h, digitaldata, analogdata1, analogdata2 ) == K8055_ERROR ) {
+			throw failure( h, "SetAllValues" );
+		}
+	}
+
+	/* (non-Javadoc)
+	 * @see java.lang.Object#finalize()
+	 */
+	protected void finalize() throws Throwable {
+		try {
+			CloseDevice();
+		} finally {
+			super.finalize();
+		}
+	}
+
+}
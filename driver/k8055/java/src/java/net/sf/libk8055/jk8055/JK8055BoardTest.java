@@ -0,0 +1,112 @@
+/*
+ * This file (JK8055BoardTest.java) is part of libk8055/jk8055.
+ * jk8055 - a java wrapper for libk8055
+ *
+ * libk8055/jk8055 is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA.
+ *
+ */
+
+package net.sf.libk8055.jk8055;
+
+import java.nio.ByteBuffer;
+
+import junit.framework.TestCase;
+
+/**
+ * JUnit tests for class JK8055Board.
+ *
+ * If you want to run this from eclipse add
+ *   -Djava.library.path=build/c
+ * to VM arguments in run configuration.
+ */
+public class JK8055BoardTest extends TestCase {
+
+	public static final int DEVICE = 0;
+
+	public void testOpenCloseDevice() throws JK8055Exception {
+		JK8055Board board = new JK8055Board( DEVICE );
+		assertEquals( DEVICE, board.getAddress() );
+		assertTrue( board.isOpen() );
+		board.CloseDevice();
+		assertFalse( board.isOpen() );
+		try {
+			board.SetAllValues( 0, 0, 0 );
+			fail( "closed board accepted a write" );
+		} catch( JK8055Exception e ) {
+			// expected
+		}
+	}
+
+	public void testReadSnapshotBuffer() throws JK8055Exception {
+		JK8055Board board = new JK8055Board( DEVICE );
+		ByteBuffer snap = JK8055Board.allocateSnapshotBuffer();
+		for (int i = 0; i < 100; i++) {
+			board.ReadSnapshot( snap, 0 );
+			int d = snap.getInt( JK8055Board.OFFSET_DIGITAL );
+			int a1 = snap.getInt( JK8055Board.OFFSET_ANALOG1 );
+			int a2 = snap.getInt( JK8055Board.OFFSET_ANALOG2 );
+			assertTrue( "d>=0 && d<=31", d>=0 && d<=31 );
+			assertTrue( "a1>=0 && a1<=255", a1>=0 && a1<=255 );
+			assertTrue( "a2>=0 && a2<=255", a2>=0 && a2<=255 );
+		}
+		assertEquals( 0, snap.position() );
+		board.CloseDevice();
+	}
+
+	public void testReadSnapshotValues() throws JK8055Exception {
+		JK8055Board board = new JK8055Board( DEVICE );
+		int[] values = new int[JK8055Board.VALUES];
+		board.ReadSnapshot( values, 0 );
+		int[] cached = new int[JK8055Board.VALUES];
+		board.ReadSnapshot( cached, 1000 );
+		for (int i = 0; i < JK8055Board.VALUES; i++) {
+			assertEquals( "cached snapshot", values[i], cached[i] );
+		}
+		board.CloseDevice();
+	}
+
+	public void testSetAllValues() throws JK8055Exception {
+		JK8055Board board = new JK8055Board( DEVICE );
+		for (int i = 0; i <= 255; i++) {
+			board.SetAllValues( i, i, 255-i );
+		}
+		board.SetAllValues( 0, 0, 0 );
+		board.CloseDevice();
+	}
+
+	public void testInvalidArguments() throws JK8055Exception {
+		try {
+			new JK8055Board( 4 );
+			fail( "address 4 accepted" );
+		} catch( IllegalArgumentException e ) {
+			// expected
+		}
+		JK8055Board board = new JK8055Board( DEVICE );
+		try {
+			board.ReadSnapshot( ByteBuffer.allocate( JK8055Board.SNAPSHOT_SIZE ), 0 );
+			fail( "heap buffer accepted" );
+		} catch( IllegalArgumentException e ) {
+			// expected
+		}
+		try {
+			board.SetAllValues( 256, 0, 0 );
+			fail( "digitaldata 256 accepted" );
+		} catch( IllegalArgumentException e ) {
+			// expected
+		}
+		board.CloseDevice();
+	}
+
+}
@@ -23,7 +23,79 @@
 extern "C" {
 #endif
 
-/* prototypes */
+/* All inputs decoded from one input packet. timestamp is the
+   CLOCK_MONOTONIC time (seconds) the packet was received. */
+struct k8055_snapshot {
+    long digital;
+    long analog1;
+    long analog2;
+    long counter1;
+    long counter2;
+    double timestamp;
+};
+
+/* Transfer statistics of one board (synchronous transfers only).
+   latency_histogram[i] counts tries that took less than
+   K8055_LATENCY_BASE_US << i microseconds (and at least the previous
+   bucket's limit); the last bucket also holds everything slower. */
+#define K8055_LATENCY_BUCKETS 16
+#define K8055_LATENCY_BASE_US 64
+struct k8055_stats {
+    unsigned long reads;          /* successful input transfers */
+    unsigned long writes;         /* successful output transfers */
+    unsigned long read_retries;   /* extra tries needed by reads */
+    unsigned long write_retries;  /* extra tries needed by writes */
+    unsigned long read_failures;  /* reads that gave up after all tries */
+    unsigned long write_failures; /* writes that gave up after all tries */
+    unsigned long timeouts;       /* tries that hit the timeout */
+    unsigned long id_mismatches;  /* input packets carrying another board's ID */
+    unsigned long latency_histogram[K8055_LATENCY_BUCKETS];
+};
+
+/* Opaque per-board handle for the k8055_* API */
+struct k8055_dev;
+
+/* Handle-based API. Each call only touches the board it is given, so
+   separate boards may be used from separate threads concurrently.
+   Opening a board that is already open returns the same handle; each
+   k8055_open() needs its own k8055_close(), and the board is closed by
+   the last one. */
+struct k8055_dev *k8055_open(long board_address);
+int k8055_close(struct k8055_dev *dev);
+long k8055_address(struct k8055_dev *dev);
+int k8055_read_snapshot(struct k8055_dev *dev, struct k8055_snapshot *snap, long max_age_ms);
+int k8055_set_max_input_age(struct k8055_dev *dev, long max_age_ms);
+int k8055_write_all(struct k8055_dev *dev, long digital, long analog1, long analog2);
+int k8055_write_digital(struct k8055_dev *dev, long data);
+int k8055_write_digital_channel(struct k8055_dev *dev, long channel, int state);
+int k8055_write_analog(struct k8055_dev *dev, long channel, long data);
+int k8055_write_all_analog(struct k8055_dev *dev, long analog1, long analog2);
+int k8055_reset_counter(struct k8055_dev *dev, long counterno);
+int k8055_set_counter_debounce(struct k8055_dev *dev, long counterno, long debouncetime);
+int k8055_set_retry_policy(struct k8055_dev *dev, int attempts, int timeout_ms);
+int k8055_get_stats(struct k8055_dev *dev, struct k8055_stats *stats);
+int k8055_reset_stats(struct k8055_dev *dev);
+const char *k8055_last_error(struct k8055_dev *dev);
+
+/* Continuous input streaming with asynchronous transfers. Frames are
+   queued per board; while streaming, k8055_read_snapshot() returns the
+   newest frame without a transfer of its own, waiting up to one transfer
+   timeout for the first frame. Eight failed transfers in a row end the
+   stream: k8055_stream_read() then fails, reads go back to transfers of
+   their own, and k8055_stream_start() starts a new stream. */
+int k8055_stream_start(struct k8055_dev *dev, int depth);
+int k8055_stream_stop(struct k8055_dev *dev);
+int k8055_stream_read(struct k8055_dev *dev, struct k8055_snapshot *frame);
+long k8055_stream_dropped(struct k8055_dev *dev);
+
+/* Board arrival/removal notification through libusb hotplug, where the
+   platform supports it (see k8055_hotplug_supported()). */
+int k8055_hotplug_supported(void);
+int k8055_hotplug_start(void);
+int k8055_hotplug_stop(void);
+int k8055_hotplug_poll(long *address, int *arrived);
+
+/* prototypes (legacy API, acts on the current device) */
 int OpenDevice(long board_address);
 int CloseDevice();
 long ReadAnalogChannel(long Channelno);
@@ -46,6 +118,8 @@ long ReadCounter(long counterno);
 int SetCounterDebounceTime(long counterno, long debouncetime);
 int ReadAllValues (long int  *data1, long int *data2, long int *data3, long int *data4, long int *data5);
 int SetAllValues(int digitaldata, int addata1, int addata2);
+int ReadSnapshot(struct k8055_snapshot *snap, long max_age_ms);
+int SetMaxInputAge(long max_age_ms);
 long SetCurrentDevice(long deviceno);
 long SearchDevices(void);
 char *Version(void);
@@ -10,6 +10,9 @@
 #include <stdio.h>
 #include <string.h>
 #include <math.h>
+#include <time.h>
+#include <pthread.h>
+#include <stdatomic.h>
 #include <libusb-1.0/libusb.h> // Use the modern libusb-1.0
 #include "k8055.h"
 
@@ -20,8 +23,13 @@
 #define K8055_MAX_DEV 4
 #define USB_OUT_EP 0x01 // Endpoint for writing data
 #define USB_INP_EP 0x81 // Endpoint for reading data
-#define USB_TIMEOUT 200 // Timeout in milliseconds
+#define USB_TIMEOUT 200 // Default timeout in milliseconds
+#define USB_ATTEMPTS 3  // Default tries per transfer
 #define K8055_ERROR -1
+#define K8055_STREAM_RING 256      // Frames buffered per board while streaming (power of two)
+#define K8055_STREAM_MAX_DEPTH 8   // Max. interrupt-IN transfers kept in flight
+#define K8055_STREAM_MAX_ERRORS 8  // Failed transfers in a row that end a stream
+#define K8055_HOTPLUG_QUEUE 32     // Arrival/removal events buffered (power of two)
 
 // Data offsets in the 8-byte packet
 #define DIGITAL_INP_OFFSET 0
@@ -41,101 +49,444 @@
 
 int DEBUG = 0;
 
+// Input streaming state. The libusb event thread is the only producer of
+// ring[]; readers of k8055_stream_read() are serialised by drain_lock, so
+// the producer never waits on a reader.
+struct k8055_stream {
+    struct libusb_transfer *transfers[K8055_STREAM_MAX_DEPTH];
+    unsigned char buffers[K8055_STREAM_MAX_DEPTH][PACKET_LEN];
+    atomic_int depth;          // 0 when not streaming; written under open_lock and lock
+    atomic_int in_flight;      // Transfers submitted and not yet retired
+    atomic_int errors;         // Failed transfers since the last good one
+    atomic_int stopping;
+    struct k8055_snapshot ring[K8055_STREAM_RING];
+    atomic_uint head;          // Next slot the producer writes
+    atomic_uint tail;          // Next slot a reader takes
+    atomic_ulong dropped;      // Frames lost because the ring was full
+    atomic_uint latest_seq;    // Seqlock around latest, odd while it is written
+    struct k8055_snapshot latest;
+    pthread_mutex_t drain_lock;
+};
+
 // Structure to hold device state
 struct k8055_dev {
     unsigned char data_in[PACKET_LEN];
     unsigned char data_out[PACKET_LEN];
     libusb_device_handle *device_handle; // Modern libusb handle
     int DevNo;
+    int open_count;    // k8055_open() calls not yet closed, guarded by open_lock
+    int legacy_open;   // The legacy OpenDevice() holds one of them
+    double read_time;  // Monotonic time (s) of the last good input packet, 0 if none
+    long max_age_ms;   // How stale data_in may be before the channel readers re-read
+    pthread_mutex_t lock; // Serialises transfers and data_in/data_out of this board
+    struct k8055_stream stream;
+    int attempts;         // Retry policy: tries per transfer ...
+    int timeout_ms;       // ... and the timeout of each try
+    int last_error;       // libusb status of the last failed try, 0 if none
+    struct k8055_stats stats; // Synchronous transfers only, guarded by lock
 };
 
+// Device slots are static, so a handle stays a valid pointer after close;
+// calls on a closed handle simply fail with K8055_ERROR.
 static struct k8055_dev k8055d[K8055_MAX_DEV];
-static struct k8055_dev *CurrDev;
+static struct k8055_dev *CurrDev; // Target of the legacy (non-handle) API
+
+// Only taken while opening or closing; transfers use the per-device lock.
+static pthread_mutex_t open_lock = PTHREAD_MUTEX_INITIALIZER;
 
 // Global libusb session context
 static libusb_context *usb_ctx = NULL;
 
+// Thread that runs libusb event handling for asynchronous transfers. It is
+// shared by all users and runs while event_users > 0 (guarded by open_lock).
+static pthread_t event_thread;
+static int event_users = 0;
+static atomic_int event_thread_run;
+
+// Hotplug events, produced by the event thread and consumed by
+// k8055_hotplug_poll(). hotplug_registered is guarded by open_lock.
+struct k8055_hotplug_event {
+    long address;
+    int arrived;
+};
+static struct k8055_hotplug_event hotplug_queue[K8055_HOTPLUG_QUEUE];
+static atomic_uint hotplug_head, hotplug_tail;
+static atomic_int hotplug_overflow;
+static int hotplug_registered = 0;
+static libusb_hotplug_callback_handle hotplug_handle;
+static pthread_mutex_t hotplug_poll_lock = PTHREAD_MUTEX_INITIALIZER;
+
+static void do_init_usb(void)
+{
+    int i;
+    for (i = 0; i < K8055_MAX_DEV; i++)
+    {
+        pthread_mutex_init(&k8055d[i].lock, NULL);
+        pthread_mutex_init(&k8055d[i].stream.drain_lock, NULL);
+    }
+    if (libusb_init(&usb_ctx) < 0)
+    {
+        fprintf(stderr, "Error: Failed to initialize libusb\n");
+    }
+}
+
 static void init_usb(void)
 {
-    static int Done = 0;
-    if (!Done)
+    static pthread_once_t Done = PTHREAD_ONCE_INIT;
+    pthread_once(&Done, do_init_usb);
+}
+
+static double monotonic_seconds(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec / 1e9;
+}
+
+static void *event_loop(void *arg)
+{
+    while (atomic_load(&event_thread_run))
     {
-        if (libusb_init(&usb_ctx) < 0)
+        struct timeval tv = { 0, 100000 };
+        libusb_handle_events_timeout_completed(usb_ctx, &tv, NULL);
+    }
+    return NULL;
+}
+
+// Caller holds open_lock
+static int event_thread_acquire(void)
+{
+    if (event_users == 0)
+    {
+        atomic_store(&event_thread_run, 1);
+        if (pthread_create(&event_thread, NULL, event_loop, NULL) != 0)
         {
-            fprintf(stderr, "Error: Failed to initialize libusb\n");
+            fprintf(stderr, "Error: Could not start the libusb event thread.\n");
+            return K8055_ERROR;
         }
-        Done = 1;
     }
+    event_users++;
+    return 0;
+}
+
+// Caller holds open_lock
+static void event_thread_release(void)
+{
+    if (event_users > 0 && --event_users == 0)
+    {
+        atomic_store(&event_thread_run, 0);
+        pthread_join(event_thread, NULL);
+    }
+}
+
+// The transfer helpers below expect the caller to hold dev->lock.
+
+// One try of an interrupt transfer, accounted in the board's statistics
+static int timed_transfer(struct k8055_dev *dev, unsigned char endpoint, unsigned char *data, int *transferred)
+{
+    double start = monotonic_seconds();
+    int status = libusb_interrupt_transfer(dev->device_handle, endpoint, data, PACKET_LEN,
+                                           transferred, dev->timeout_ms);
+    double elapsed_us = (monotonic_seconds() - start) * 1e6;
+    int bucket = 0;
+
+    while (bucket < K8055_LATENCY_BUCKETS - 1 &&
+           elapsed_us >= (double)(K8055_LATENCY_BASE_US << bucket))
+    {
+        bucket++;
+    }
+    dev->stats.latency_histogram[bucket]++;
+    if (status == LIBUSB_ERROR_TIMEOUT) dev->stats.timeouts++;
+    if (status != 0) dev->last_error = status;
+    return status;
 }
 
-static int ReadK8055Data(void)
+static int ReadK8055Data(struct k8055_dev *dev)
 {
     int read_status = 0, transferred = 0, i;
 
-    if (!CurrDev || !CurrDev->device_handle) return K8055_ERROR;
+    if (!dev->device_handle) return K8055_ERROR;
 
-    for (i = 0; i < 3; i++)
+    dev->last_error = 0;
+    for (i = 0; i < dev->attempts; i++)
     {
-        read_status = libusb_interrupt_transfer(
-            CurrDev->device_handle, USB_INP_EP, CurrDev->data_in, PACKET_LEN, &transferred, USB_TIMEOUT);
+        if (i > 0) dev->stats.read_retries++;
+        read_status = timed_transfer(dev, USB_INP_EP, dev->data_in, &transferred);
 
         if (read_status == 0 && transferred == PACKET_LEN)
         {
-            int board_id_from_packet = CurrDev->data_in[1] % 10;
-            if (board_id_from_packet == CurrDev->DevNo)
+            int board_id_from_packet = dev->data_in[1] % 10;
+            if (board_id_from_packet == dev->DevNo)
             {
+                dev->read_time = monotonic_seconds();
+                dev->stats.reads++;
                 return 0;
             }
+            dev->stats.id_mismatches++;
         }
         if (DEBUG) fprintf(stderr, "Read retry (%s)\n", libusb_strerror(read_status));
     }
+    dev->stats.read_failures++;
     return K8055_ERROR;
 }
 
-static int WriteK8055Data(unsigned char cmd)
+// Re-uses the last input packet if it is at most max_age_ms old,
+// otherwise fetches a new one. max_age_ms <= 0 always reads.
+static int RefreshK8055Data(struct k8055_dev *dev, long max_age_ms)
+{
+    if (!dev->device_handle) return K8055_ERROR;
+
+    if (max_age_ms > 0 && dev->read_time > 0 &&
+        (monotonic_seconds() - dev->read_time) * 1000.0 <= max_age_ms)
+    {
+        return 0;
+    }
+    return ReadK8055Data(dev);
+}
+
+// Unscramble the digital input bits of an input packet into I1..I5 order
+static long DecodeDigital(const unsigned char *data_in)
+{
+    return (((data_in[DIGITAL_INP_OFFSET] >> 4) & 0x03) |
+            ((data_in[DIGITAL_INP_OFFSET] << 2) & 0x04) |
+            ((data_in[DIGITAL_INP_OFFSET] >> 3) & 0x18));
+}
+
+static void DecodePacket(const unsigned char *data_in, double timestamp, struct k8055_snapshot *snap)
+{
+    snap->digital = DecodeDigital(data_in);
+    snap->analog1 = data_in[ANALOG_1_OFFSET];
+    snap->analog2 = data_in[ANALOG_2_OFFSET];
+    snap->counter1 = data_in[COUNTER_1_OFFSET] | (data_in[COUNTER_1_OFFSET + 1] << 8);
+    snap->counter2 = data_in[COUNTER_2_OFFSET] | (data_in[COUNTER_2_OFFSET + 1] << 8);
+    snap->timestamp = timestamp;
+}
+
+static void DecodeSnapshot(const struct k8055_dev *dev, struct k8055_snapshot *snap)
+{
+    DecodePacket(dev->data_in, dev->read_time, snap);
+}
+
+// Runs on the event thread for every completed interrupt-IN transfer
+static void LIBUSB_CALL stream_callback(struct libusb_transfer *transfer)
+{
+    struct k8055_dev *dev = transfer->user_data;
+    struct k8055_stream *st = &dev->stream;
+
+    if (transfer->status == LIBUSB_TRANSFER_COMPLETED &&
+        transfer->actual_length == PACKET_LEN &&
+        transfer->buffer[1] % 10 == dev->DevNo)
+    {
+        struct k8055_snapshot snap;
+        unsigned int head = atomic_load_explicit(&st->head, memory_order_relaxed);
+        unsigned int tail = atomic_load_explicit(&st->tail, memory_order_acquire);
+
+        DecodePacket(transfer->buffer, monotonic_seconds(), &snap);
+
+        atomic_fetch_add_explicit(&st->latest_seq, 1, memory_order_acq_rel);
+        st->latest = snap;
+        atomic_fetch_add_explicit(&st->latest_seq, 1, memory_order_release);
+
+        if (head - tail >= K8055_STREAM_RING)
+        {
+            atomic_fetch_add_explicit(&st->dropped, 1, memory_order_relaxed);
+        }
+        else
+        {
+            st->ring[head & (K8055_STREAM_RING - 1)] = snap;
+            atomic_store_explicit(&st->head, head + 1, memory_order_release);
+        }
+    }
+    if (transfer->status == LIBUSB_TRANSFER_COMPLETED)
+    {
+        atomic_store(&st->errors, 0);
+    }
+    else if (transfer->status != LIBUSB_TRANSFER_CANCELLED)
+    {
+        // A persistent error (stall, overflow, ...) would otherwise be
+        // resubmitted forever. Retiring each transfer that fails past the
+        // limit ends the stream, and reads fall back to synchronous ones.
+        atomic_fetch_add(&st->errors, 1);
+        if (DEBUG) fprintf(stderr, "Stream transfer status %d\n", transfer->status);
+    }
+
+    if (!atomic_load(&st->stopping) &&
+        transfer->status != LIBUSB_TRANSFER_CANCELLED &&
+        transfer->status != LIBUSB_TRANSFER_NO_DEVICE &&
+        atomic_load(&st->errors) < K8055_STREAM_MAX_ERRORS &&
+        libusb_submit_transfer(transfer) == 0)
+    {
+        return;
+    }
+    atomic_fetch_sub(&st->in_flight, 1);
+}
+
+// Latest streamed frame; returns 0 if none has arrived yet
+static int stream_latest(struct k8055_stream *st, struct k8055_snapshot *snap)
+{
+    unsigned int seq1, seq2;
+
+    do {
+        seq1 = atomic_load_explicit(&st->latest_seq, memory_order_acquire);
+        if (seq1 == 0) return 0;
+        *snap = st->latest;
+        atomic_thread_fence(memory_order_acquire);
+        seq2 = atomic_load_explicit(&st->latest_seq, memory_order_relaxed);
+    } while (seq1 != seq2 || (seq1 & 1));
+    return 1;
+}
+
+// While the stream's transfers own the IN endpoint a synchronous read would
+// steal one of their reports, so a read waits up to one transfer timeout for
+// the first streamed frame instead. Returns 0 with a frame, K8055_ERROR on
+// timeout, or 1 if the stream ended and the endpoint is free again.
+static int stream_wait_latest(struct k8055_dev *dev, struct k8055_snapshot *snap)
+{
+    struct k8055_stream *st = &dev->stream;
+    struct timespec pause = { 0, 1000000 };
+    double deadline;
+
+    pthread_mutex_lock(&dev->lock);
+    deadline = monotonic_seconds() + dev->timeout_ms / 1000.0;
+    pthread_mutex_unlock(&dev->lock);
+    while (atomic_load(&st->in_flight) > 0)
+    {
+        if (stream_latest(st, snap)) return 0;
+        if (monotonic_seconds() >= deadline)
+        {
+            pthread_mutex_lock(&dev->lock);
+            dev->last_error = LIBUSB_ERROR_TIMEOUT;
+            pthread_mutex_unlock(&dev->lock);
+            return K8055_ERROR;
+        }
+        nanosleep(&pause, NULL);
+    }
+    return 1;
+}
+
+// A stream is running until it is stopped or all its transfers retired
+static int stream_running(struct k8055_stream *st)
+{
+    return atomic_load(&st->depth) > 0 && atomic_load(&st->in_flight) > 0;
+}
+
+// Caller holds open_lock but not lock. Cancels the in-flight transfers and
+// waits for the event thread to retire them.
+static void stream_stop(struct k8055_dev *dev)
+{
+    struct k8055_stream *st = &dev->stream;
+    struct timespec pause = { 0, 1000000 };
+    int i;
+
+    pthread_mutex_lock(&dev->lock);
+    if (st->depth == 0)
+    {
+        pthread_mutex_unlock(&dev->lock);
+        return;
+    }
+
+    atomic_store(&st->stopping, 1);
+    for (i = 0; i < st->depth; i++)
+    {
+        libusb_cancel_transfer(st->transfers[i]);
+    }
+    while (atomic_load(&st->in_flight) > 0)
+    {
+        nanosleep(&pause, NULL);
+    }
+    for (i = 0; i < st->depth; i++)
+    {
+        libusb_free_transfer(st->transfers[i]);
+        st->transfers[i] = NULL;
+    }
+    st->depth = 0;
+    pthread_mutex_unlock(&dev->lock);
+    event_thread_release();
+}
+
+static int WriteK8055Data(struct k8055_dev *dev, unsigned char cmd)
 {
     int write_status = 0, transferred = 0, i;
 
-    if (!CurrDev || !CurrDev->device_handle) return K8055_ERROR;
+    if (!dev->device_handle) return K8055_ERROR;
 
-    CurrDev->data_out[0] = cmd;
-    for (i = 0; i < 3; i++)
+    dev->data_out[0] = cmd;
+    dev->last_error = 0;
+    for (i = 0; i < dev->attempts; i++)
     {
-        write_status = libusb_interrupt_transfer(
-            CurrDev->device_handle, USB_OUT_EP, CurrDev->data_out, PACKET_LEN, &transferred, USB_TIMEOUT);
+        if (i > 0) dev->stats.write_retries++;
+        write_status = timed_transfer(dev, USB_OUT_EP, dev->data_out, &transferred);
         
         if (write_status == 0 && transferred == PACKET_LEN)
         {
+            dev->stats.writes++;
             return 0;
         }
         if (DEBUG) fprintf(stderr, "Write retry (%s)\n", libusb_strerror(write_status));
     }
+    dev->stats.write_failures++;
     return K8055_ERROR;
 }
 
-int OpenDevice(long BoardAddress)
+// Caller holds open_lock
+static void close_dev(struct k8055_dev *dev)
+{
+    stream_stop(dev);
+    pthread_mutex_lock(&dev->lock);
+    if (dev->device_handle)
+    {
+        libusb_release_interface(dev->device_handle, 0);
+        libusb_close(dev->device_handle);
+        dev->device_handle = NULL;
+    }
+    dev->DevNo = 0;
+    dev->open_count = 0;
+    dev->legacy_open = 0;
+    dev->read_time = 0;
+    pthread_mutex_unlock(&dev->lock);
+}
+
+// ===================================================================
+//
+// Handle-based API. Every call acts only on the board it is given, so
+// different boards can be driven from different threads at the same time.
+//
+// ===================================================================
+
+struct k8055_dev *k8055_open(long BoardAddress)
 {
     libusb_device **devs;
     libusb_device_handle *handle = NULL;
+    struct k8055_dev *dev;
     ssize_t cnt;
     int i = 0;
     int ipid;
 
     if (BoardAddress < 0 || BoardAddress >= K8055_MAX_DEV)
     {
-        return K8055_ERROR;
-    }
-    
-    if (k8055d[BoardAddress].device_handle != NULL) {
-        SetCurrentDevice(BoardAddress);
-        return BoardAddress;
+        return NULL;
     }
 
     init_usb();
+    dev = &k8055d[BoardAddress];
+
+    pthread_mutex_lock(&open_lock);
+    if (dev->device_handle != NULL) {
+        // Every open of the board shares its one handle; it is closed by
+        // the k8055_close() matching the last open
+        dev->open_count++;
+        pthread_mutex_unlock(&open_lock);
+        return dev;
+    }
+
     ipid = K8055_IPID + (int)BoardAddress;
 
     cnt = libusb_get_device_list(usb_ctx, &devs);
-    if (cnt < 0) return K8055_ERROR;
+    if (cnt < 0)
+    {
+        pthread_mutex_unlock(&open_lock);
+        return NULL;
+    }
 
     for (i = 0; devs[i]; i++)
     {
@@ -162,22 +513,34 @@ int OpenDevice(long BoardAddress)
 
                 if (libusb_claim_interface(handle, 0) == 0)
                 {
-                    CurrDev = &k8055d[BoardAddress];
-                    CurrDev->device_handle = handle;
-                    CurrDev->DevNo = BoardAddress + 1;
-                    SetCurrentDevice(BoardAddress);
-
-                    memset(CurrDev->data_out, 0, PACKET_LEN);
-                    WriteK8055Data(CMD_RESET);
-                    if (ReadK8055Data() == 0)
+                    int ok;
+
+                    pthread_mutex_lock(&dev->lock);
+                    dev->device_handle = handle;
+                    dev->DevNo = BoardAddress + 1;
+                    dev->read_time = 0;
+                    dev->max_age_ms = 0;
+                    dev->attempts = USB_ATTEMPTS;
+                    dev->timeout_ms = USB_TIMEOUT;
+                    dev->last_error = 0;
+                    memset(&dev->stats, 0, sizeof(dev->stats));
+
+                    memset(dev->data_out, 0, PACKET_LEN);
+                    WriteK8055Data(dev, CMD_RESET);
+                    ok = (ReadK8055Data(dev) == 0);
+                    pthread_mutex_unlock(&dev->lock);
+
+                    if (ok)
                     {
+                        dev->open_count = 1;
                         libusb_free_device_list(devs, 1);
-                        return BoardAddress;
+                        pthread_mutex_unlock(&open_lock);
+                        return dev;
                     }
                     else
                     {
                        fprintf(stderr, "Error: Found device, but failed initial communication.\n");
-                       CloseDevice();
+                       close_dev(dev);
                     }
                 }
                 else
@@ -191,22 +554,509 @@ int OpenDevice(long BoardAddress)
     }
 
     libusb_free_device_list(devs, 1);
+    pthread_mutex_unlock(&open_lock);
     if (DEBUG) fprintf(stderr, "Could not find K8055 with address %d\n", (int)BoardAddress);
-    return K8055_ERROR;
+    return NULL;
+}
+
+// Releases one k8055_open() of the board; the handle itself is closed
+// when the last one is released
+int k8055_close(struct k8055_dev *dev)
+{
+    if (!dev) return K8055_ERROR;
+
+    pthread_mutex_lock(&open_lock);
+    if (!dev->device_handle)
+    {
+        if (DEBUG) fprintf(stderr, "Device is not open\n");
+    }
+    if (dev->open_count > 1)
+    {
+        dev->open_count--;
+    }
+    else
+    {
+        close_dev(dev);
+    }
+    pthread_mutex_unlock(&open_lock);
+    return 0;
+}
+
+// Board address (0-3) of a handle
+long k8055_address(struct k8055_dev *dev)
+{
+    if (!dev) return K8055_ERROR;
+    return (long)(dev - k8055d);
+}
+
+// Decode one input packet into snap. A packet younger than max_age_ms is
+// reused instead of issuing a new transfer; 0 always reads, and a negative
+// max_age_ms uses the age set with k8055_set_max_input_age().
+int k8055_read_snapshot(struct k8055_dev *dev, struct k8055_snapshot *snap, long max_age_ms)
+{
+    int rc;
+
+    if (!dev || !snap) return K8055_ERROR;
+
+    // While streaming, the newest streamed frame is always the freshest data.
+    // Streams start and stop under lock, so a stream seen ended here stays
+    // ended through the synchronous read below.
+    pthread_mutex_lock(&dev->lock);
+    while (stream_running(&dev->stream))
+    {
+        pthread_mutex_unlock(&dev->lock);
+        rc = stream_wait_latest(dev, snap);
+        if (rc <= 0) return rc;
+        pthread_mutex_lock(&dev->lock);
+    }
+    rc = RefreshK8055Data(dev, max_age_ms < 0 ? dev->max_age_ms : max_age_ms);
+    if (rc == 0) DecodeSnapshot(dev, snap);
+    pthread_mutex_unlock(&dev->lock);
+    return rc;
+}
+
+// Default maximum snapshot age for reads that don't pass their own
+int k8055_set_max_input_age(struct k8055_dev *dev, long max_age_ms)
+{
+    if (!dev) return K8055_ERROR;
+
+    pthread_mutex_lock(&dev->lock);
+    dev->max_age_ms = max_age_ms > 0 ? max_age_ms : 0;
+    pthread_mutex_unlock(&dev->lock);
+    return dev->device_handle ? 0 : K8055_ERROR;
+}
+
+// The full output image (digital outputs and both DACs) in one packet
+int k8055_write_all(struct k8055_dev *dev, long digital, long analog1, long analog2)
+{
+    int rc;
+
+    if (!dev) return K8055_ERROR;
+
+    pthread_mutex_lock(&dev->lock);
+    dev->data_out[DIGITAL_OUT_OFFSET] = (unsigned char)digital;
+    dev->data_out[ANALOG_1_OFFSET] = (unsigned char)analog1;
+    dev->data_out[ANALOG_2_OFFSET] = (unsigned char)analog2;
+    rc = WriteK8055Data(dev, CMD_SET_ANALOG_DIGITAL);
+    pthread_mutex_unlock(&dev->lock);
+    return rc;
+}
+
+int k8055_write_digital(struct k8055_dev *dev, long data)
+{
+    int rc;
+
+    if (!dev) return K8055_ERROR;
+
+    pthread_mutex_lock(&dev->lock);
+    dev->data_out[DIGITAL_OUT_OFFSET] = (unsigned char)data;
+    rc = WriteK8055Data(dev, CMD_SET_ANALOG_DIGITAL);
+    pthread_mutex_unlock(&dev->lock);
+    return rc;
+}
+
+// Switch one digital output (1-8) on or off, leaving the others alone
+int k8055_write_digital_channel(struct k8055_dev *dev, long channel, int state)
+{
+    int rc;
+
+    if (!dev) return K8055_ERROR;
+    if (channel < 1 || channel > 8) return K8055_ERROR;
+
+    pthread_mutex_lock(&dev->lock);
+    if (state)
+        dev->data_out[DIGITAL_OUT_OFFSET] |= (1 << (channel - 1));
+    else
+        dev->data_out[DIGITAL_OUT_OFFSET] &= ~(1 << (channel - 1));
+    rc = WriteK8055Data(dev, CMD_SET_ANALOG_DIGITAL);
+    pthread_mutex_unlock(&dev->lock);
+    return rc;
+}
+
+int k8055_write_analog(struct k8055_dev *dev, long channel, long data)
+{
+    int rc;
+
+    if (!dev) return K8055_ERROR;
+    if (channel != 1 && channel != 2) return K8055_ERROR;
+
+    pthread_mutex_lock(&dev->lock);
+    if (channel == 1)
+        dev->data_out[ANALOG_1_OFFSET] = (unsigned char)data;
+    else
+        dev->data_out[ANALOG_2_OFFSET] = (unsigned char)data;
+    rc = WriteK8055Data(dev, CMD_SET_ANALOG_DIGITAL);
+    pthread_mutex_unlock(&dev->lock);
+    return rc;
+}
+
+int k8055_write_all_analog(struct k8055_dev *dev, long analog1, long analog2)
+{
+    int rc;
+
+    if (!dev) return K8055_ERROR;
+
+    pthread_mutex_lock(&dev->lock);
+    dev->data_out[ANALOG_1_OFFSET] = (unsigned char)analog1;
+    dev->data_out[ANALOG_2_OFFSET] = (unsigned char)analog2;
+    rc = WriteK8055Data(dev, CMD_SET_ANALOG_DIGITAL);
+    pthread_mutex_unlock(&dev->lock);
+    return rc;
+}
+
+int k8055_reset_counter(struct k8055_dev *dev, long CounterNo)
+{
+    int rc;
+
+    if (!dev) return K8055_ERROR;
+    if (CounterNo != 1 && CounterNo != 2) return K8055_ERROR;
+
+    pthread_mutex_lock(&dev->lock);
+    rc = WriteK8055Data(dev, (CounterNo == 1) ? CMD_RESET_COUNTER_1 : CMD_RESET_COUNTER_2);
+    pthread_mutex_unlock(&dev->lock);
+    return rc;
+}
+
+int k8055_set_counter_debounce(struct k8055_dev *dev, long CounterNo, long DebounceTime)
+{
+    float value;
+    unsigned char int_value;
+    int rc;
+
+    if (!dev) return K8055_ERROR;
+    if (CounterNo != 1 && CounterNo != 2) return K8055_ERROR;
+
+    if (DebounceTime > 7450) DebounceTime = 7450;
+    if (DebounceTime < 0) DebounceTime = 0;
+    
+    value = sqrtf(DebounceTime / 0.115f);
+    
+    int_value = (unsigned char)(value + 0.5f);
+
+    pthread_mutex_lock(&dev->lock);
+    if (CounterNo == 1)
+    {
+        dev->data_out[6] = int_value;
+        rc = WriteK8055Data(dev, CMD_SET_DEBOUNCE_1);
+    }
+    else
+    {
+        dev->data_out[7] = int_value;
+        rc = WriteK8055Data(dev, CMD_SET_DEBOUNCE_2);
+    }
+    pthread_mutex_unlock(&dev->lock);
+    return rc;
+}
+
+// Retry policy for this board's transfers: each transfer is tried up to
+// attempts times (1 = fail fast), each try waiting at most timeout_ms.
+int k8055_set_retry_policy(struct k8055_dev *dev, int attempts, int timeout_ms)
+{
+    if (!dev || attempts < 1 || timeout_ms < 1) return K8055_ERROR;
+
+    pthread_mutex_lock(&dev->lock);
+    dev->attempts = attempts;
+    dev->timeout_ms = timeout_ms;
+    pthread_mutex_unlock(&dev->lock);
+    return dev->device_handle ? 0 : K8055_ERROR;
+}
+
+// Copy the transfer statistics gathered since open (or the last reset)
+int k8055_get_stats(struct k8055_dev *dev, struct k8055_stats *stats)
+{
+    if (!dev || !stats) return K8055_ERROR;
+
+    pthread_mutex_lock(&dev->lock);
+    *stats = dev->stats;
+    pthread_mutex_unlock(&dev->lock);
+    return 0;
+}
+
+int k8055_reset_stats(struct k8055_dev *dev)
+{
+    if (!dev) return K8055_ERROR;
+
+    pthread_mutex_lock(&dev->lock);
+    memset(&dev->stats, 0, sizeof(dev->stats));
+    pthread_mutex_unlock(&dev->lock);
+    return 0;
+}
+
+// Name of the libusb error behind the last failed try, "" if none
+const char *k8055_last_error(struct k8055_dev *dev)
+{
+    if (!dev || dev->last_error == 0) return "";
+    return libusb_error_name(dev->last_error);
+}
+
+// Start streaming: keep depth (1-8) interrupt-IN transfers in flight and
+// queue every input report the board sends, timestamped, in a ring of
+// K8055_STREAM_RING frames. Drain it with k8055_stream_read().
+int k8055_stream_start(struct k8055_dev *dev, int depth)
+{
+    struct k8055_stream *st;
+    int i;
+
+    if (!dev) return K8055_ERROR;
+    if (depth < 1) depth = 1;
+    if (depth > K8055_STREAM_MAX_DEPTH) depth = K8055_STREAM_MAX_DEPTH;
+
+    st = &dev->stream;
+    pthread_mutex_lock(&open_lock);
+    if (st->depth > 0 && atomic_load(&st->in_flight) == 0)
+    {
+        stream_stop(dev); // The previous stream died; start a new one
+    }
+    if (!dev->device_handle || st->depth > 0)
+    {
+        pthread_mutex_unlock(&open_lock);
+        return dev->device_handle ? 0 : K8055_ERROR;
+    }
+    if (event_thread_acquire() != 0)
+    {
+        pthread_mutex_unlock(&open_lock);
+        return K8055_ERROR;
+    }
+
+    pthread_mutex_lock(&dev->lock);
+    atomic_store(&st->stopping, 0);
+    atomic_store(&st->in_flight, 0);
+    atomic_store(&st->errors, 0);
+    atomic_store(&st->head, 0);
+    atomic_store(&st->tail, 0);
+    atomic_store(&st->dropped, 0);
+    atomic_store(&st->latest_seq, 0);
+    st->depth = depth;
+
+    for (i = 0; i < depth; i++)
+    {
+        st->transfers[i] = libusb_alloc_transfer(0);
+        libusb_fill_interrupt_transfer(st->transfers[i], dev->device_handle, USB_INP_EP,
+                                       st->buffers[i], PACKET_LEN, stream_callback, dev, 0);
+        atomic_fetch_add(&st->in_flight, 1);
+        if (libusb_submit_transfer(st->transfers[i]) != 0)
+        {
+            atomic_fetch_sub(&st->in_flight, 1);
+            st->depth = i + 1;
+            pthread_mutex_unlock(&dev->lock);
+            stream_stop(dev);
+            pthread_mutex_unlock(&open_lock);
+            return K8055_ERROR;
+        }
+    }
+    pthread_mutex_unlock(&dev->lock);
+    pthread_mutex_unlock(&open_lock);
+    return 0;
+}
+
+int k8055_stream_stop(struct k8055_dev *dev)
+{
+    if (!dev) return K8055_ERROR;
+
+    pthread_mutex_lock(&open_lock);
+    stream_stop(dev);
+    pthread_mutex_unlock(&open_lock);
+    return 0;
+}
+
+// Take the oldest queued frame. Returns 1 with a frame, 0 if none is
+// waiting, K8055_ERROR if not streaming or the stream died (e.g. unplug).
+int k8055_stream_read(struct k8055_dev *dev, struct k8055_snapshot *frame)
+{
+    struct k8055_stream *st;
+    unsigned int head, tail;
+    int rc = 0;
+
+    if (!dev || !frame) return K8055_ERROR;
+
+    st = &dev->stream;
+    pthread_mutex_lock(&st->drain_lock);
+    tail = atomic_load_explicit(&st->tail, memory_order_relaxed);
+    head = atomic_load_explicit(&st->head, memory_order_acquire);
+    if (tail != head)
+    {
+        *frame = st->ring[tail & (K8055_STREAM_RING - 1)];
+        atomic_store_explicit(&st->tail, tail + 1, memory_order_release);
+        rc = 1;
+    }
+    else if (!stream_running(st))
+    {
+        rc = K8055_ERROR;
+    }
+    pthread_mutex_unlock(&st->drain_lock);
+    return rc;
+}
+
+// Frames lost to a full ring since the stream was started
+long k8055_stream_dropped(struct k8055_dev *dev)
+{
+    if (!dev) return K8055_ERROR;
+    return (long)atomic_load(&dev->stream.dropped);
+}
+
+// Runs on the event thread. Only queues the event: libusb does not allow
+// synchronous I/O (e.g. opening the board) from inside this callback.
+static int LIBUSB_CALL hotplug_callback(libusb_context *ctx, libusb_device *device,
+                                        libusb_hotplug_event event, void *user_data)
+{
+    struct libusb_device_descriptor desc;
+    unsigned int head, tail;
+    long address;
+
+    if (libusb_get_device_descriptor(device, &desc) != 0) return 0;
+    address = (long)desc.idProduct - K8055_IPID;
+    if (address < 0 || address >= K8055_MAX_DEV) return 0;
+
+    head = atomic_load_explicit(&hotplug_head, memory_order_relaxed);
+    tail = atomic_load_explicit(&hotplug_tail, memory_order_acquire);
+    if (head - tail >= K8055_HOTPLUG_QUEUE)
+    {
+        atomic_store(&hotplug_overflow, 1);
+        return 0;
+    }
+    hotplug_queue[head & (K8055_HOTPLUG_QUEUE - 1)].address = address;
+    hotplug_queue[head & (K8055_HOTPLUG_QUEUE - 1)].arrived = (event == LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED);
+    atomic_store_explicit(&hotplug_head, head + 1, memory_order_release);
+    return 0;  // Stay registered
+}
+
+// Non-zero if this libusb/platform can report board arrival and removal
+int k8055_hotplug_supported(void)
+{
+    init_usb();
+    return libusb_has_capability(LIBUSB_CAP_HAS_HOTPLUG);
+}
+
+// Start queueing arrival/removal events of K8055 boards. Boards that are
+// already connected are not reported.
+int k8055_hotplug_start(void)
+{
+    int rc;
+
+    if (!k8055_hotplug_supported()) return K8055_ERROR;
+
+    pthread_mutex_lock(&open_lock);
+    if (hotplug_registered)
+    {
+        pthread_mutex_unlock(&open_lock);
+        return 0;
+    }
+    atomic_store(&hotplug_head, 0);
+    atomic_store(&hotplug_tail, 0);
+    atomic_store(&hotplug_overflow, 0);
+    rc = libusb_hotplug_register_callback(usb_ctx,
+            LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED | LIBUSB_HOTPLUG_EVENT_DEVICE_LEFT,
+            LIBUSB_HOTPLUG_NO_FLAGS, VELLEMAN_VENDOR_ID, LIBUSB_HOTPLUG_MATCH_ANY,
+            LIBUSB_HOTPLUG_MATCH_ANY, hotplug_callback, NULL, &hotplug_handle);
+    if (rc != LIBUSB_SUCCESS || event_thread_acquire() != 0)
+    {
+        if (rc == LIBUSB_SUCCESS) libusb_hotplug_deregister_callback(usb_ctx, hotplug_handle);
+        if (DEBUG) fprintf(stderr, "Hotplug registration failed (%s)\n", libusb_strerror(rc));
+        pthread_mutex_unlock(&open_lock);
+        return K8055_ERROR;
+    }
+    hotplug_registered = 1;
+    pthread_mutex_unlock(&open_lock);
+    return 0;
+}
+
+int k8055_hotplug_stop(void)
+{
+    pthread_mutex_lock(&open_lock);
+    if (hotplug_registered)
+    {
+        libusb_hotplug_deregister_callback(usb_ctx, hotplug_handle);
+        event_thread_release();
+        hotplug_registered = 0;
+    }
+    pthread_mutex_unlock(&open_lock);
+    return 0;
+}
+
+// Take the oldest hotplug event. Returns 1 with *address (0-3) and
+// *arrived (1 = plugged in, 0 = removed), or 0 if there is none. If events
+// were lost to a full queue, one event with *address == -1 is returned
+// first; the caller should then rescan with SearchDevices().
+int k8055_hotplug_poll(long *address, int *arrived)
+{
+    unsigned int head, tail;
+    int rc = 0;
+
+    pthread_mutex_lock(&hotplug_poll_lock);
+    if (atomic_exchange(&hotplug_overflow, 0))
+    {
+        *address = -1;
+        *arrived = 0;
+        rc = 1;
+    }
+    else
+    {
+        tail = atomic_load_explicit(&hotplug_tail, memory_order_relaxed);
+        head = atomic_load_explicit(&hotplug_head, memory_order_acquire);
+        if (tail != head)
+        {
+            *address = hotplug_queue[tail & (K8055_HOTPLUG_QUEUE - 1)].address;
+            *arrived = hotplug_queue[tail & (K8055_HOTPLUG_QUEUE - 1)].arrived;
+            atomic_store_explicit(&hotplug_tail, tail + 1, memory_order_release);
+            rc = 1;
+        }
+    }
+    pthread_mutex_unlock(&hotplug_poll_lock);
+    return rc;
+}
+
+// ===================================================================
+//
+// Legacy API, compatible with Velleman's DLL. These functions act on the
+// device selected with OpenDevice()/SetCurrentDevice().
+//
+// ===================================================================
+
+// The legacy API holds at most one open of each board, so opening an
+// open board only selects it, as with Velleman's DLL
+int OpenDevice(long BoardAddress)
+{
+    struct k8055_dev *dev;
+    int held = 0;
+
+    if (BoardAddress >= 0 && BoardAddress < K8055_MAX_DEV)
+    {
+        pthread_mutex_lock(&open_lock);
+        held = k8055d[BoardAddress].legacy_open;
+        pthread_mutex_unlock(&open_lock);
+    }
+    if (held)
+    {
+        CurrDev = &k8055d[BoardAddress];
+        return BoardAddress;
+    }
+    dev = k8055_open(BoardAddress);
+    if (!dev) return K8055_ERROR;
+
+    pthread_mutex_lock(&open_lock);
+    dev->legacy_open = 1;
+    pthread_mutex_unlock(&open_lock);
+    CurrDev = dev;
+    return BoardAddress;
 }
 
 int CloseDevice()
 {
-    if (!CurrDev || !CurrDev->device_handle)
+    int held = 0;
+
+    if (CurrDev)
+    {
+        pthread_mutex_lock(&open_lock);
+        held = CurrDev->legacy_open;
+        CurrDev->legacy_open = 0;
+        pthread_mutex_unlock(&open_lock);
+    }
+    if (!held || !CurrDev->device_handle)
     {
         if (DEBUG) fprintf(stderr, "Current device is not open\n");
         return 0;
     }
-    libusb_release_interface(CurrDev->device_handle, 0);
-    libusb_close(CurrDev->device_handle);
-    CurrDev->device_handle = NULL;
-    CurrDev->DevNo = 0;
-    return 0;
+    return k8055_close(CurrDev);
 }
 
 long SetCurrentDevice(long deviceno)
@@ -252,113 +1102,100 @@ long SearchDevices(void)
 
 long ReadAnalogChannel(long Channel)
 {
+    struct k8055_snapshot snap;
+
     if (Channel != 1 && Channel != 2) return K8055_ERROR;
-    if (ReadK8055Data() != 0) return K8055_ERROR;
+    if (k8055_read_snapshot(CurrDev, &snap, -1) != 0) return K8055_ERROR;
 
-    return (Channel == 1) ? CurrDev->data_in[ANALOG_1_OFFSET] : CurrDev->data_in[ANALOG_2_OFFSET];
+    return (Channel == 1) ? snap.analog1 : snap.analog2;
 }
 
 int ReadAllAnalog(long *data1, long *data2)
 {
-    if (ReadK8055Data() != 0) return K8055_ERROR;
+    struct k8055_snapshot snap;
+
+    if (k8055_read_snapshot(CurrDev, &snap, -1) != 0) return K8055_ERROR;
 
-    *data1 = CurrDev->data_in[ANALOG_1_OFFSET];
-    *data2 = CurrDev->data_in[ANALOG_2_OFFSET];
+    *data1 = snap.analog1;
+    *data2 = snap.analog2;
     return 0;
 }
 
 int OutputAnalogChannel(long Channel, long data)
 {
-    if (Channel != 1 && Channel != 2) return K8055_ERROR;
-
-    if (Channel == 1)
-        CurrDev->data_out[ANALOG_1_OFFSET] = (unsigned char)data;
-    else
-        CurrDev->data_out[ANALOG_2_OFFSET] = (unsigned char)data;
-    
-    return WriteK8055Data(CMD_SET_ANALOG_DIGITAL);
+    return k8055_write_analog(CurrDev, Channel, data);
 }
 
 int OutputAllAnalog(long data1, long data2)
 {
-    CurrDev->data_out[ANALOG_1_OFFSET] = (unsigned char)data1;
-    CurrDev->data_out[ANALOG_2_OFFSET] = (unsigned char)data2;
-    return WriteK8055Data(CMD_SET_ANALOG_DIGITAL);
+    return k8055_write_all_analog(CurrDev, data1, data2);
 }
 
 int WriteAllDigital(long data)
 {
-    CurrDev->data_out[DIGITAL_OUT_OFFSET] = (unsigned char)data;
-    return WriteK8055Data(CMD_SET_ANALOG_DIGITAL);
+    return k8055_write_digital(CurrDev, data);
 }
 
 long ReadAllDigital()
 {
-    if (ReadK8055Data() != 0) return K8055_ERROR;
-    
-    return (((CurrDev->data_in[0] >> 4) & 0x03) |
-            ((CurrDev->data_in[0] << 2) & 0x04) |
-            ((CurrDev->data_in[0] >> 3) & 0x18));
+    struct k8055_snapshot snap;
+
+    if (k8055_read_snapshot(CurrDev, &snap, -1) != 0) return K8055_ERROR;
+
+    return snap.digital;
 }
 
+// All inputs from a single transfer (this used to cost two round-trips)
 int ReadAllValues(long *data1, long *data2, long *data3, long *data4, long *data5)
 {
-    if (ReadK8055Data() != 0) return K8055_ERROR;
+    struct k8055_snapshot snap;
 
-    *data1 = ReadAllDigital();
-    *data2 = CurrDev->data_in[ANALOG_1_OFFSET];
-    *data3 = CurrDev->data_in[ANALOG_2_OFFSET];
-    *data4 = CurrDev->data_in[COUNTER_1_OFFSET] | (CurrDev->data_in[COUNTER_1_OFFSET + 1] << 8);
-    *data5 = CurrDev->data_in[COUNTER_2_OFFSET] | (CurrDev->data_in[COUNTER_2_OFFSET + 1] << 8);
+    if (k8055_read_snapshot(CurrDev, &snap, -1) != 0) return K8055_ERROR;
+
+    *data1 = snap.digital;
+    *data2 = snap.analog1;
+    *data3 = snap.analog2;
+    *data4 = snap.counter1;
+    *data5 = snap.counter2;
     return 0;
 }
 
+int ReadSnapshot(struct k8055_snapshot *snap, long max_age_ms)
+{
+    return k8055_read_snapshot(CurrDev, snap, max_age_ms < 0 ? 0 : max_age_ms);
+}
+
+// Maximum age of the last snapshot that the per-channel readers
+// (ReadAnalogChannel, ReadCounter, ReadDigitalChannel, ...) may answer from
+// on the current device. The default of 0 reads the board on every call.
+int SetMaxInputAge(long max_age_ms)
+{
+    return k8055_set_max_input_age(CurrDev, max_age_ms);
+}
+
 int SetAllValues(int DigitalData, int AdData1, int AdData2)
 {
-    CurrDev->data_out[DIGITAL_OUT_OFFSET] = (unsigned char)DigitalData;
-    CurrDev->data_out[ANALOG_1_OFFSET] = (unsigned char)AdData1;
-    CurrDev->data_out[ANALOG_2_OFFSET] = (unsigned char)AdData2;
-    return WriteK8055Data(CMD_SET_ANALOG_DIGITAL);
+    return k8055_write_all(CurrDev, DigitalData, AdData1, AdData2);
 }
 
 int ResetCounter(long CounterNo)
 {
-    if (CounterNo != 1 && CounterNo != 2) return K8055_ERROR;
-    unsigned char cmd = (CounterNo == 1) ? CMD_RESET_COUNTER_1 : CMD_RESET_COUNTER_2;
-    return WriteK8055Data(cmd);
+    return k8055_reset_counter(CurrDev, CounterNo);
 }
 
 long ReadCounter(long CounterNo)
 {
+    struct k8055_snapshot snap;
+
     if (CounterNo != 1 && CounterNo != 2) return K8055_ERROR;
-    if (ReadK8055Data() != 0) return K8055_ERROR;
+    if (k8055_read_snapshot(CurrDev, &snap, -1) != 0) return K8055_ERROR;
     
-    int offset = (CounterNo == 1) ? COUNTER_1_OFFSET : COUNTER_2_OFFSET;
-    return CurrDev->data_in[offset] | (CurrDev->data_in[offset + 1] << 8);
+    return (CounterNo == 1) ? snap.counter1 : snap.counter2;
 }
 
 int SetCounterDebounceTime(long CounterNo, long DebounceTime)
 {
-    float value;
-    if (CounterNo != 1 && CounterNo != 2) return K8055_ERROR;
-
-    if (DebounceTime > 7450) DebounceTime = 7450;
-    if (DebounceTime < 0) DebounceTime = 0;
-    
-    value = sqrtf(DebounceTime / 0.115f);
-    
-    unsigned char int_value = (unsigned char)(value + 0.5f);
-
-    if (CounterNo == 1)
-    {
-        CurrDev->data_out[6] = int_value;
-        return WriteK8055Data(CMD_SET_DEBOUNCE_1);
-    }
-    else
-    {
-        CurrDev->data_out[7] = int_value;
-        return WriteK8055Data(CMD_SET_DEBOUNCE_2);
-    }
+    return k8055_set_counter_debounce(CurrDev, CounterNo, DebounceTime);
 }
 
 // ===================================================================
@@ -386,15 +1223,11 @@ int SetAnalogChannel(long Channel)
 }
 
 int ClearDigitalChannel(long Channel) {
-    if (Channel < 1 || Channel > 8) return K8055_ERROR;
-    unsigned char data = CurrDev->data_out[1] & ~(1 << (Channel-1));
-    return WriteAllDigital(data);
+    return k8055_write_digital_channel(CurrDev, Channel, 0);
 }
 
 int SetDigitalChannel(long Channel) {
-    if (Channel < 1 || Channel > 8) return K8055_ERROR;
-    unsigned char data = CurrDev->data_out[1] | (1 << (Channel-1));
-    return WriteAllDigital(data);
+    return k8055_write_digital_channel(CurrDev, Channel, 1);
 }
 
 int ReadDigitalChannel(long Channel)
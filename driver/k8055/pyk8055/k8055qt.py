@@ -182,31 +182,31 @@ class QTK8055(K8055QT):
 		if self.k != None:
 			try:
 				AllVal = self.k.ReadAllValues()
-				#print AllVal,AllVal[2]
-				self.BarDA1.setValue(255 - AllVal[2])
-				self.BarDA2.setValue(255 - AllVal[3])
-				self.DA1Value.setProperty("intValue",QVariant(AllVal[2]))
-				self.DA2Value.setProperty("intValue",QVariant(AllVal[3]))
-				self.Counter1Value.setProperty("intValue",QVariant(AllVal[4]))
-				self.Counter2Value.setProperty("intValue",QVariant(AllVal[5]))
-
-				if (AllVal[1] & 0x01) > 0:
+				#print AllVal,AllVal[1]
+				self.BarDA1.setValue(255 - AllVal[1])
+				self.BarDA2.setValue(255 - AllVal[2])
+				self.DA1Value.setProperty("intValue",QVariant(AllVal[1]))
+				self.DA2Value.setProperty("intValue",QVariant(AllVal[2]))
+				self.Counter1Value.setProperty("intValue",QVariant(AllVal[3]))
+				self.Counter2Value.setProperty("intValue",QVariant(AllVal[4]))
+
+				if (AllVal[0] & 0x01) > 0:
 					self.DigitalLed1.setState(KLed.On)
 				else:
 					self.DigitalLed1.setState(KLed.Off)
-				if (AllVal[1] & 0x02) > 0:
+				if (AllVal[0] & 0x02) > 0:
 					self.DigitalLed2.setState(KLed.On)
 				else:
 					self.DigitalLed2.setState(KLed.Off)
-				if (AllVal[1] & 0x04) > 0:
+				if (AllVal[0] & 0x04) > 0:
 					self.DigitalLed3.setState(KLed.On)
 				else:
 					self.DigitalLed3.setState(KLed.Off)
-				if (AllVal[1] & 0x08) > 0:
+				if (AllVal[0] & 0x08) > 0:
 					self.DigitalLed4.setState(KLed.On)
 				else:
 					self.DigitalLed4.setState(KLed.Off)
-				if (AllVal[1] & 0x10) > 0:
+				if (AllVal[0] & 0x10) > 0:
 					self.DigitalLed5.setState(KLed.On)
 				else:
 					self.DigitalLed5.setState(KLed.Off)
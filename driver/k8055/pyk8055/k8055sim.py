@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+Software K8055 simulator backend for pyk8055.
+
+Simulated boards speak the same 8-byte packet protocol as the real board
+(and as libk8055.c decodes it), so everything above the packet level --
+the pyk8055.k8055 class, K8055Controller, AutomationEngine -- runs
+unchanged without hardware.
+
+k8055sim does not need the compiled _pyk8055: without it, SimBackend can
+still be driven directly (it implements the libk8055 handle API).
+
+Select it per board:
+
+    k = pyk8055.k8055(0, backend='sim')
+
+or for the whole process through the environment:
+
+    K8055_BACKEND=sim            use the simulator instead of libusb
+    K8055_SIM_BOARDS=0,1         addresses of the simulated boards (default 0)
+    K8055_SIM_LATENCY_MS=1.0     time each transfer takes
+    K8055_SIM_JITTER_MS=0.5      +/- random spread added to that
+    K8055_SIM_SCRIPT=file.json   scripted inputs, see SimulatedBoard.load_script()
+"""
+
+import collections
+import json
+import os
+import random
+import threading
+import time
+
+try:
+    # pyk8055's own exception, so that callers catch one type whichever backend a board uses
+    from pyk8055 import K8055Error, LATENCY_BUCKET_LIMITS_US
+except ImportError:
+    # Without the compiled _pyk8055 (no libusb, nothing built) the simulator still runs on its own through
+    # SimBackend, e.g. for tests in CI
+    class K8055Error(IOError):
+        """A failed transfer or an unusable board, as K8055Error."""
+
+    K8055_LATENCY_BUCKETS, K8055_LATENCY_BASE_US = 16, 64   # As in k8055.h
+    LATENCY_BUCKET_LIMITS_US = tuple(K8055_LATENCY_BASE_US << i for i in range(K8055_LATENCY_BUCKETS - 1)) + (float('inf'),)
+
+PACKET_LEN = 8
+
+# Packet layout and commands, as in libk8055.c
+DIGITAL_INP_OFFSET = 0
+DIGITAL_OUT_OFFSET = 1
+ANALOG_1_OFFSET = 2
+ANALOG_2_OFFSET = 3
+COUNTER_1_OFFSET = 4
+COUNTER_2_OFFSET = 6
+
+CMD_RESET = 0x00
+CMD_SET_DEBOUNCE_1 = 0x01
+CMD_SET_DEBOUNCE_2 = 0x02
+CMD_RESET_COUNTER_1 = 0x03
+CMD_RESET_COUNTER_2 = 0x04
+CMD_SET_ANALOG_DIGITAL = 0x05
+
+STREAM_RING = 256           # Frames queued per board while streaming
+STREAM_REPORT_INTERVAL = 0.01  # A board sends an input report every 10 ms
+STREAM_MAX_ERRORS = 8       # Failed transfers in a row that end a stream
+
+
+def encode_digital(digital):
+    """Scramble inputs I1..I5 into the board's input byte (inverse of libk8055's DecodeDigital)."""
+    return ((digital & 0x03) << 4) | ((digital & 0x04) >> 2) | ((digital & 0x18) << 3)
+
+
+def decode_digital(byte):
+    """Unscramble the board's input byte into I1..I5 order."""
+    return ((byte >> 4) & 0x03) | ((byte << 2) & 0x04) | ((byte >> 3) & 0x18)
+
+
+def decode_packet(packet, timestamp):
+    """An input packet as the tuple returned by k8055_read_snapshot()."""
+    return (decode_digital(packet[DIGITAL_INP_OFFSET]),
+            packet[ANALOG_1_OFFSET], packet[ANALOG_2_OFFSET],
+            packet[COUNTER_1_OFFSET] | (packet[COUNTER_1_OFFSET + 1] << 8),
+            packet[COUNTER_2_OFFSET] | (packet[COUNTER_2_OFFSET + 1] << 8),
+            timestamp)
+
+
+class SimulatedBoard:
+    """One simulated K8055 at a given address (0-3).
+
+    Inputs are set directly (set_inputs, set_digital_input, pulse) or
+    from a script; outputs are whatever the last packet written set.
+    """
+    def __init__(self, address, latency_ms=0.0, jitter_ms=0.0, rng=None):
+        self.address = address
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.digital_inputs = 0
+        self.analog_inputs = [0, 0]
+        self.counters = [0, 0]
+        self.debounce = [0, 0]
+        self.digital_outputs = 0
+        self.analog_outputs = [0, 0]
+        self.packets_in = self.packets_out = 0
+        self._fail_transfers = 0
+        self._script, self._script_start = [], None
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+
+    # --- Input stimulus ---
+
+    def set_inputs(self, digital=None, analog1=None, analog2=None, counter1=None, counter2=None):
+        """Set any of the board's inputs; None leaves a value unchanged."""
+        with self._lock:
+            self._apply(dict(digital=digital, analog1=analog1, analog2=analog2,
+                             counter1=counter1, counter2=counter2))
+
+    def set_digital_input(self, channel, state):
+        """Set digital input channel (1-5) to 0 or 1."""
+        with self._lock:
+            bit = 1 << (channel - 1)
+            self.digital_inputs = (self.digital_inputs | bit) if state else (self.digital_inputs & ~bit)
+
+    def pulse(self, counter, count=1):
+        """Add count pulses to counter 1 or 2 (wrapping at 16 bits like the board)."""
+        with self._lock:
+            self.counters[counter - 1] = (self.counters[counter - 1] + count) & 0xFFFF
+
+    def load_script(self, steps):
+        """Play back inputs over time. steps is a list of [seconds, {field: value}]
+        with fields digital, analog1, analog2, counter1, counter2 (absolute)
+        and pulses1, pulses2 (added to the counters). Times are relative to
+        the first transfer after loading.
+        """
+        with self._lock:
+            self._script = sorted(([float(t), dict(values)] for t, values in steps), key=lambda step: step[0])
+            self._script_start = None
+
+    def fail_next_transfers(self, count):
+        """Make the next count transfers time out, to exercise retry policies."""
+        with self._lock:
+            self._fail_transfers += count
+
+    def _apply(self, values):
+        if values.get('digital') is not None: self.digital_inputs = values['digital'] & 0x1F
+        for i in (1, 2):
+            if values.get(f'analog{i}') is not None: self.analog_inputs[i - 1] = values[f'analog{i}'] & 0xFF
+            if values.get(f'counter{i}') is not None: self.counters[i - 1] = values[f'counter{i}'] & 0xFFFF
+            if values.get(f'pulses{i}'): self.counters[i - 1] = (self.counters[i - 1] + values[f'pulses{i}']) & 0xFFFF
+
+    def _run_script(self, now):
+        if not self._script: return
+        if self._script_start is None: self._script_start = now
+        while self._script and now - self._script_start >= self._script[0][0]:
+            self._apply(self._script.pop(0)[1])
+
+    # --- Packet protocol ---
+
+    def _wait(self, timeout_ms):
+        # Returns False if this transfer is to time out
+        with self._lock:
+            failing = self._fail_transfers > 0
+            if failing: self._fail_transfers -= 1
+        delay = timeout_ms if failing else self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0: time.sleep(delay / 1000.0)
+        return not failing
+
+    def transfer_in(self, timeout_ms=200):
+        """One interrupt-IN transfer: returns the 8-byte input packet, or None on timeout."""
+        if not self._wait(timeout_ms): return None
+        with self._lock:
+            self._run_script(time.monotonic())
+            self.packets_in += 1
+            return bytes([encode_digital(self.digital_inputs), self.address + 1,
+                          self.analog_inputs[0], self.analog_inputs[1],
+                          self.counters[0] & 0xFF, self.counters[0] >> 8,
+                          self.counters[1] & 0xFF, self.counters[1] >> 8])
+
+    def transfer_out(self, packet, timeout_ms=200):
+        """One interrupt-OUT transfer of an 8-byte command packet. Returns False on timeout."""
+        if len(packet) != PACKET_LEN: raise ValueError("K8055 packets are 8 bytes")
+        if not self._wait(timeout_ms): return False
+        with self._lock:
+            self.packets_out += 1
+            cmd = packet[0]
+            if cmd == CMD_RESET:
+                self.counters = [0, 0]
+                self.digital_outputs, self.analog_outputs = 0, [0, 0]
+            elif cmd == CMD_SET_DEBOUNCE_1: self.debounce[0] = packet[6]
+            elif cmd == CMD_SET_DEBOUNCE_2: self.debounce[1] = packet[7]
+            elif cmd == CMD_RESET_COUNTER_1: self.counters[0] = 0
+            elif cmd == CMD_RESET_COUNTER_2: self.counters[1] = 0
+            elif cmd == CMD_SET_ANALOG_DIGITAL:
+                self.digital_outputs = packet[DIGITAL_OUT_OFFSET]
+                self.analog_outputs = [packet[ANALOG_1_OFFSET], packet[ANALOG_2_OFFSET]]
+            return True
+
+
+class _SimHandle:
+    # Counterpart of libk8055's struct k8055_dev for a simulated board
+    def __init__(self, backend, address):
+        self.backend, self.address = backend, address
+        self.open, self.refs = False, 0
+        self.data_in, self.data_out = bytes(PACKET_LEN), bytearray(PACKET_LEN)
+        self.read_time, self.max_age_ms = 0.0, 0
+        self.attempts, self.timeout_ms = 3, 200
+        self.stats = None
+        self.lock = threading.Lock()
+        self.stream = None
+
+    def board(self):
+        board = self.backend.boards.get(self.address) if self.open else None
+        if board is None: raise K8055Error(f"K8055 board {self.address}: board is not connected")
+        return board
+
+
+class _SimStream:
+    def __init__(self, handle):
+        self.frames = collections.deque()
+        self.latest, self.dropped = None, 0
+        self.running, self.dead = True, False
+        self.thread = threading.Thread(target=self._run, args=(handle,), daemon=True)
+
+    def _run(self, handle):
+        next_report, errors = time.monotonic(), 0
+        while self.running:
+            try: packet = handle.board().transfer_in(handle.timeout_ms)
+            except K8055Error: self.dead = True; return
+            errors = 0 if packet is not None else errors + 1
+            if errors >= STREAM_MAX_ERRORS: self.dead = True; return
+            if packet is not None:
+                frame = decode_packet(packet, time.monotonic())
+                self.latest = frame
+                if len(self.frames) >= STREAM_RING: self.dropped += 1
+                else: self.frames.append(frame)
+            next_report += STREAM_REPORT_INTERVAL
+            time.sleep(max(0.0, next_report - time.monotonic()))
+
+
+class SimBackend:
+    """A simulated USB bus holding up to four K8055 boards.
+
+    Implements the same calls as the libk8055 handle API (k8055_open,
+    k8055_read_snapshot, ...), with the same return values and the same
+    K8055Error exceptions, so pyk8055.k8055 can use either.
+    """
+    name = 'sim'
+
+    def __init__(self, addresses=(0,), latency_ms=0.0, jitter_ms=0.0, seed=None):
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self._rng = random.Random(seed)
+        self.boards = {}
+        self._handles = {}
+        self._hotplug_events, self._hotplug_active = collections.deque(), False
+        self._lock = threading.Lock()
+        for address in addresses: self.plug(address)
+
+    # --- Bus control (simulator only) ---
+
+    def plug(self, address):
+        """Connect a simulated board at address (0-3) and return it."""
+        if address not in range(4): raise ValueError(f"Board address must be 0-3, not {address!r}")
+        with self._lock:
+            board = self.boards.get(address)
+            if board is None:
+                board = self.boards[address] = SimulatedBoard(address, self.latency_ms, self.jitter_ms, self._rng)
+                if self._hotplug_active: self._hotplug_events.append((address, 1))
+            return board
+
+    def unplug(self, address):
+        """Disconnect the simulated board at address."""
+        with self._lock:
+            if self.boards.pop(address, None) is not None and self._hotplug_active:
+                self._hotplug_events.append((address, 0))
+
+    def board(self, address):
+        """The SimulatedBoard at address, for stimulating inputs and checking outputs."""
+        return self.boards[address]
+
+    # --- libk8055 handle API ---
+
+    def search_devices(self):
+        return sum(1 << address for address in self.boards)
+
+    def open(self, address):
+        with self._lock:
+            handle = self._handles.setdefault(address, _SimHandle(self, address))
+        with handle.lock:
+            # Like k8055_open(): opening an open board shares its handle, and the last close closes it
+            if handle.open: handle.refs += 1; return handle
+            if address not in self.boards:
+                raise K8055Error(f"Could not open K8055 board {address}. Check connection, permissions (udev), and address.")
+            handle.open, handle.refs = True, 1
+            handle.read_time, handle.max_age_ms = 0.0, 0
+            handle.attempts, handle.timeout_ms = 3, 200
+            handle.stats = _new_stats()
+            handle.data_out = bytearray(PACKET_LEN)
+            self._write(handle, CMD_RESET, "open")
+            self._read(handle, "open")
+        return handle
+
+    def close(self, handle):
+        with handle.lock:
+            if handle.refs > 1: handle.refs -= 1; return
+        self.stream_stop(handle)
+        with handle.lock:
+            handle.open, handle.refs, handle.read_time = False, 0, 0.0
+
+    def address(self, handle):
+        return handle.address
+
+    def read_snapshot(self, handle, max_age_ms):
+        stream = handle.stream
+        if stream is not None and not stream.dead:
+            # As in libk8055: until the first streamed frame arrives, wait for it rather than read the board
+            deadline = time.monotonic() + handle.timeout_ms / 1000.0
+            while stream.latest is None and not stream.dead and handle.stream is stream:
+                if time.monotonic() >= deadline: raise K8055Error(f"K8055 board {handle.address}: read failed (LIBUSB_ERROR_TIMEOUT)")
+                time.sleep(0.001)
+            if stream.latest is not None: return stream.latest
+        with handle.lock:
+            age = handle.max_age_ms if max_age_ms < 0 else max_age_ms
+            if not (age > 0 and handle.read_time > 0 and (time.monotonic() - handle.read_time) * 1000.0 <= age):
+                self._read(handle, "read")
+            return decode_packet(handle.data_in, handle.read_time)
+
+    def set_max_input_age(self, handle, max_age_ms):
+        with handle.lock: handle.max_age_ms = max(0, max_age_ms)
+        handle.board()
+
+    def write_all(self, handle, digital, analog1, analog2):
+        self._update_and_write(handle, {DIGITAL_OUT_OFFSET: digital, ANALOG_1_OFFSET: analog1, ANALOG_2_OFFSET: analog2})
+
+    def write_digital(self, handle, data):
+        self._update_and_write(handle, {DIGITAL_OUT_OFFSET: data})
+
+    def write_digital_channel(self, handle, channel, state):
+        if not 1 <= channel <= 8: raise K8055Error(f"K8055 board {handle.address}: write failed")
+        with handle.lock:
+            bit = 1 << (channel - 1)
+            data = handle.data_out[DIGITAL_OUT_OFFSET]
+            handle.data_out[DIGITAL_OUT_OFFSET] = (data | bit) if state else (data & ~bit & 0xFF)
+            self._write(handle, CMD_SET_ANALOG_DIGITAL, "write")
+
+    def write_analog(self, handle, channel, data):
+        if channel not in (1, 2): raise K8055Error(f"K8055 board {handle.address}: write failed")
+        self._update_and_write(handle, {ANALOG_1_OFFSET if channel == 1 else ANALOG_2_OFFSET: data})
+
+    def write_all_analog(self, handle, analog1, analog2):
+        self._update_and_write(handle, {ANALOG_1_OFFSET: analog1, ANALOG_2_OFFSET: analog2})
+
+    def reset_counter(self, handle, counterno):
+        with handle.lock: self._write(handle, CMD_RESET_COUNTER_1 if counterno == 1 else CMD_RESET_COUNTER_2, "counter reset")
+
+    def set_counter_debounce(self, handle, counterno, debounce_ms):
+        value = int((min(max(debounce_ms, 0), 7450) / 0.115) ** 0.5 + 0.5)
+        with handle.lock:
+            handle.data_out[6 if counterno == 1 else 7] = value
+            self._write(handle, CMD_SET_DEBOUNCE_1 if counterno == 1 else CMD_SET_DEBOUNCE_2, "setting the debounce time")
+
+    def set_retry_policy(self, handle, attempts, timeout_ms):
+        if attempts < 1 or timeout_ms < 1: raise K8055Error(f"K8055 board {handle.address}: setting the retry policy failed")
+        with handle.lock: handle.attempts, handle.timeout_ms = attempts, timeout_ms
+
+    def get_stats(self, handle):
+        with handle.lock:
+            stats = dict(handle.stats or _new_stats())
+            stats['latency_histogram'] = list(stats['latency_histogram'])
+            return stats
+
+    def reset_stats(self, handle):
+        with handle.lock: handle.stats = _new_stats()
+
+    def stream_start(self, handle, depth):
+        handle.board()
+        if handle.stream is not None and handle.stream.dead: self.stream_stop(handle)
+        if handle.stream is None:
+            handle.stream = _SimStream(handle); handle.stream.thread.start()
+
+    def stream_stop(self, handle):
+        stream, handle.stream = handle.stream, None
+        if stream is not None:
+            stream.running = False; stream.thread.join()
+
+    def stream_read(self, handle):
+        stream = handle.stream
+        if stream is not None and stream.frames: return stream.frames.popleft()
+        if stream is None or stream.dead:
+            raise K8055Error(f"K8055 board {handle.address}: input stream is not running")
+        return None
+
+    def stream_dropped(self, handle):
+        return handle.stream.dropped if handle.stream is not None else 0
+
+    def hotplug_supported(self):
+        return True
+
+    def hotplug_start(self):
+        self._hotplug_active = True
+
+    def hotplug_stop(self):
+        self._hotplug_active = False; self._hotplug_events.clear()
+
+    def hotplug_poll(self):
+        try: address, arrived = self._hotplug_events.popleft()
+        except IndexError: return 0, 0, 0
+        return 1, address, arrived
+
+    # --- Transfers (caller holds handle.lock) ---
+
+    def _update_and_write(self, handle, fields):
+        with handle.lock:
+            for offset, value in fields.items(): handle.data_out[offset] = value & 0xFF
+            self._write(handle, CMD_SET_ANALOG_DIGITAL, "write")
+
+    def _read(self, handle, what):
+        board, stats = handle.board(), handle.stats
+        for attempt in range(handle.attempts):
+            if attempt: stats['read_retries'] += 1
+            start = time.monotonic(); packet = board.transfer_in(handle.timeout_ms); _account(stats, start, packet is None)
+            if packet is not None and packet[1] % 10 == handle.address + 1:
+                handle.data_in, handle.read_time = packet, time.monotonic(); stats['reads'] += 1
+                return
+            if packet is not None: stats['id_mismatches'] += 1
+        stats['read_failures'] += 1
+        raise K8055Error(f"K8055 board {handle.address}: {what} failed (LIBUSB_ERROR_TIMEOUT)")
+
+    def _write(self, handle, cmd, what):
+        board, stats = handle.board(), handle.stats
+        handle.data_out[0] = cmd
+        for attempt in range(handle.attempts):
+            if attempt: stats['write_retries'] += 1
+            start = time.monotonic(); ok = board.transfer_out(bytes(handle.data_out), handle.timeout_ms); _account(stats, start, not ok)
+            if ok: stats['writes'] += 1; return
+        stats['write_failures'] += 1
+        raise K8055Error(f"K8055 board {handle.address}: {what} failed (LIBUSB_ERROR_TIMEOUT)")
+
+
+def _new_stats():
+    return dict(reads=0, writes=0, read_retries=0, write_retries=0, read_failures=0,
+                write_failures=0, timeouts=0, id_mismatches=0,
+                latency_histogram=[0] * len(LATENCY_BUCKET_LIMITS_US))
+
+
+def _account(stats, start, timed_out):
+    elapsed_us = (time.monotonic() - start) * 1e6
+    bucket = next(i for i, limit in enumerate(LATENCY_BUCKET_LIMITS_US) if elapsed_us < limit)
+    stats['latency_histogram'][bucket] += 1
+    if timed_out: stats['timeouts'] += 1
+
+
+_default_backend = None
+_default_lock = threading.Lock()
+
+
+def default_backend():
+    """The process-wide simulated bus, configured from the K8055_SIM_* environment variables."""
+    global _default_backend
+    with _default_lock:
+        if _default_backend is None:
+            addresses = [int(a) for a in os.environ.get('K8055_SIM_BOARDS', '0').split(',') if a.strip()]
+            _default_backend = SimBackend(addresses,
+                                          latency_ms=float(os.environ.get('K8055_SIM_LATENCY_MS', 0)),
+                                          jitter_ms=float(os.environ.get('K8055_SIM_JITTER_MS', 0)))
+            script_path = os.environ.get('K8055_SIM_SCRIPT')
+            if script_path:
+                # {"0": [[seconds, {"digital": 1, "analog1": 128}], ...], "1": [...]}
+                with open(script_path) as f: scripts = json.load(f)
+                for address, steps in scripts.items():
+                    if int(address) in _default_backend.boards: _default_backend.board(int(address)).load_script(steps)
+        return _default_backend
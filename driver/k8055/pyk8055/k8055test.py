@@ -19,9 +19,9 @@ try:
 	k.OutputAnalogChannel(1,0)
 
 	# read both analog inputs
-	# note: this returns a list
+	# note: this returns a tuple
 	res = k.ReadAllAnalog()
-	print res[1:]
+	print res
 
 	# Test class string function
 	print str(k)
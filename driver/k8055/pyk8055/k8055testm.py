@@ -28,9 +28,9 @@ try:
 		k.OutputAnalogChannel(1,0)
 
 		# read both analog inputs
-		# note: this returns a list
+		# note: this returns a tuple
 		res = k.ReadAllAnalog()
-		print "Analog status, board #",k.DeviceAddress(),res[1:]
+		print "Analog status, board #",k.DeviceAddress(),res
 
 		# Test class string function
 		print "Status, board #",k.DeviceAddress(),str(k)
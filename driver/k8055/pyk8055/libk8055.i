@@ -3,12 +3,127 @@
  *   Modernized for Python 3 and to link against the shared library.
  *   Copyright (C) 2007  by Pjetur G. Hjaltason
  */
-%module pyk8055
+%module(threads="1") pyk8055
 %include "typemaps.i"
 
+/* Every call that may block on a USB transfer (or on another thread's
+   transfer to the same board) runs with the GIL released, so a slow or
+   flaky board never stalls the other Python threads. Only the calls that
+   are guaranteed not to block keep the GIL. */
+%nothread Version;
+%nothread SetCurrentDevice;
+%nothread k8055_address;
+%nothread k8055_last_error;
+
 /* This SWIG typemap correctly handles C functions that use pointers
    to return multiple values, converting them into a Python tuple. */
 %apply long *OUTPUT { long int *data1, long int *data2, long int *data3, long int *data4, long int *data5 };
+%apply long *OUTPUT { long *address };
+%apply int *OUTPUT { int *arrived };
+
+/* ReadSnapshot fills a caller-owned struct; hand it back to Python as a
+   plain tuple (digital, analog1, analog2, counter1, counter2, timestamp)
+   appended to the return code (or on its own for k8055_read_snapshot). */
+%typemap(in, numinputs=0) struct k8055_snapshot *snap (struct k8055_snapshot temp) {
+    memset(&temp, 0, sizeof(temp));
+    $1 = &temp;
+}
+%typemap(argout) struct k8055_snapshot *snap {
+    $result = SWIG_AppendOutput($result, Py_BuildValue("(llllld)",
+        $1->digital, $1->analog1, $1->analog2, $1->counter1, $1->counter2, $1->timestamp));
+}
+
+/* The k8055_* handle functions raise K8055Error (an IOError) instead of
+   returning K8055_ERROR, and return None on success. */
+%{
+static PyObject *k8055_error = NULL;
+%}
+%init %{
+    k8055_error = PyErr_NewException("pyk8055.K8055Error", PyExc_IOError, NULL);
+    Py_INCREF(k8055_error);
+    PyModule_AddObject(m, "K8055Error", k8055_error);
+%}
+
+%define K8055_RAISE_ON_ERROR(func, what)
+%typemap(out) int func {
+    if ($1 < 0) {
+        const char *reason = k8055_last_error(arg1);
+        PyErr_Format(k8055_error, "K8055 board %ld: " what " failed%s%s%s", k8055_address(arg1),
+                     *reason ? " (" : "", reason, *reason ? ")" : "");
+        SWIG_fail;
+    }
+    $result = SWIG_Py_Void();
+}
+%enddef
+
+K8055_RAISE_ON_ERROR(k8055_close, "close")
+K8055_RAISE_ON_ERROR(k8055_read_snapshot, "read")
+K8055_RAISE_ON_ERROR(k8055_set_max_input_age, "setting the input age")
+K8055_RAISE_ON_ERROR(k8055_write_all, "write")
+K8055_RAISE_ON_ERROR(k8055_write_digital, "write")
+K8055_RAISE_ON_ERROR(k8055_write_digital_channel, "write")
+K8055_RAISE_ON_ERROR(k8055_write_analog, "write")
+K8055_RAISE_ON_ERROR(k8055_write_all_analog, "write")
+K8055_RAISE_ON_ERROR(k8055_reset_counter, "counter reset")
+K8055_RAISE_ON_ERROR(k8055_set_counter_debounce, "setting the debounce time")
+K8055_RAISE_ON_ERROR(k8055_stream_start, "starting the input stream")
+K8055_RAISE_ON_ERROR(k8055_set_retry_policy, "setting the retry policy")
+K8055_RAISE_ON_ERROR(k8055_get_stats, "reading the statistics")
+K8055_RAISE_ON_ERROR(k8055_reset_stats, "resetting the statistics")
+
+/* k8055_get_stats returns the counters as a dict */
+%typemap(in, numinputs=0) struct k8055_stats *stats (struct k8055_stats temp) {
+    memset(&temp, 0, sizeof(temp));
+    $1 = &temp;
+}
+%typemap(argout) struct k8055_stats *stats {
+    PyObject *hist = PyList_New(K8055_LATENCY_BUCKETS);
+    int i;
+    for (i = 0; i < K8055_LATENCY_BUCKETS; i++) {
+        PyList_SET_ITEM(hist, i, PyLong_FromUnsignedLong($1->latency_histogram[i]));
+    }
+    $result = SWIG_AppendOutput($result, Py_BuildValue("{s:k,s:k,s:k,s:k,s:k,s:k,s:k,s:k,s:N}",
+        "reads", $1->reads, "writes", $1->writes,
+        "read_retries", $1->read_retries, "write_retries", $1->write_retries,
+        "read_failures", $1->read_failures, "write_failures", $1->write_failures,
+        "timeouts", $1->timeouts, "id_mismatches", $1->id_mismatches,
+        "latency_histogram", hist));
+}
+K8055_RAISE_ON_ERROR(k8055_stream_stop, "stopping the input stream")
+
+%typemap(out) int k8055_hotplug_start {
+    if ($1 < 0) {
+        PyErr_SetString(k8055_error, "Could not register for USB hotplug events");
+        SWIG_fail;
+    }
+    $result = SWIG_Py_Void();
+}
+
+/* k8055_stream_read returns the frame tuple, or None if nothing is queued */
+%typemap(in, numinputs=0) struct k8055_snapshot *frame (struct k8055_snapshot temp) {
+    $1 = &temp;
+}
+%typemap(out) int k8055_stream_read {
+    if ($1 < 0) {
+        PyErr_Format(k8055_error, "K8055 board %ld: input stream is not running", k8055_address(arg1));
+        SWIG_fail;
+    }
+    $result = SWIG_Py_Void();
+}
+%typemap(argout) struct k8055_snapshot *frame {
+    if (result == 1) {
+        $result = SWIG_AppendOutput($result, Py_BuildValue("(llllld)",
+            $1->digital, $1->analog1, $1->analog2, $1->counter1, $1->counter2, $1->timestamp));
+    }
+}
+
+%typemap(out) struct k8055_dev *k8055_open {
+    if (!$1) {
+        PyErr_Format(k8055_error, "Could not open K8055 board %ld. Check connection, permissions (udev), and address.", arg1);
+        SWIG_fail;
+    }
+    $result = SWIG_NewPointerObj(SWIG_as_voidptr($1), $1_descriptor, 0);
+}
 
 /*
  * The inline C functions below that accessed global variables (data_in, data_out)
@@ -39,33 +154,151 @@
  * It has been updated for Python 3 syntax.
 */
 %pythoncode %{
+import os
+import time
+from collections import namedtuple
+
 K8055_ERROR = -1
-_K8055_CLOSED = -1
+K8055Error = _pyk8055.K8055Error
+
+# All inputs of the board as decoded from one input packet. timestamp is the
+# time.monotonic() value at which the packet arrived.
+K8055Snapshot = namedtuple('K8055Snapshot', 'digital analog1 analog2 counter1 counter2 timestamp')
+
+# Upper limit (microseconds) of each latency_histogram bucket of GetStats()
+LATENCY_BUCKET_LIMITS_US = tuple(K8055_LATENCY_BASE_US << i for i in range(K8055_LATENCY_BUCKETS - 1)) + (float('inf'),)
+
+def _check_channel(value, valid, what):
+    if value not in valid:
+        raise ValueError(f"{what} must be one of {valid[0]}-{valid[-1]}, not {value!r}")
+
+class _UsbBackend:
+    # The libk8055 handle API, under the names the simulator backend
+    # (k8055sim.SimBackend) implements as well
+    name = 'usb'
+    search_devices = staticmethod(SearchDevices)
+    open = staticmethod(k8055_open)
+    close = staticmethod(k8055_close)
+    address = staticmethod(k8055_address)
+    read_snapshot = staticmethod(k8055_read_snapshot)
+    set_max_input_age = staticmethod(k8055_set_max_input_age)
+    write_all = staticmethod(k8055_write_all)
+    write_digital = staticmethod(k8055_write_digital)
+    write_digital_channel = staticmethod(k8055_write_digital_channel)
+    write_analog = staticmethod(k8055_write_analog)
+    write_all_analog = staticmethod(k8055_write_all_analog)
+    reset_counter = staticmethod(k8055_reset_counter)
+    set_counter_debounce = staticmethod(k8055_set_counter_debounce)
+    set_retry_policy = staticmethod(k8055_set_retry_policy)
+    get_stats = staticmethod(k8055_get_stats)
+    reset_stats = staticmethod(k8055_reset_stats)
+    stream_start = staticmethod(k8055_stream_start)
+    stream_stop = staticmethod(k8055_stream_stop)
+    stream_read = staticmethod(k8055_stream_read)
+    stream_dropped = staticmethod(k8055_stream_dropped)
+    hotplug_supported = staticmethod(k8055_hotplug_supported)
+    hotplug_start = staticmethod(k8055_hotplug_start)
+    hotplug_stop = staticmethod(k8055_hotplug_stop)
+    hotplug_poll = staticmethod(k8055_hotplug_poll)
+
+def GetBackend(backend=None):
+    """The backend that talks to the boards: 'usb' (libk8055), 'sim' (the
+    k8055sim software simulator) or a backend object such as a
+    k8055sim.SimBackend. None selects $K8055_BACKEND, default 'usb'.
+    """
+    if backend is None:
+        backend = os.environ.get('K8055_BACKEND') or 'usb'
+    if backend == 'usb':
+        return _UsbBackend
+    if backend == 'sim':
+        import k8055sim
+        return k8055sim.default_backend()
+    if isinstance(backend, str):
+        raise ValueError(f"Unknown K8055 backend {backend!r} (expected 'usb' or 'sim')")
+    return backend
+
+def SearchDevices(backend=None):
+    """Returns a bitmask of the connected boards (bit n = address n)."""
+    return GetBackend(backend).search_devices()
+
+def HotplugSupported(backend=None):
+    """True if board arrival and removal can be reported without polling."""
+    return bool(GetBackend(backend).hotplug_supported())
+
+class HotplugMonitor:
+    """Board arrival and removal events, pushed by libusb hotplug.
+
+    m = HotplugMonitor()    # Throws K8055Error where hotplug is unsupported
+    for address, arrived in m.Poll(): ...
+
+    Poll() never touches the bus. An address of None means events were
+    lost; rescan with SearchDevices() then. The event queue is shared by
+    the whole process, so use a single monitor.
+    """
+    def __init__(self, backend=None):
+        self._io = GetBackend(backend)
+        self._io.hotplug_start()
+        self._active = True
+
+    def Poll(self):
+        """Returns the pending (address, arrived) events, oldest first."""
+        events = []
+        while True:
+            rc, address, arrived = self._io.hotplug_poll()
+            if rc != 1: return events
+            events.append((None if address < 0 else address, bool(arrived)))
+
+    def Close(self):
+        """Stop receiving events."""
+        if self._active:
+            self._active = False
+            self._io.hotplug_stop()
 
 class k8055:
-    "Class interface to the libk8055 library (Python 3)"
-    def __init__(self, BoardAddress=None):
+    """Class interface to the libk8055 library (Python 3).
+
+    Each instance is bound to its own device handle, so instances for
+    different boards never interfere and need no SetCurrentDevice().
+    The USB transfers run without the GIL, so several threads can use
+    several boards at once. With backend='sim' (or K8055_BACKEND=sim in
+    the environment) the boards are simulated by k8055sim instead.
+
+    Failures raise K8055Error (a subclass of IOError) instead of
+    returning K8055_ERROR; invalid channel numbers raise ValueError.
+    """
+    def __init__(self, BoardAddress=None, backend=None):
         """Constructor, optionally opens the board.
 
          k=k8055()      # Does not connect to the board.
          k=k8055(0)     # Connects to the board at address 0.
+         k=k8055(0, backend='sim')  # Connects to a simulated board.
         """
-        self.dev = _K8055_CLOSED
+        self._io = GetBackend(backend)
+        self.handle = None
         self.Address = BoardAddress
+        self._streaming = False
         if BoardAddress is not None:
             self.OpenDevice(BoardAddress)
 
     def __str__(self):
         """String format (almost) as from K8055 program"""
         if self.__opentest():    # Device open
-            all_values = self.ReadAllValues()
-            # The C function returns a tuple; we format the actual values.
-            return f"{all_values[0]};{all_values[1]};{all_values[2]};{all_values[3]};{all_values[4]}"
+            snap = self.ReadSnapshot()
+            return f"{snap.digital};{snap.analog1};{snap.analog2};{snap.counter1};{snap.counter2}"
         else:
             return "Device is not open."
 
     def __opentest(self):
-        return self.dev != _K8055_CLOSED
+        return self.handle is not None
+
+    def __handle(self):
+        if self.handle is None:
+            raise K8055Error("Device is not open.")
+        return self.handle
+
+    def __read(self, max_age_ms):
+        # None means the device default set with SetMaxInputAge()
+        return K8055Snapshot(*self._io.read_snapshot(self.__handle(), -1 if max_age_ms is None else int(max_age_ms)))
 
     def OpenDevice(self, BoardAddress):
         """Open the connection to the K8055 board.
@@ -75,118 +308,118 @@ class k8055:
            k.OpenDevice(0) # possible addresses are 0, 1, 2, 3
         except IOError:
             ...
-        Throws IOError if the board is not found or cannot be accessed.
+        Throws K8055Error (an IOError) if the board is not found or cannot be accessed.
+        Instances opened on the same address share the board, which stays
+        open until every one of them is closed.
         """
         if not self.__opentest():    # Not open yet
-            self.dev = OpenDevice(BoardAddress)
-            if self.dev == K8055_ERROR:
-                # Correct Python 3 exception syntax
-                raise IOError("Could not open device. Check connection, permissions (udev), and address.")
+            _check_channel(BoardAddress, (0, 1, 2, 3), "Board address")
+            self.handle = self._io.open(BoardAddress)
             self.Address = BoardAddress
-        return self.dev
+        return self.Address
 
     def CloseDevice(self):
-        """Close the connection to the K8055 board. Returns 0 if OK."""
-        if self.dev != _K8055_CLOSED:
-            ret = CloseDevice()
-            self.dev = _K8055_CLOSED
-            return ret
+        """Close the connection to the K8055 board."""
+        if self.__opentest():
+            handle, self.handle, self._streaming = self.handle, None, False
+            self._io.close(handle)
 
     def OutputAnalogChannel(self, Channel, value=0):
         """Set analog output channel value (0-255)."""
-        if not self.__opentest(): return K8055_ERROR
-        return OutputAnalogChannel(Channel, value)
+        _check_channel(Channel, (1, 2), "Analog channel")
+        self._io.write_analog(self.__handle(), Channel, value)
 
-    def ReadAnalogChannel(self, Channel):
-        """Read data from an analog input channel (1 or 2)."""
-        if not self.__opentest(): return K8055_ERROR
-        return ReadAnalogChannel(Channel)
+    def ReadAnalogChannel(self, Channel, max_age_ms=None):
+        """Read data from an analog input channel (1 or 2).
+        With max_age_ms, answers from a snapshot at most that old.
+        """
+        _check_channel(Channel, (1, 2), "Analog channel")
+        return self.__read(max_age_ms)[Channel]
 
     def ReadAllAnalog(self):
         """Read data from both analog input channels at once.
         Returns a tuple: (analog1, analog2)
         """
-        if not self.__opentest(): return K8055_ERROR, K8055_ERROR
-        return ReadAllAnalog()
+        snap = self.__read(None)
+        return snap.analog1, snap.analog2
 
     def OutputAllAnalog(self, data1, data2):
         """Set both analog output channels at once (0-255)."""
-        if not self.__opentest(): return K8055_ERROR
-        return OutputAllAnalog(data1, data2)
+        self._io.write_all_analog(self.__handle(), data1, data2)
 
     def ClearAllAnalog(self):
         """Set both analog output channels to 0."""
-        if not self.__opentest(): return K8055_ERROR
-        return ClearAllAnalog()
+        self.OutputAllAnalog(0, 0)
 
     def ClearAnalogChannel(self, Channel):
         """Set an analog output channel (1 or 2) to 0."""
-        if not self.__opentest(): return K8055_ERROR
-        return ClearAnalogChannel(Channel)
+        self.OutputAnalogChannel(Channel, 0)
 
     def SetAnalogChannel(self, Channel):
         """Set an analog output channel (1 or 2) to 255 (high)."""
-        if not self.__opentest(): return K8055_ERROR
-        return SetAnalogChannel(Channel)
+        self.OutputAnalogChannel(Channel, 255)
 
     def SetAllAnalog(self):
         """Set both analog output channels to 255 (high)."""
-        if not self.__opentest(): return K8055_ERROR
-        return SetAllAnalog()
+        self.OutputAllAnalog(255, 255)
 
     def WriteAllDigital(self, data):
         """Write a bitmask to the digital output channels (0-255)."""
-        if not self.__opentest(): return K8055_ERROR
-        return WriteAllDigital(data)
+        self._io.write_digital(self.__handle(), data)
 
     def ClearDigitalChannel(self, Channel):
         """Clear a single digital output channel (1-8)."""
-        if not self.__opentest(): return K8055_ERROR
-        return ClearDigitalChannel(Channel)
+        _check_channel(Channel, range(1, 9), "Digital channel")
+        self._io.write_digital_channel(self.__handle(), Channel, 0)
 
     def ClearAllDigital(self):
         """Set all digital output channels to 0."""
-        if not self.__opentest(): return K8055_ERROR
-        return ClearAllDigital()
+        self.WriteAllDigital(0)
 
     def SetDigitalChannel(self, Channel):
         """Set a single digital output channel (1-8)."""
-        if not self.__opentest(): return K8055_ERROR
-        return SetDigitalChannel(Channel)
+        _check_channel(Channel, range(1, 9), "Digital channel")
+        self._io.write_digital_channel(self.__handle(), Channel, 1)
 
     def SetAllDigital(self):
         """Set all digital output channels to 1."""
-        if not self.__opentest(): return K8055_ERROR
-        return SetAllDigital()
+        self.WriteAllDigital(255)
 
-    def ReadDigitalChannel(self, Channel):
-        """Read a single digital input channel (1-5), returns 0 or 1."""
-        if not self.__opentest(): return K8055_ERROR
-        return ReadDigitalChannel(Channel)
+    def ReadDigitalChannel(self, Channel, max_age_ms=None):
+        """Read a single digital input channel (1-5), returns 0 or 1.
+        With max_age_ms, answers from a snapshot at most that old.
+        """
+        _check_channel(Channel, range(1, 6), "Digital input")
+        return (self.__read(max_age_ms).digital >> (Channel - 1)) & 1
 
-    def ReadAllDigital(self):
-        """Read all digital inputs as a bitmask (0-31)."""
-        if not self.__opentest(): return K8055_ERROR
-        return ReadAllDigital()
+    def ReadAllDigital(self, max_age_ms=None):
+        """Read all digital inputs as a bitmask (0-31).
+        With max_age_ms, answers from a snapshot at most that old.
+        """
+        return self.__read(max_age_ms).digital
 
     def ResetCounter(self, CounterNo):
         """Reset an input counter (1 or 2)."""
-        if not self.__opentest(): return K8055_ERROR
-        return ResetCounter(CounterNo)
+        _check_channel(CounterNo, (1, 2), "Counter")
+        self._io.reset_counter(self.__handle(), CounterNo)
 
-    def ReadCounter(self, CounterNo):
-        """Read an input counter (1 or 2)."""
-        if not self.__opentest(): return K8055_ERROR
-        return ReadCounter(CounterNo)
+    def ReadCounter(self, CounterNo, max_age_ms=None):
+        """Read an input counter (1 or 2).
+        With max_age_ms, answers from a snapshot at most that old.
+        """
+        _check_channel(CounterNo, (1, 2), "Counter")
+        return self.__read(max_age_ms)[CounterNo + 2]
 
     def SetCounterDebounceTime(self, CounterNo, DebounceTime):
         """Set debounce time for a counter (1-7450 ms)."""
-        if not self.__opentest(): return K8055_ERROR
-        return SetCounterDebounceTime(CounterNo, DebounceTime)
+        _check_channel(CounterNo, (1, 2), "Counter")
+        self._io.set_counter_debounce(self.__handle(), CounterNo, DebounceTime)
 
     def SetCurrentDevice(self):
-        """Re-asserts the current device context. Usually not needed."""
-        if not self.__opentest(): return K8055_ERROR
+        """Makes this board the target of the module-level (legacy)
+        functions. Not needed for the methods of this class.
+        """
+        self.__handle()
         return SetCurrentDevice(self.Address)
 
     def DeviceAddress(self):
@@ -201,13 +434,95 @@ class k8055:
         """Read all inputs at once.
         Returns a tuple: (digital, analog1, analog2, counter1, counter2)
         """
-        if not self.__opentest(): return K8055_ERROR, K8055_ERROR, K8055_ERROR, K8055_ERROR, K8055_ERROR
-        return ReadAllValues()
+        return tuple(self.__read(None)[:5])
+
+    def ReadSnapshot(self, max_age_ms=0):
+        """Read all inputs with a single USB transfer.
+        Returns a K8055Snapshot named tuple. If the last snapshot is at most
+        max_age_ms old it is returned without touching the bus.
+        """
+        return self.__read(max(0, int(max_age_ms)))
+
+    def SetMaxInputAge(self, max_age_ms):
+        """Let the per-channel readers answer from a snapshot up to
+        max_age_ms old (0 = always read the board, the default).
+        """
+        self._io.set_max_input_age(self.__handle(), max_age_ms)
+
+    def SetRetryPolicy(self, attempts=3, timeout_ms=200):
+        """Try each transfer up to attempts times (1 = fail fast), waiting
+        at most timeout_ms per try. The defaults are the library defaults.
+        """
+        self._io.set_retry_policy(self.__handle(), attempts, timeout_ms)
+
+    def GetStats(self):
+        """Transfer statistics since open or the last ResetStats(): a dict
+        of counters (reads, writes, read_retries, write_retries,
+        read_failures, write_failures, timeouts, id_mismatches) and
+        latency_histogram, where bucket i counts tries faster than
+        LATENCY_BUCKET_LIMITS_US[i] (the last bucket is open-ended).
+        """
+        return self._io.get_stats(self.__handle())
+
+    def ResetStats(self):
+        """Zero the transfer statistics."""
+        self._io.reset_stats(self.__handle())
+
+    def StartStream(self, depth=4):
+        """Stream every input report of the board in the background,
+        keeping depth (1-8) USB transfers in flight. Reports are queued
+        with their arrival time until drained. While streaming,
+        ReadSnapshot() answers from the newest report without a transfer.
+        """
+        self._io.stream_start(self.__handle(), depth)
+        self._streaming = True
+
+    def StopStream(self):
+        """Stop streaming. Reports still queued are discarded."""
+        self._streaming = False
+        self._io.stream_stop(self.__handle())
+
+    def IsStreaming(self):
+        """Returns True while StartStream() is in effect."""
+        return self._streaming
+
+    def DrainStream(self, max_frames=None):
+        """Return the queued reports, oldest first, as a list of
+        K8055Snapshot. Does not wait for new reports.
+        """
+        handle, frames = self.__handle(), []
+        while max_frames is None or len(frames) < max_frames:
+            frame = self._io.stream_read(handle)
+            if frame is None: break
+            frames.append(K8055Snapshot(*frame))
+        return frames
+
+    def StreamFrames(self, poll_interval=0.005):
+        """Iterate over the streamed reports as they arrive.
+        Ends when StopStream() is called; raises K8055Error if the
+        stream dies (e.g. the board is unplugged).
+
+        for frame in k.StreamFrames(): ...
+        """
+        handle = self.__handle()
+        while True:
+            try:
+                frame = self._io.stream_read(handle)
+            except K8055Error:
+                if not self._streaming: return
+                raise
+            if frame is None:
+                time.sleep(poll_interval)
+                continue
+            yield K8055Snapshot(*frame)
+
+    def StreamDropped(self):
+        """Number of reports lost because the queue was full."""
+        return self._io.stream_dropped(self.__handle())
 
     def SetAllValues(self, digitaldata, addata1, addata2):
         """Set all outputs at once."""
-        if not self.__opentest(): return K8055_ERROR
-        return SetAllValues(digitaldata, addata1, addata2)
+        self._io.write_all(self.__handle(), digitaldata, addata1, addata2)
 
     def Version(self):
         """Returns the version string of the C library."""
@@ -58,5 +58,5 @@ setup(
     maintainer='peterpt',
     url='http://github.com/peterpt/',
     ext_modules=[pyk8055_extension],
-    py_modules=['pyk8055']
+    py_modules=['pyk8055', 'k8055sim']
 )
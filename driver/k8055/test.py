@@ -16,12 +16,8 @@ try:
     # --- Step 2: Read all initial values ---
     digital_inputs = k.ReadAllDigital()
     
-    # --- THIS IS THE FIX ---
-    # ReadAllAnalog returns a tuple: (return_code, value1, value2)
-    # We only care about the values, which are at index 1 and 2.
-    analog_values = k.ReadAllAnalog()
-    analog1 = analog_values[1]
-    analog2 = analog_values[2]
+    # ReadAllAnalog returns a tuple: (value1, value2); errors raise K8055Error
+    analog1, analog2 = k.ReadAllAnalog()
     
     counter1 = k.ReadCounter(1)
     counter2 = k.ReadCounter(2)
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# automation_app from the top level; k8055sim (and pyk8055 when built in place) from the wrapper's directory
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'driver', 'k8055', 'pyk8055')]
+# Every board the tests open is simulated
+os.environ['K8055_BACKEND'] = 'sim'
+
+
+@pytest.fixture
+def sim(monkeypatch):
+    """A fresh simulated bus with boards 0 and 1, the one pyk8055 and K8055Controller use."""
+    import k8055sim
+    monkeypatch.setenv('K8055_SIM_BOARDS', '0,1')
+    for name in ('K8055_SIM_LATENCY_MS', 'K8055_SIM_JITTER_MS', 'K8055_SIM_SCRIPT'): monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(k8055sim, '_default_backend', None)
+    return k8055sim.default_backend()
+
+
+@pytest.fixture(scope='session')
+def app():
+    # automation_app needs the built pyk8055 extension and Pillow; without them the tests using it are skipped
+    pytest.importorskip('pyk8055')
+    pytest.importorskip('PIL')
+    import automation_app
+    return automation_app
+
+
+@pytest.fixture
+def controller(sim, app):
+    """A K8055Controller connected to the simulated boards 0 and 1."""
+    controller = app.K8055Controller(lambda message: None)
+    controller.scan_for_boards(quiet=True)
+    yield controller
+    controller.stop_acquisition()
+    for board in controller.boards.values(): board.CloseDevice()
@@ -0,0 +1,174 @@
+import random
+import statistics
+import time
+
+import pytest
+
+
+def feed(stage, samples): return [stage(x) for x in samples]
+
+
+def test_moving_average(app):
+    assert feed(app.MovingAverage(3), [3, 6, 9, 12, 0]) == [3, 4.5, 6, 9, 7]   # The ring wraps at the 4th sample
+    rng = random.Random(1)
+    for window in (1, 2, 5, 64):
+        stage, samples = app.MovingAverage(window), [rng.randint(0, 255) for _ in range(300)]
+        for i, x in enumerate(samples):
+            assert stage(x) == pytest.approx(statistics.mean(samples[max(0, i + 1 - window):i + 1]))
+
+
+def test_moving_median(app):
+    assert feed(app.MovingMedian(3), [5, 1, 9, 7, 3, 3]) == [5, 3, 5, 7, 7, 3]
+    assert feed(app.MovingMedian(4), [1, 5, 3, 9, 7, 7]) == [1, 3, 3, 4, 6, 7]   # Even windows average the middle two
+    rng = random.Random(2)
+    for window in (1, 2, 4, 7, 64):
+        stage, samples = app.MovingMedian(window), [rng.randint(0, 20) for _ in range(300)]   # Many repeated values
+        for i, x in enumerate(samples):
+            assert stage(x) == statistics.median(samples[max(0, i + 1 - window):i + 1])
+
+
+def test_exponential_average(app):
+    assert feed(app.ExponentialAverage(0.5), [10, 0, 0, 20]) == [10, 5, 2.5, 11.25]   # Starts at the first sample
+    key, factory = app.make_filter({'type': 'ema', 'window': 3})
+    assert key == ('ema', 0.5) and factory().alpha == 0.5
+
+
+def test_deadband(app):
+    assert feed(app.Deadband(2), [10, 11, 12, 7, 13, 11, 10.5]) == [10, 10, 10, 7, 13, 13, 10.5]
+
+
+@pytest.mark.parametrize('op, samples, want', [
+    ('>', [100, 101, 95, 91, 90, 95, 101], [0, 1, 1, 1, 0, 0, 1]),     # True above 100, stays true down to 90 exclusive
+    ('<', [100, 99, 105, 109, 110, 105, 99], [0, 1, 1, 1, 0, 0, 1]),   # True below 100, stays true up to 110 exclusive
+    ('==', [47, 50, 53, 54, 52, 50], [0, 1, 1, 0, 0, 1]),              # Equal to enter, then within 50 +/- 3
+])
+def test_hysteresis_band(app, op, samples, want):
+    assert feed(app.HysteresisComparator(op, 100 if op != '==' else 50, 10 if op != '==' else 3), samples) == want
+
+
+def condition_values(engine, samples):
+    # Truth of the engine's only rule for analog input 1 taking each sample in turn
+    rule = engine.compiled_rules[0]; results = []
+    for t, x in enumerate(samples):
+        values = engine.conditioning.update([dict(digital=0, analog1=x, analog2=0, counter1=0, counter2=0, timestamp=float(t))], float(t))
+        results.append(rule.check(0, values))
+    return results
+
+
+def test_rule_keys(app):
+    def engine(**keys):
+        cond = dict({'type': 'analog_in', 'port': 1, 'operator': '>', 'value': 100}, **keys)
+        return app.EngineCore(None, 0, [{'name': 'r', 'conditions': [cond], 'actions': []}], lambda message: None)
+    spike = [90, 90, 200, 90, 90]
+    assert condition_values(engine(), spike) == [False, False, True, False, False]
+    assert condition_values(engine(filter={'type': 'median', 'window': 3}), spike) == [False] * 5
+    assert condition_values(engine(filter={'type': 'moving_average', 'window': 2}), spike) == [False, False, True, True, False]
+    assert condition_values(engine(deadband=5), [98, 103, 101, 102, 104]) == [False, False, False, False, True]
+    assert condition_values(engine(hysteresis=10), [101, 95, 91, 90, 95]) == [True, True, True, False, False]
+    # Identical filters share one stage
+    two = app.EngineCore(None, 0, [{'name': f'r{i}', 'actions': [], 'conditions': [{'type': 'analog_in', 'port': 1, 'operator': '>', 'value': 100 + i,
+                                                                                     'filter': {'type': 'ema', 'alpha': 0.5}}]} for i in range(2)], lambda message: None)
+    assert len(two.conditioning) == two.conditioning.raw_count + 1
+
+
+@pytest.mark.parametrize('keys', [
+    {'filter': {'type': 'ema', 'window': -1}}, {'filter': {'type': 'ema', 'window': 0}}, {'filter': {'type': 'ema', 'window': '8'}},
+    {'filter': {'type': 'ema', 'window': 65}}, {'filter': {'type': 'ema'}}, {'filter': {'type': 'ema', 'alpha': 0}},
+    {'filter': {'type': 'ema', 'alpha': '0.5'}}, {'filter': {'type': 'median', 'window': 0}}, {'filter': {'type': 'moving_average', 'window': 2.5}},
+    {'filter': {'type': 'moving_average', 'window': True}}, {'filter': {'type': 'kalman'}}, {'filter': 'median'},
+    {'deadband': -1}, {'hysteresis': -1},
+])
+def test_bad_specs_are_skipped(app, keys):
+    logs = []
+    rules = [{'name': 'bad', 'conditions': [dict({'type': 'analog_in', 'port': 1, 'operator': '>', 'value': 100}, **keys)], 'actions': []},
+             {'name': 'good', 'conditions': [{'type': 'analog_in', 'port': 1, 'operator': '>', 'value': 100}], 'actions': []}]
+    engine = app.EngineCore(None, 0, rules, logs.append)
+    assert [rule.name for rule in engine.compiled_rules] == ['good']
+    assert len(logs) == 1 and "Rule 'bad' is invalid and was skipped" in logs[0]
+
+
+def test_noise_inside_the_deadband_is_quiet(sim, app, controller):
+    # A noisy input whose conditioned value holds still re-evaluates no rule, writes nothing and logs nothing
+    logs = []
+    rules = [{'name': 'A1 > 100', 'conditions': [{'type': 'analog_in', 'port': 1, 'operator': '>', 'value': 100, 'deadband': 4}],
+              'actions': [{'type': 'digital_out', 'action_type': 'set_state', 'output': 1, 'state': 1}]}]
+    engine = app.AutomationEngine(controller, 0, rules, logs.append)
+    board = sim.board(0); board.set_inputs(analog1=102)
+    assert engine.scan_once() and board.digital_outputs == 1
+    packets, lines = board.packets_out, len(logs)
+    rng = random.Random(4)
+    for _ in range(200):
+        board.set_inputs(analog1=rng.randint(98, 106))
+        assert engine.scan_once()
+    assert (board.packets_out, len(logs), board.digital_outputs) == (packets, lines, 1)
+    board.set_inputs(analog1=97)   # Out of the band: the rule falls
+    assert engine.scan_once() and board.digital_outputs == 0 and board.packets_out == packets + 1
+
+
+def test_counter_wraps_at_16_bits(app):
+    extend = app.CounterExtender()
+    assert [extend(raw, 0) for raw in (0xFFF0, 0xFFFF, 0, 5, 0x9000, 3)] == [0xFFF0, 0xFFFF, 0x10000, 0x10005, 0x19000, 0x20003]
+
+
+def test_counter_reset(app):
+    # A reset made by the app, even from above half the range, is counted from 0 and never as a wrap
+    extend = app.CounterExtender()
+    assert [extend(raw, resets) for raw, resets in ((0x9000, 0), (5, 1), (9, 1), (2, 3), (0xFFFF, 3), (1, 3))] == [0x9000, 0x9005, 0x9009, 0x900B, 0x19008, 0x1900A]
+
+
+def test_counter_rate(app):
+    rate = app.CounterRate(1.0, 1)
+    assert rate(0, 10.0) == 0.0 and rate(0, 10.0) == 0.0   # t == t0: no rate yet
+    # Irregular timestamps; the rate is taken from the last sample at or before the window start
+    samples = [(3, 10.3, 10.0), (5, 10.5, 10.0), (12, 11.2, 10.0), (20, 11.6, 15 / 1.1), (20, 11.6, 15 / 1.1), (21, 13.0, 1 / 1.4)]
+    for total, t, want in samples: assert rate(total, t) == pytest.approx(want)
+    assert len(rate.samples) == 2
+
+
+def counter_engine(app, **cond):
+    cond = dict({'type': 'counter', 'port': 2, 'operator': '>', 'value': 0}, **cond)
+    return app.EngineCore(None, 0, [{'name': 'r', 'conditions': [cond], 'actions': []}], lambda message: None)
+
+
+def counter_values(engine, readings):
+    # The value the engine's only counter condition compares, for (counter2, timestamp) readings
+    index = engine.compiled_rules[0].reads_analog[0]
+    return [engine.conditioning.update([dict(digital=0, analog1=0, analog2=0, counter1=0, counter2=raw, timestamp=t)], t)[index] for raw, t in readings]
+
+
+def test_counter_conditions(app):
+    readings = [(0xFFFE, 0.0), (3, 0.5), (13, 1.0), (23, 1.5)]
+    assert counter_values(counter_engine(app), readings) == [0xFFFE, 0x10003, 0x1000D, 0x10017]
+    assert counter_values(counter_engine(app, scale=0.5), readings) == [0x7FFF, 0x10003 / 2, 0x1000D / 2, 0x10017 / 2]
+    assert counter_values(counter_engine(app, measure='frequency'), readings) == pytest.approx([0, 10, 15, 20])
+    assert counter_values(counter_engine(app, measure='rate', window=0.5), readings) == pytest.approx([0, 600, 1200, 1200])
+    assert counter_values(counter_engine(app, measure='frequency', scale=2, window=0.5), readings) == pytest.approx([0, 20, 40, 40])
+
+
+def test_counter_total_carries_over_a_rule_swap(app):
+    engine = counter_engine(app)
+    counter_values(engine, [(0xFFFF, 0.0), (1, 0.1)])
+    engine.load_rules(engine.rules + [{'name': 'rate', 'conditions': [{'type': 'counter', 'port': 2, 'measure': 'rate', 'operator': '>', 'value': 0}], 'actions': []}])
+    assert counter_values(engine, [(4, 0.2)]) == [0x10004]
+
+
+def test_counter_rules_end_to_end(sim, app, controller):
+    # 20 pulses a second on counter 1 for 1.5 s, then none; the frequency rule follows, the total survives a reset
+    rules = [{'name': 'over 10 Hz', 'conditions': [{'type': 'counter', 'port': 1, 'measure': 'frequency', 'window': 0.5, 'operator': '>', 'value': 10}],
+              'actions': [{'type': 'digital_out', 'action_type': 'set_state', 'output': 1, 'state': 1}]},
+             {'name': 'over 40 pulses', 'conditions': [{'type': 'counter', 'port': 1, 'operator': '>', 'value': 0xFFF0 + 40}],
+              'actions': [{'type': 'digital_out', 'action_type': 'set_state', 'output': 2, 'state': 1}]}]
+    engine = app.AutomationEngine(controller, 0, rules, lambda message: None)
+    board = sim.board(0); board.set_inputs(counter1=0xFFF0)   # Wraps while pulsing
+    board.load_script([[0.05 * i, {'pulses1': 1}] for i in range(1, 31)])
+    outputs = []
+    for _ in range(110):
+        assert engine.scan_once(); outputs.append(board.digital_outputs); time.sleep(0.02)
+    total = next(stage for _, _, stage in engine.conditioning._stages if isinstance(stage, app.CounterExtender))
+    assert total.total == 0xFFF0 + 30 and board.counters[0] == 14
+    assert 1 in outputs and outputs[-1] == 0   # On while pulsing, off once the pulses stop
+    assert controller.reset_counter(0, 1) and board.counters[0] == 0
+    board.pulse(1, 5)
+    assert engine.scan_once() and total.total == 0xFFF0 + 35 and board.digital_outputs == 0   # No phantom pulses, no rate spike
+    board.pulse(1, 6)
+    assert engine.scan_once() and board.digital_outputs & 0b10   # Over 40 pulses
@@ -0,0 +1,244 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import k8055sim
+
+RULES = [
+    {'name': 'I1 -> O3', 'conditions_logic': 'AND', 'conditions': [{'type': 'digital_in', 'port': 1, 'state': 1}],
+     'actions': [{'type': 'digital_out', 'action_type': 'set_state', 'output': 3, 'state': 1}], 'delayed_actions': []},
+    {'name': 'A1 > 200 -> DAC2', 'conditions_logic': 'AND', 'conditions': [{'type': 'analog_in', 'port': 1, 'operator': '>', 'value': 200}],
+     'actions': [{'type': 'analog_out', 'output': 2, 'value': 99}], 'delayed_actions': []},
+]
+
+
+def test_importable_without_the_extension():
+    # With _pyk8055 (and so pyk8055) unavailable the simulator still opens, reads and writes boards
+    code = ("import sys; sys.modules['pyk8055'] = None; sys.modules['_pyk8055'] = None\n"
+            "import k8055sim\n"
+            "bus = k8055sim.SimBackend((2,)); h = bus.open(2); bus.board(2).set_inputs(digital=3, analog1=7)\n"
+            "bus.write_all(h, 0x81, 1, 2); print(bus.read_snapshot(h, 0)[:3], bus.board(2).digital_outputs)\n"
+            "bus.board(2).fail_next_transfers(3)\n"
+            "try: bus.read_snapshot(h, 0)\n"
+            "except k8055sim.K8055Error as e: print(isinstance(e, IOError))\n")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split('\n')[:2] == ['(3, 7, 0) 129', 'True']
+
+
+def test_backend_scripted_inputs():
+    bus = k8055sim.SimBackend((0,))
+    handle = bus.open(0)
+    bus.board(0).load_script([[0, {'digital': 0b10101, 'analog1': 12, 'counter2': 65535}], [0, {'pulses2': 2}], [3600, {'digital': 0}]])
+    digital, analog1, analog2, counter1, counter2, _ = bus.read_snapshot(handle, 0)
+    assert (digital, analog1, analog2, counter1, counter2) == (0b10101, 12, 0, 0, 1)   # The counter wraps at 16 bits
+    bus.close(handle)
+
+
+def test_backend_retries_and_failures():
+    bus = k8055sim.SimBackend((0,))
+    handle = bus.open(0)
+    bus.set_retry_policy(handle, 3, 5)
+    bus.reset_stats(handle)
+    bus.board(0).fail_next_transfers(2)
+    bus.read_snapshot(handle, 0)
+    stats = bus.get_stats(handle)
+    assert (stats['reads'], stats['read_retries'], stats['timeouts'], stats['read_failures']) == (1, 2, 2, 0)
+    bus.board(0).fail_next_transfers(3)
+    with pytest.raises(k8055sim.K8055Error):
+        bus.write_all(handle, 1, 0, 0)
+    assert bus.get_stats(handle)['write_failures'] == 1
+    bus.close(handle)
+
+
+def test_backend_stream_ends_after_failed_transfers():
+    bus = k8055sim.SimBackend((0,))
+    handle = bus.open(0)
+    bus.set_retry_policy(handle, 3, 5)
+    bus.stream_start(handle, 1)
+    def next_frame():
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            frame = bus.stream_read(handle)
+            if frame is not None: return frame
+            time.sleep(0.005)
+    assert next_frame() is not None
+    # Transfers failing in a row end the stream instead of being retried forever
+    bus.board(0).fail_next_transfers(k8055sim.STREAM_MAX_ERRORS)
+    with pytest.raises(k8055sim.K8055Error):
+        while next_frame() is not None: pass
+    # Reads fall back to a transfer of their own, and the stream can be started again
+    bus.board(0).set_inputs(digital=0b10101)
+    assert bus.read_snapshot(handle, 0)[0] == 0b10101
+    bus.stream_start(handle, 1)
+    assert next_frame()[0] == 0b10101
+    bus.stream_stop(handle)
+    bus.close(handle)
+
+
+def test_backend_shares_an_open_board():
+    bus = k8055sim.SimBackend((0,))
+    first, second = bus.open(0), bus.open(0)
+    bus.close(first)
+    bus.read_snapshot(second, 0)   # Still open for the second user
+    bus.close(second)
+    with pytest.raises(k8055sim.K8055Error):
+        bus.read_snapshot(second, 0)
+
+
+def test_controller_reads_and_writes(sim, controller):
+    assert controller.get_connected_board_ids() == [0, 1]
+    sim.board(1).set_inputs(digital=0b00110, analog1=40, analog2=50, counter1=7)
+    inputs = controller.read_all_inputs(1)
+    assert (inputs['digital'], inputs['analog1'], inputs['analog2'], inputs['counter1']) == (0b00110, 40, 50, 7)
+    assert controller.snapshot(1).inputs is inputs
+    controller.set_digital_channel(1, 8, True); controller.set_analog_channel(1, 1, 77)
+    assert controller.flush_outputs(1)
+    assert (sim.board(1).digital_outputs, sim.board(1).analog_outputs) == (0x80, [77, 0])
+    assert not controller.flush_outputs(1)   # Nothing changed, nothing written
+
+
+def test_controller_survives_failed_transfers(sim, controller):
+    sim.board(0).fail_next_transfers(3)
+    assert controller.read_all_inputs(0) is None
+    assert controller.snapshot(0).inputs is None
+    assert controller.read_all_inputs(0) is not None
+
+
+def test_controller_drops_the_snapshot_of_a_disconnected_board(sim, controller):
+    # A read still in flight when its board is unplugged must not publish a snapshot after the board is gone
+    sim.board(1).latency_ms = 200
+    reader = threading.Thread(target=controller.read_all_inputs, args=(1,)); reader.start()
+    time.sleep(0.05)
+    sim.unplug(1); controller.scan_for_boards(quiet=True)
+    reader.join()
+    assert controller.get_connected_board_ids() == [0] and controller.snapshot(1) is None
+    assert controller.read_all_inputs(1) is None and controller.snapshot(1) is None
+
+
+def test_engine_scans(sim, app, controller):
+    engine = app.AutomationEngine(controller, 0, RULES, lambda message: None)
+    board = sim.board(0)
+    for digital, analog1, want in ((0, 0, (0, [0, 0])), (1, 0, (0x04, [0, 0])), (1, 250, (0x04, [0, 99])), (0, 250, (0, [0, 99]))):
+        board.set_inputs(digital=digital, analog1=analog1)
+        assert engine.scan_once()
+        assert (board.digital_outputs, board.analog_outputs) == want
+
+
+def test_engine_stops_on_a_failed_read(sim, app, controller):
+    logs = []
+    engine = app.AutomationEngine(controller, 0, RULES, logs.append)
+    assert engine.scan_once()
+    sim.board(0).fail_next_transfers(3)
+    assert not engine.scan_once()
+    assert any('Read failed for board 0' in line for line in logs)
+
+
+def test_async_engine_scans(sim, app, controller):
+    # The coroutine engine on an event loop: single scans first, then its own cycle until stop()
+    logs = []
+    engine = app.AsyncAutomationEngine(controller, [0, 1], RULES, logs.append, scan_period_s=0.01)
+    board = sim.board(0)
+    async def main():
+        for digital, analog1, want in ((1, 0, (0x04, [0, 0])), (1, 250, (0x04, [0, 99])), (0, 0, (0, [0, 99]))):
+            board.set_inputs(digital=digital, analog1=analog1)
+            assert await engine.scan_once()
+            assert (board.digital_outputs, board.analog_outputs) == want
+        run = asyncio.ensure_future(engine.run())
+        board.set_inputs(digital=1)
+        while engine.stats.snapshot()['cycles'] < 5: await asyncio.sleep(0.01)
+        assert board.digital_outputs == 0x04 and engine.is_alive()
+        engine.stop(); await asyncio.wait_for(run, 5)
+    asyncio.run(main())
+    assert not engine.is_alive() and (board.digital_outputs, board.analog_outputs) == (0, [0, 0])   # Reset on stop
+    assert any('Automation Engine STOPPED' in line for line in logs)
+
+
+def test_engine_releases_overrides(sim, app, controller):
+    engine = app.AutomationEngine(controller, 0, RULES, lambda message: None)
+    board = sim.board(0)
+    board.set_inputs(digital=1, analog1=250)
+    assert engine.scan_once() and (board.digital_outputs, board.analog_outputs) == (0x04, [0, 99])
+    for kind, channel, value in (('analog', 1, 50), ('analog', 2, 10), ('digital', 3, 0), ('digital', 8, 1)): engine.force_output(0, kind, channel, value)
+    engine._poll_commands()
+    assert engine.scan_once() and (board.digital_outputs, board.analog_outputs) == (0x80, [50, 10])
+    for kind, channel in (('analog', 1), ('analog', 2), ('digital', 3), ('digital', 8)): engine.force_output(0, kind, channel, None)
+    engine._poll_commands()
+    assert engine.scan_once() and (board.digital_outputs, board.analog_outputs) == (0x04, [0, 99])   # Back to what the rules set
+
+
+TWO_BOARD_RULES = [
+    {'name': 'I1 -> O1', 'conditions': [{'type': 'digital_in', 'port': 1, 'state': 1}],
+     'actions': [{'type': 'digital_out', 'action_type': 'set_state', 'output': 1, 'state': 1}]},
+    {'name': 'board 1 I1 -> O2', 'board': 1, 'conditions': [{'type': 'digital_in', 'port': 1, 'state': 1}],
+     'actions': [{'type': 'digital_out', 'action_type': 'set_state', 'output': 2, 'state': 1}]},
+    {'name': 'board 1 I2 -> board 0 O3', 'conditions': [{'ref': 'board:1/digital_in:2', 'state': 1}],
+     'actions': [{'type': 'digital_out', 'action_type': 'set_state', 'output': 3, 'state': 1}]},
+]
+
+
+def test_engine_scans_on_without_a_failed_board(sim, app, controller):
+    # A board whose read fails goes offline with the rules using it; the other board keeps its rules and outputs
+    logs = []
+    engine = app.AutomationEngine(controller, [0, 1], TWO_BOARD_RULES, logs.append)
+    sim.board(0).set_inputs(digital=0b1); sim.board(1).set_inputs(digital=0b11)
+    assert engine.scan_once()
+    assert (sim.board(0).digital_outputs, sim.board(1).digital_outputs) == (0b101, 0b10)
+    sim.board(1).fail_next_transfers(3)
+    assert engine.scan_once()
+    assert engine.suspended_rules == {1, 2} and [rule.name for rule in engine.compiled_rules] == ['I1 -> O1']
+    assert any('Read failed for board 1. Board 1 is offline' in line and '2 rules suspended' in line for line in logs)
+    sim.board(0).set_inputs(digital=0)
+    assert engine.scan_once()
+    assert (sim.board(0).digital_outputs, sim.board(1).digital_outputs) == (0b100, 0b10)   # Board 1 is left as it was
+    sim.board(0).set_inputs(digital=1); sim.board(1).set_inputs(digital=0b01)
+    assert engine.scan_once()   # Board 1 reads again
+    assert engine.suspended_rules == set() and any('Board 1 is back online' in line for line in logs)
+    assert (sim.board(0).digital_outputs, sim.board(1).digital_outputs) == (0b001, 0b10)
+
+
+def test_engine_scans_on_without_a_lost_board(sim, app, controller):
+    logs = []
+    engine = app.AutomationEngine(controller, [0, 1], TWO_BOARD_RULES, logs.append)
+    sim.board(0).set_inputs(digital=1)
+    assert engine.scan_once()
+    sim.unplug(1); controller.scan_for_boards(quiet=True)
+    assert engine.scan_once() and engine.suspended_rules == {1, 2}
+    assert any('Connection to board 1 lost. Board 1 is offline' in line for line in logs)
+    sim.board(0).set_inputs(digital=0)
+    assert engine.scan_once() and sim.board(0).digital_outputs == 0
+    sim.unplug(0); controller.scan_for_boards(quiet=True)
+    assert not engine.scan_once()   # No board left
+    assert any('Connection to board 0 lost. Shutting down engine.' in line for line in logs)
+
+
+def test_board_dropout_leaves_the_other_boards_state(sim, app, controller):
+    # Board 1 going offline and coming back changes nothing for board 0's rules: its hysteresis holds inside the band,
+    # its counter total carries on and a rising edge in the same scan still fires
+    rules = [{'name': 'A1 > 100', 'conditions': [{'type': 'analog_in', 'port': 1, 'operator': '>', 'value': 100, 'hysteresis': 20}],
+              'actions': [{'type': 'digital_out', 'action_type': 'set_state', 'output': 1, 'state': 1}]},
+             {'name': 'count > 3', 'conditions': [{'type': 'counter', 'port': 1, 'measure': 'count', 'operator': '>', 'value': 3}],
+              'actions': [{'type': 'digital_out', 'action_type': 'set_state', 'output': 2, 'state': 1}]},
+             {'name': 'I1 edge', 'conditions': [{'type': 'digital_in', 'port': 1, 'state': 1}], 'actions': []}] + TWO_BOARD_RULES[1:]
+    logs = []
+    engine = app.AutomationEngine(controller, [0, 1], rules, logs.append)
+    board = sim.board(0)
+    board.set_inputs(analog1=110); board.pulse(1, 2)
+    assert engine.scan_once()
+    board.set_inputs(analog1=90); board.pulse(1)
+    assert engine.scan_once() and board.digital_outputs == 0b01   # Held inside the band; count 3
+    conditioning = engine.conditioning
+    stages = {type(stage).__name__: stage for _, _, stage in conditioning._stages}
+    sim.board(1).fail_next_transfers(3); board.set_inputs(digital=1)
+    assert engine.scan_once() and engine.suspended_rules == {3, 4}
+    assert engine.conditioning is conditioning and stages['HysteresisComparator'].state == 1 and stages['CounterExtender'].total == 3
+    assert board.digital_outputs == 0b01 and "RULE TRIGGERED (Rising Edge): 'I1 edge'" in logs[-1]
+    board.pulse(1)
+    assert engine.scan_once() and not engine.suspended_rules   # Board 1 is back
+    assert engine.conditioning is conditioning and board.digital_outputs == 0b11 and stages['CounterExtender'].total == 4
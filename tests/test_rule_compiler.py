@@ -0,0 +1,183 @@
+import itertools
+import random
+
+import pytest
+
+# The rule semantics the compiler must keep: the interpreter the engine ran before rules were compiled, extended
+# to conditions and actions that address another board. state maps a board to its digital inputs, analog inputs and
+# digital outputs; digital outputs and latches hold 8 bits per board, analog outputs 2 values per board.
+
+
+def reference_address(item, rule_board, port_key):
+    if 'ref' in item:
+        board, io = item['ref'].split('/')
+        io_type, port = io.split(':')
+        return int(board.split(':')[1]), io_type, int(port)
+    return item.get('board', rule_board), item.get('type', ''), item.get(port_key)
+
+
+def reference_check(rule, state):
+    results = []
+    for cond in rule.get('conditions', []):
+        board, cond_type, port = reference_address(cond, rule.get('board', 0), 'port')
+        inputs = state[board]
+        if cond_type == 'digital_in': results.append(((inputs['digital'] >> (port - 1)) & 1) == cond['state'])
+        elif cond_type == 'analog_in':
+            val, op = inputs[f'analog{port}'], cond['operator']
+            if op == '>': results.append(val > cond['value'])
+            elif op == '<': results.append(val < cond['value'])
+            elif op == '==': results.append(val == cond['value'])
+        elif cond_type == 'digital_out': results.append(((inputs['digital_out'] >> (port - 1)) & 1) == cond['state'])
+    if not results: return False
+    return any(results) if rule.get('conditions_logic', 'AND').upper() == 'OR' else all(results)
+
+
+def reference_apply(rule, d_out, analog, latched):
+    for action in rule.get('actions', []):
+        board, action_type, output = reference_address(action, rule.get('board', 0), 'output')
+        mode = action.get('action_type', 'set_state')
+        if action_type == 'digital_out':
+            bit = 1 << (board * 8 + output - 1)
+            if mode == 'set_state':
+                if action['state'] == 1: d_out |= bit
+                else: d_out &= ~bit; latched &= ~bit
+            elif mode == 'latch_on': latched |= bit
+        elif action_type == 'analog_out': analog[board * 2 + (0 if output == 1 else 1)] = action['value']
+    return d_out, latched
+
+
+def random_io(rng, boards, kinds, port_key):
+    kind = rng.choice(kinds)
+    port = rng.randint(1, {'digital_in': 5, 'digital_out': 8, 'analog_in': 2, 'analog_out': 2}[kind])
+    item, board = {}, rng.choice(boards)
+    if len(boards) > 1 and rng.random() < 0.3: return {'ref': f'board:{board}/{kind}:{port}'}
+    if len(boards) > 1 and rng.random() < 0.3: item['board'] = board
+    item.update({'type': kind, port_key: port})
+    return item
+
+
+def random_rule(rng, boards):
+    conditions = []
+    for _ in range(rng.randint(0, 4)):
+        cond = random_io(rng, boards, ('digital_in', 'digital_out', 'analog_in'), 'port')
+        io_type = cond.get('type') or cond['ref'].split('/')[1].split(':')[0]
+        if io_type == 'analog_in': cond.update(operator=rng.choice(('>', '<', '==', '==', '>=')), value=rng.randint(0, 255))
+        else: cond['state'] = rng.choice((0, 1, 1, 0, 2))
+        conditions.append(cond)
+    actions = []
+    for _ in range(rng.randint(1, 3)):
+        action = random_io(rng, boards, ('digital_out', 'digital_out', 'analog_out'), 'output')
+        io_type = action.get('type') or action['ref'].split('/')[1].split(':')[0]
+        if io_type == 'analog_out': action['value'] = rng.randint(0, 255)
+        else:
+            action['action_type'] = rng.choice(('set_state', 'set_state', 'latch_on', 'blink'))
+            action.update(state=rng.randint(0, 1), duration=1.0, interval=0.1)
+        actions.append(action)
+    rule = {'name': 'random', 'conditions_logic': rng.choice(('AND', 'OR', 'or')), 'conditions': conditions, 'actions': actions, 'delayed_actions': []}
+    if len(boards) > 1 and rng.random() < 0.2: rule['board'] = rng.choice(boards)
+    return rule
+
+
+def scan_inputs(engine, state):
+    # (word, values) the compiled checks get for a state, as EngineCore._evaluate() builds them
+    word = 0
+    for slot, board in enumerate(engine.board_ids):
+        word |= (state[board]['digital'] | state[board]['digital_out'] << 5) << slot * 13
+    states = [dict(state[board], counter1=0, counter2=0, timestamp=1.0) for board in engine.board_ids]
+    return word, engine.conditioning.update(states, 1.0)
+
+
+def assert_same(engine, rules, state, rng):
+    word, values = scan_inputs(engine, state)
+    for compiled in engine.compiled_rules:
+        rule = rules[compiled.id]
+        assert compiled.check(word, values) == reference_check(rule, state), (rule, state)
+        d_out, latched, analog = rng.randrange(1 << 16), rng.randrange(1 << 16), [rng.randint(0, 255) for _ in range(4)]
+        want_analog = list(analog); want = reference_apply(rule, d_out, want_analog, latched)
+        engine.latched_outputs = latched
+        assert (compiled.apply(d_out, analog), engine.latched_outputs, analog) == want + (want_analog,), rule
+
+
+def make_engine(app, board_ids, rules):
+    return app.EngineCore(None, board_ids, rules, lambda message: None)
+
+
+def test_single_board_exhaustive(app):
+    # Every digital input and output combination, with analog inputs on and around each threshold
+    rng = random.Random(11)
+    rules = [random_rule(rng, [0]) for _ in range(60)]
+    engine = make_engine(app, 0, rules)
+    assert len(engine.compiled_rules) == len(rules)
+    thresholds = sorted({c['value'] + d for r in rules for c in r['conditions'] if 'value' in c for d in (-1, 0, 1)} | {0, 255})
+    analog = itertools.cycle(itertools.product(thresholds, repeat=2))
+    for digital, digital_out in itertools.product(range(32), range(256)):
+        analog1, analog2 = next(analog)
+        assert_same(engine, rules, {0: {'digital': digital, 'digital_out': digital_out, 'analog1': analog1, 'analog2': analog2}}, rng)
+
+
+def test_cross_board_random(app):
+    rng = random.Random(12)
+    rules = [random_rule(rng, [0, 1]) for _ in range(200)]
+    engine = make_engine(app, [0, 1], rules)
+    assert len(engine.compiled_rules) == len(rules)
+    for _ in range(1500):
+        state = {board: {'digital': rng.randrange(32), 'digital_out': rng.randrange(256), 'analog1': rng.randint(0, 255), 'analog2': rng.randint(0, 255)} for board in (0, 1)}
+        assert_same(engine, rules, state, rng)
+
+
+@pytest.mark.parametrize('logic, digital, want', [('AND', 0b011, True), ('AND', 0b001, False), ('OR', 0b001, True), ('OR', 0b100, False)])
+def test_and_or(app, logic, digital, want):
+    rule = {'name': 'r', 'conditions_logic': logic, 'actions': [],
+            'conditions': [{'type': 'digital_in', 'port': 1, 'state': 1}, {'type': 'digital_in', 'port': 2, 'state': 1}]}
+    engine = make_engine(app, 0, [rule])
+    assert engine.compiled_rules[0].check(*scan_inputs(engine, {0: {'digital': digital, 'digital_out': 0, 'analog1': 0, 'analog2': 0}})) == want
+
+
+@pytest.mark.parametrize('op, value, want', [('>', 99, True), ('>', 100, False), ('<', 101, True), ('<', 100, False), ('==', 100, True), ('==', 101, False), ('>=', 0, False)])
+def test_analog_operators(app, op, value, want):
+    rule = {'name': 'r', 'actions': [], 'conditions': [{'type': 'analog_in', 'port': 2, 'operator': op, 'value': value}]}
+    engine = make_engine(app, 0, [rule])
+    assert engine.compiled_rules[0].check(*scan_inputs(engine, {0: {'digital': 0, 'digital_out': 0, 'analog1': 0, 'analog2': 100}})) == want
+
+
+def test_digital_out_condition(app):
+    rule = {'name': 'r', 'actions': [], 'conditions': [{'type': 'digital_out', 'port': 8, 'state': 1}, {'type': 'digital_out', 'port': 1, 'state': 0}]}
+    engine = make_engine(app, 0, [rule])
+    for digital_out, want in ((0x80, True), (0x81, False), (0x00, False)):
+        assert engine.compiled_rules[0].check(*scan_inputs(engine, {0: {'digital': 0, 'digital_out': digital_out, 'analog1': 0, 'analog2': 0}})) == want
+
+
+def test_set_state_and_latch(app):
+    rules = [{'name': 'latch', 'conditions': [], 'actions': [{'type': 'digital_out', 'action_type': 'latch_on', 'output': 2}]},
+             {'name': 'on', 'conditions': [], 'actions': [{'type': 'digital_out', 'action_type': 'set_state', 'output': 3, 'state': 1}]},
+             {'name': 'off', 'conditions': [], 'actions': [{'type': 'digital_out', 'action_type': 'set_state', 'output': 2, 'state': 0}]}]
+    engine = make_engine(app, 0, rules)
+    latch, on, off = engine.compiled_rules
+    assert latch.apply(0, []) == 0 and engine.latched_outputs == 0b010   # A latch acts through latched_outputs only
+    assert on.apply(0b001, []) == 0b101
+    assert off.apply(0b011, []) == 0b001 and engine.latched_outputs == 0   # set_state 0 also releases the latch
+
+
+def test_cross_board_refs(app):
+    rule = {'name': 'r', 'board': 1, 'conditions_logic': 'AND',
+            'conditions': [{'ref': 'board:0/digital_in:5', 'state': 1}, {'type': 'analog_in', 'port': 1, 'operator': '>', 'value': 10}],
+            'actions': [{'ref': 'board:0/digital_out:1', 'action_type': 'set_state', 'state': 1}, {'type': 'analog_out', 'output': 2, 'value': 42}]}
+    engine = make_engine(app, [0, 1], [rule])
+    compiled = engine.compiled_rules[0]
+    state = {0: {'digital': 0b10000, 'digital_out': 0, 'analog1': 0, 'analog2': 0}, 1: {'digital': 0, 'digital_out': 0, 'analog1': 11, 'analog2': 0}}
+    assert compiled.check(*scan_inputs(engine, state))
+    state[0]['analog1'], state[1]['analog1'] = 11, 10   # The analog condition reads the rule's board, 1
+    assert not compiled.check(*scan_inputs(engine, state))
+    analog = [0] * 4
+    assert compiled.apply(0, analog) == 0x001 and analog == [0, 0, 0, 42]
+
+
+def test_invalid_rules_are_skipped(app):
+    logs = []
+    rules = [{'name': 'bad port', 'conditions': [{'type': 'digital_in', 'port': 6, 'state': 1}], 'actions': []},
+             {'name': 'unscanned board', 'conditions': [{'ref': 'board:3/digital_in:1', 'state': 1}], 'actions': []},
+             {'name': 'disabled', 'enabled': False, 'conditions': [], 'actions': []},
+             {'name': 'good', 'conditions': [{'type': 'digital_in', 'port': 1, 'state': 1}], 'actions': []}]
+    engine = app.EngineCore(None, 0, rules, logs.append)
+    assert [rule.name for rule in engine.compiled_rules] == ['good']
+    assert sum('is invalid and was skipped' in line for line in logs) == 2
@@ -0,0 +1,84 @@
+import random
+
+BOARDS = [0, 2, 3]   # Slots 0, 1 and 2 of the scan word
+
+
+def bit(slot, io_type, port):
+    # Scan-word bit of a digital input or output: 13 bits per board slot, inputs first
+    return 1 << (slot * 13 + (0 if io_type == 'digital_in' else 5) + port - 1)
+
+
+def rule(conditions, logic='AND', **extra):
+    return dict({'name': f'{logic} {conditions}', 'conditions_logic': logic, 'conditions': conditions, 'actions': []}, **extra)
+
+
+def din(board, port, state): return {'ref': f'board:{board}/digital_in:{port}', 'state': state}
+def dout(board, port, state): return {'ref': f'board:{board}/digital_out:{port}', 'state': state}
+
+
+def test_masks_on_a_multi_board_word(app):
+    rules = [rule([din(0, 1, 1), din(2, 5, 0), dout(3, 8, 1)]),
+             rule([din(2, 1, 1), dout(2, 1, 1)], 'OR'),
+             rule([din(3, 3, 1), {'type': 'analog_in', 'port': 1, 'operator': '>', 'value': 5, 'board': 3}])]
+    engine = app.EngineCore(None, BOARDS, rules, lambda message: None)
+    and_rule, or_rule, mixed = engine.compiled_rules
+    assert and_rule.digital_only and and_rule.mask == bit(0, 'digital_in', 1) | bit(1, 'digital_in', 5) | bit(2, 'digital_out', 8)
+    assert and_rule.want == bit(0, 'digital_in', 1) | bit(2, 'digital_out', 8)
+    assert or_rule.digital_only and (or_rule.mask, or_rule.want) == (0, 0)
+    assert or_rule.any_mask == bit(1, 'digital_in', 1) | bit(1, 'digital_out', 1) and or_rule.flip == 0
+    assert not mixed.digital_only and (mixed.mask, mixed.want) == (bit(2, 'digital_in', 3),) * 2
+    assert mixed.reads_bits == bit(2, 'digital_in', 3) and mixed.reads_analog == (4,)   # Analog input 1 of slot 2
+
+
+def test_candidates_match_the_rules(app):
+    # Digital-only rules are candidates exactly when true and need no further check; the others are candidates
+    # whenever their digital part allows, and keep their check
+    rng = random.Random(12)
+    rules = []
+    for _ in range(300):
+        conditions = [rng.choice((din, dout))(rng.choice(BOARDS), rng.randint(1, 5), rng.choice((0, 1))) for _ in range(rng.randint(1, 4))]
+        if rng.random() < 0.3: conditions.append({'type': 'analog_in', 'port': 2, 'operator': '<', 'value': 128, 'board': rng.choice(BOARDS)})
+        rules.append(rule(conditions, rng.choice(('AND', 'OR'))))
+    engine = app.EngineCore(None, BOARDS, rules, lambda message: None)
+    values = engine.conditioning.update([dict(digital=0, analog1=0, analog2=200, counter1=0, counter2=0, timestamp=1.0)] * 3, 1.0)
+    for _ in range(500):
+        word = rng.randrange(1 << 39)
+        candidates = engine._candidates(word)
+        assert [r.pos for r, _ in candidates] == sorted(r.pos for r, _ in candidates)
+        chosen = {r: check for r, check in candidates}
+        for compiled in engine.compiled_rules:
+            true = compiled.check(word, values)
+            if compiled.digital_only:
+                assert (compiled in chosen) == true and chosen.get(compiled) is None
+            elif true:
+                assert chosen[compiled] is compiled.check
+
+
+def test_and_with_contradiction_is_never_a_candidate(app):
+    engine = app.EngineCore(None, BOARDS, [rule([din(2, 4, 1), din(2, 4, 0)])], lambda message: None)
+    compiled = engine.compiled_rules[0]
+    assert compiled.digital_only and compiled.want & ~compiled.mask   # Wants a bit that word & mask never has
+    assert all(not engine._candidates(word) for word in (0, (1 << 39) - 1, bit(1, 'digital_in', 4)))
+
+
+def test_or_with_contradiction_is_always_a_candidate(app):
+    # must_1 & must_0: input 4 of board 2 is either 1 or 0, so the OR rule holds for every word
+    rules = [rule([din(2, 4, 1), din(2, 4, 0), dout(3, 1, 1)], 'OR'),
+             rule([din(2, 4, 1), din(2, 4, 0), {'type': 'analog_in', 'port': 1, 'operator': '>', 'value': 300}], 'OR')]
+    engine = app.EngineCore(None, BOARDS, rules, lambda message: None)
+    rng = random.Random(3)
+    for word in [0, (1 << 39) - 1] + [rng.randrange(1 << 39) for _ in range(200)]:
+        assert [(r.name, check) for r, check in engine._candidates(word)] == [(rules[0]['name'], None), (rules[1]['name'], None)]
+
+
+def test_or_any_mask(app):
+    # OR over a 1 on board 0 and a 0 on board 3: a candidate unless the word has the opposite of both
+    engine = app.EngineCore(None, BOARDS, [rule([din(0, 2, 1), dout(3, 6, 0)], 'OR')], lambda message: None)
+    one, zero = bit(0, 'digital_in', 2), bit(2, 'digital_out', 6)
+    assert [bool(engine._candidates(word)) for word in (0, one, zero, one | zero)] == [True, True, False, True]
+
+
+def test_candidate_cache_is_bounded(app):
+    engine = app.EngineCore(None, BOARDS, [rule([din(0, 1, 1)])], lambda message: None)
+    for word in range(3 * app.CANDIDATE_CACHE_SIZE): engine._candidates(word << 13)
+    assert len(engine._candidate_cache) <= app.CANDIDATE_CACHE_SIZE